@@ -0,0 +1,57 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs the benchmark suite:
+#   python -m benchmarks                               run all cases
+#   python -m benchmarks -k json.decode                run the cases whose names contain json.decode
+#   python -m benchmarks --save benchmarks/baseline.json
+#   python -m benchmarks --compare benchmarks/baseline.json --threshold 0.2
+# With --compare, the exit status is 1 if any metric regressed by more than the threshold.
+
+import argparse
+import sys
+
+from . import runner
+from .cases import iter_cases
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Runs the spce benchmark suite.")
+    parser.add_argument("-k", dest="keyword", default="", help="only run the cases whose names contain this")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per case, the best one is reported")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing run")
+    parser.add_argument("--save", metavar="PATH", help="save the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare the results with a baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change that counts as a regression (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    cases = iter_cases(args.keyword)
+    imports = [(name, statement) for name, statement in runner.IMPORTS if args.keyword in name]
+    results = runner.run(cases, imports, args.repeat, args.min_time,
+                         report=lambda name, result: print(runner.format_result(name, result), flush=True))
+    if args.save:
+        runner.save(args.save, results)
+    if args.compare:
+        regressions = runner.compare(results, runner.load(args.compare), args.threshold)
+        for name, metric, base, value in regressions:
+            print("REGRESSION %s %s: %.6g -> %.6g" % (name, metric, base, value))
+        if regressions:
+            return 1
+        print("no regressions beyond %.0f%%" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs the benchmark cases with pytest-benchmark:
+#   pytest benchmarks/bench_pytest.py --benchmark-autosave
+#   pytest benchmarks/bench_pytest.py --benchmark-compare --benchmark-compare-fail=mean:10%
+
+from contextlib import ExitStack
+
+import pytest
+
+from benchmarks.cases import all_groups
+
+pytest.importorskip("pytest_benchmark")
+
+# case name -> its group
+GROUPS = {name: group for group in all_groups() for name in group.names}
+
+
+@pytest.fixture(scope="module")
+def cases():
+    # Returns the case of a name, or None if it is not available. A group is built when its first case runs,
+    # and freed after the last test of the module.
+    built = {}
+    with ExitStack() as stack:
+        def get(name):
+            if name not in built:
+                group = GROUPS[name]
+                built.update(dict.fromkeys(group.names))
+                built.update((case.name, case) for case in stack.enter_context(group.build()))
+            return built[name]
+
+        yield get
+
+
+@pytest.mark.parametrize("name", list(GROUPS))
+def test_case(benchmark, cases, name):
+    case = cases(name)
+    if case is None:
+        pytest.skip("%s is not available" % name)
+    benchmark.extra_info["events"] = case.events
+    benchmark.extra_info["bytes"] = case.size
+    if case.setup:
+        # the setup runs before each round, which is one call
+        benchmark.pedantic(case.func, setup=case.setup, rounds=100)
+    else:
+        benchmark(case.func)
@@ -0,0 +1,425 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Benchmark cases: event construction, and the Json and Avro codecs for single events and batches
+# at several payload sizes, with text and binary data and with many extension attributes.
+#
+# Case names are /-separated: operation/payload, e.g. json.decode/1k-binary.
+# Each case function does one call, which processes `events` events and `size` encoded bytes;
+# the setup function of a case, if any, is called before each timing run, e.g. to empty a log.
+# The generic avro package codec cases are included if the package is installed.
+#
+# Cases are built in groups, which share their data, and only when a case of the group is selected:
+# the build function of a group is a context manager which yields its cases and frees them on exit.
+
+import io
+import json
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from typing import Iterator
+
+from spce import Avro, CloudEvent, CloudEventFactory, CloudEventTemplate, Json
+
+Case = namedtuple("Case", "name func events size setup")
+Case.__new__.__defaults__ = (None,)
+# build returns a context manager of the cases, named names in order
+Group = namedtuple("Group", "names build")
+
+BATCH_SIZE = 100
+
+ATTRIBUTES = dict(
+    type="OximeterMeasured",
+    source="oximeter/123",
+    id="1000",
+    subject="subject1",
+    dataschema="https://particlemetrics.com/schema",
+    time="2020-09-28T21:33:21Z",
+)
+ATTRIBUTES_NO_TIME = {k: v for k, v in ATTRIBUTES.items() if k != "time"}
+EXTENSIONS = {"external%d" % i: "value%d" % i for i in range(20)}
+PAYLOAD_SIZES = ("16", 16), ("1k", 1024), ("64k", 64 * 1024)
+
+
+def text_data(size: int) -> str:
+    return json.dumps({"spo2": "9" * max(size - 11, 0)})
+
+
+def binary_data(size: int) -> bytes:
+    return bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+
+
+def make_event(data, **extensions) -> CloudEvent:
+    content_type = "application/octet-stream" if isinstance(data, bytes) else "application/json"
+    return CloudEvent(data=data, datacontenttype=content_type, **ATTRIBUTES, **extensions)
+
+
+def mixed_batch() -> list:
+    # events with 1k text and binary data in turn
+    return [make_event(text_data(1024) if i % 2 else binary_data(1024)) for i in range(BATCH_SIZE)]
+
+
+@contextmanager
+def _codec_cases(payload: str, event: CloudEvent) -> Iterator[list]:
+    json_text = Json.encode(event)
+    avro_bytes = Avro.encode(event)
+    json_size = len(json_text.encode())
+    yield [
+        Case("json.encode/%s" % payload, lambda: Json.encode(event), 1, json_size),
+        Case("json.decode/%s" % payload, lambda: Json.decode(json_text), 1, json_size),
+        Case("avro.encode/%s" % payload, lambda: Avro.encode(event), 1, len(avro_bytes)),
+        Case("avro.decode/%s" % payload, lambda: Avro.decode(avro_bytes), 1, len(avro_bytes)),
+    ]
+
+
+@contextmanager
+def _batch_cases(payload: str, batch: list) -> Iterator[list]:
+    json_text = Json.encode(batch)
+    avro_bytes = Avro.encode_many(batch)
+    json_size = len(json_text.encode())
+    count = len(batch)
+    yield [
+        Case("json.encode/%s" % payload, lambda: Json.encode(batch), count, json_size),
+        Case("json.decode/%s" % payload, lambda: Json.decode(json_text), count, json_size),
+        Case("avro.encode_many/%s" % payload, lambda: Avro.encode_many(batch), count, len(avro_bytes)),
+        Case("avro.decode_iter/%s" % payload, lambda: list(Avro.decode_iter(avro_bytes)), count, len(avro_bytes)),
+        # columnar batches, without creating events
+        Case("json.decode_batch/%s" % payload, lambda: Json.decode_batch(json_text), count, json_size),
+        Case("avro.decode_batch/%s" % payload, lambda: Avro.decode_batch(avro_bytes), count, len(avro_bytes)),
+    ]
+
+
+@contextmanager
+def _validation_cases(payload: str, batch: list) -> Iterator[list]:
+    # validating a decoded batch vs. decoding it
+    from spce.validation import Validator
+    json_text = Json.encode(batch)
+    validator = Validator()
+    validator.validate_batch(batch)
+    count = len(batch)
+    yield [
+        Case("validate_batch/%s" % payload, lambda: validator.validate_batch(batch), count, 0),
+        Case("json.decode+validate/%s" % payload, lambda: Json.decode(json_text, validate=True), count,
+             len(json_text.encode())),
+    ]
+
+
+@contextmanager
+def _intern_cases() -> Iterator[list]:
+    # memory per event of small events with and without sharing their attribute strings
+    data = text_data(16)
+    batch = [CloudEvent(data=data, datacontenttype="application/json", **dict(ATTRIBUTES, id=str(1000 + i)))
+             for i in range(BATCH_SIZE)]
+    json_text = Json.encode(batch)
+    avro_bytes = Avro.encode_many(batch)
+    json_size = len(json_text.encode())
+    payload = "batch%d-16" % BATCH_SIZE
+    yield [
+        Case("json.decode/%s" % payload, lambda: Json.decode(json_text), BATCH_SIZE, json_size),
+        Case("json.decode+intern/%s" % payload, lambda: Json.decode(json_text, intern=True), BATCH_SIZE, json_size),
+        Case("avro.decode_iter/%s" % payload, lambda: list(Avro.decode_iter(avro_bytes)), BATCH_SIZE,
+             len(avro_bytes)),
+        Case("avro.decode_iter+intern/%s" % payload, lambda: list(Avro.decode_iter(avro_bytes, intern=True)),
+             BATCH_SIZE, len(avro_bytes)),
+    ]
+
+
+@contextmanager
+def _encoding_cache_cases() -> Iterator[list]:
+    # repeated encodes of the same event, and forwarding decoded events with and without the encoding cache
+    event = make_event(text_data(1024))
+    cached = make_event(text_data(1024)).enable_encoding_cache()
+    json_size = len(Json.encode(event).encode())
+    avro_size = len(Avro.encode(event))
+    data = text_data(16)
+    batch = [CloudEvent(data=data, datacontenttype="application/json", **dict(ATTRIBUTES, id=str(1000 + i)))
+             for i in range(BATCH_SIZE)]
+    json_text = Json.encode(batch)
+    avro_bytes = Avro.encode_many(batch)
+    batch_json_size = len(json_text.encode())
+    payload = "batch%d-16" % BATCH_SIZE
+    yield [
+        Case("json.encode+cached/1k-text", lambda: Json.encode(cached), 1, json_size),
+        Case("avro.encode+cached/1k-text", lambda: Avro.encode(cached), 1, avro_size),
+        Case("json.forward/%s" % payload, lambda: Json.encode(Json.decode(json_text)), BATCH_SIZE, batch_json_size),
+        Case("json.forward+cached/%s" % payload, lambda: Json.encode(Json.decode(json_text, cache_encoding=True)),
+             BATCH_SIZE, batch_json_size),
+        Case("avro.forward/%s" % payload, lambda: Avro.encode_many(Avro.decode_iter(avro_bytes)), BATCH_SIZE,
+             len(avro_bytes)),
+        Case("avro.forward+cached/%s" % payload,
+             lambda: Avro.encode_many(Avro.decode_iter(avro_bytes, cache_encoding=True)), BATCH_SIZE, len(avro_bytes)),
+    ]
+
+
+@contextmanager
+def _compression_cases() -> Iterator[list]:
+    # streaming gzip vs. compressing the whole encoded batch, and small events one by one with and without
+    # a preset dictionary
+    import gzip
+    import zlib
+    from spce.compression import PresetDictionary, compress, decompress
+    data = text_data(16)
+    batch = [CloudEvent(data=data, datacontenttype="application/json", **dict(ATTRIBUTES, id=str(1000 + i)))
+             for i in range(BATCH_SIZE)]
+    json_size = len(Json.encode(batch).encode())
+    compressed = gzip.compress(Json.encode(batch).encode())
+    dictionary = PresetDictionary.train(batch)
+    encoded = [Json.encode(event).encode() for event in batch]
+    encoded_size = sum(len(e) for e in encoded)
+    payload = "batch%d-16" % BATCH_SIZE
+    yield [
+        Case("gzip.encode/%s" % payload, lambda: gzip.compress(Json.encode(batch).encode()), BATCH_SIZE, json_size),
+        Case("gzip.encode+stream/%s" % payload, lambda: b"".join(compress(Json.iter_encode(batch))), BATCH_SIZE,
+             json_size),
+        Case("gzip.decode/%s" % payload, lambda: Json.decode(gzip.decompress(compressed)), BATCH_SIZE,
+             len(compressed)),
+        Case("gzip.decode+stream/%s" % payload, lambda: list(Json.iter_decode(decompress(compressed))), BATCH_SIZE,
+             len(compressed)),
+        Case("zlib.compress/single-16", lambda: [zlib.compress(e) for e in encoded], BATCH_SIZE, encoded_size),
+        Case("zlib.compress+dictionary/single-16", lambda: [dictionary.compress(e) for e in encoded], BATCH_SIZE,
+             encoded_size),
+    ]
+
+
+@contextmanager
+def _log_cases() -> Iterator[list]:
+    # appending to and replaying an event log, and reading an event at an offset through the sparse index
+    import shutil
+    import tempfile
+    from spce.log import EventLog
+    directory = tempfile.mkdtemp()
+    append_path = os.path.join(directory, "append")
+    append_log = read_log = None
+
+    def new_append_log():
+        # each run appends to a new log, so the log doesn't grow from run to run
+        nonlocal append_log
+        if append_log is not None:
+            append_log.close()
+        shutil.rmtree(append_path, True)
+        append_log = EventLog(append_path, retention_bytes=64 * 1024 * 1024)
+
+    try:
+        batch = mixed_batch()
+        size = len(Avro.encode_many(batch))
+        new_append_log()
+        read_log = EventLog(os.path.join(directory, "read"), segment_size=16 * 1024 * 1024)
+        for _ in range(100):
+            read_log.append_many(batch)
+        read_log.flush()
+        middle = read_log.end_offset // 2
+        payload = "batch%d-1k" % BATCH_SIZE
+        yield [
+            Case("log.append_many/%s" % payload, lambda: append_log.append_many(batch), BATCH_SIZE, size,
+                 new_append_log),
+            Case("log.replay/%s" % payload, lambda: list(islice(read_log.replay(middle), BATCH_SIZE)), BATCH_SIZE,
+                 size),
+            Case("log.get/1k", lambda: read_log.get(middle + 17), 1, size // BATCH_SIZE),
+        ]
+    finally:
+        for log in append_log, read_log:
+            if log is not None:
+                log.close()
+        shutil.rmtree(directory, True)
+
+
+@contextmanager
+def _index_cases() -> Iterator[list]:
+    # finding events in a file through an index vs. decoding the whole file
+    import shutil
+    import tempfile
+    from spce.index import EventIndex
+    types = "OximeterMeasured", "HeartRateMeasured", "ThermometerMeasured", "ScaleMeasured"
+    count = 100 * BATCH_SIZE
+    data = text_data(1024)
+    events = [CloudEvent(type=types[i % 4], source="device/%d" % (i % 10), id=str(i), data=data,
+                         time="2020-09-28T%02d:%02d:%02dZ" % (i // 3600 % 24, i // 60 % 60, i % 60))
+              for i in range(count)]
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "events.avro")
+        with open(path, "wb") as f:
+            f.write(Avro.encode_many(events))
+        del events
+        size = os.path.getsize(path)
+        index = EventIndex.build(path, "avro")
+
+        def scan_find():
+            with open(path, "rb") as f:
+                return [e for e in Avro.decode_iter(f) if e.id == "5555" and e.source == "device/5"]
+
+        start, end = "2020-09-28T01:00:00Z", "2020-09-28T01:01:00Z"
+        yield [
+            Case("index.build/avro-%d" % count, lambda: EventIndex.build(path, "avro"), count, size),
+            Case("index.find/avro-%d" % count, lambda: index.find("device/5", "5555"), 1, 0),
+            Case("scan.find/avro-%d" % count, scan_find, 1, 0),
+            Case("index.query/avro-%d" % count, lambda: list(index.query("ScaleMeasured", start, end)), 15, 0),
+        ]
+    finally:
+        shutil.rmtree(directory, True)
+
+
+@contextmanager
+def _construction_cases() -> Iterator[list]:
+    data = text_data(16)
+    yield [
+        Case("create/required", lambda: CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000"), 1, 0),
+        Case("create/all", lambda: CloudEvent(data=data, **ATTRIBUTES), 1, 0),
+        Case("create/ext20", lambda: CloudEvent(data=data, **ATTRIBUTES, **EXTENSIONS), 1, 0),
+        # the decoders' constructor, from_dict adopts the dict so it is copied for each call
+        Case("create/from_dict", lambda: CloudEvent.from_dict(dict(ATTRIBUTES, data=data)), 1, 0),
+        Case("create/from_dict-ext20", lambda: CloudEvent.from_dict(dict(ATTRIBUTES, data=data, **EXTENSIONS)), 1, 0),
+    ]
+
+
+@contextmanager
+def _factory_cases() -> Iterator[list]:
+    # events with generated ids vs. uuid4 ids and the CloudEvent constructor
+    from uuid import uuid4
+    from spce.factory import CoarseClock, UlidIds
+    constants = dict(type="OximeterMeasured", source="oximeter/123", datacontenttype="application/json")
+    template = CloudEventTemplate(**constants)
+    counter = CloudEventFactory(template)
+    ulid = CloudEventFactory(template, ids=UlidIds(), clock=CoarseClock())
+    data = text_data(16)
+    batch_data = [data] * BATCH_SIZE
+    yield [
+        Case("create/uuid4", lambda: CloudEvent(id=str(uuid4()), data=data, **constants), 1, 0),
+        Case("factory.make/counter", lambda: counter.make(data), 1, 0),
+        Case("factory.make/ulid+clock", lambda: ulid.make(data), 1, 0),
+        Case("factory.make_many/counter", lambda: counter.make_many(BATCH_SIZE, batch_data), BATCH_SIZE, 0),
+        Case("factory.make_many/ulid+clock", lambda: ulid.make_many(BATCH_SIZE, batch_data), BATCH_SIZE, 0),
+    ]
+
+
+@contextmanager
+def _template_cases() -> Iterator[list]:
+    # events stamped out of a template vs. creating and encoding CloudEvents
+    constants = dict(type="OximeterMeasured", source="oximeter/123", datacontenttype="application/json",
+                     dataschema="https://particlemetrics.com/schema")
+    template = CloudEventTemplate(**constants)
+    time = ATTRIBUTES["time"]
+    data = text_data(16)
+    json_size = len(template.encode_json("1000", time, data).encode())
+    avro_size = len(template.encode_avro("1000", time, data))
+    yield [
+        Case("template.encode_json/16", lambda: template.encode_json("1000", time, data), 1, json_size),
+        Case("create+json.encode/16", lambda: Json.encode(CloudEvent(id="1000", time=time, data=data, **constants)),
+             1, json_size),
+        Case("template.encode_avro/16", lambda: template.encode_avro("1000", time, data), 1, avro_size),
+        Case("create+avro.encode/16", lambda: Avro.encode(CloudEvent(id="1000", time=time, data=data, **constants)),
+             1, avro_size),
+    ]
+
+
+@contextmanager
+def _time_cases() -> Iterator[list]:
+    # the RFC 3339 parser vs. datetime.strptime, and the cached accessors
+    from spce._rfc3339 import parse_rfc3339
+    text = "2020-09-28T21:33:21.123456+03:00"
+    dt = datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%f%z")
+    event = make_event(text_data(16))
+    yield [
+        Case("time.parse/rfc3339", lambda: parse_rfc3339(text), 1, 0),
+        Case("time.parse/strptime", lambda: datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%f%z"), 1, 0),
+        Case("time.access/uncached", lambda: CloudEvent(time=text, **ATTRIBUTES_NO_TIME).time_epoch_ns, 1, 0),
+        Case("time.access/cached", lambda: event.time_epoch_ns, 1, 0),
+        Case("create/datetime", lambda: CloudEvent(time=dt, **ATTRIBUTES_NO_TIME), 1, 0),
+    ]
+
+
+@contextmanager
+def _generic_avro_cases() -> Iterator[list]:
+    # the generic avro package codec, for comparison with the specialized one
+    try:
+        import avro.io
+    except ImportError:
+        yield []
+        return
+    from spce.avro import _load_avro
+    from spce.cloudevents import _with_constant_names
+    schema = _load_avro()[0]
+    writer = avro.io.DatumWriter(schema)
+    reader = avro.io.DatumReader(schema)
+    event = make_event(text_data(16))
+    encoded = Avro.encode(event)
+
+    def encode():
+        with io.BytesIO() as bio:
+            writer.write({"attribute": event._attributes, "data": event._data}, avro.io.BinaryEncoder(bio))
+            return bio.getvalue()
+
+    def decode():
+        with io.BytesIO(encoded) as f:
+            raw_event = reader.read(avro.io.BinaryDecoder(f))
+            return Avro._make_event(_with_constant_names(raw_event["attribute"]), raw_event["data"])
+
+    assert encode() == encoded
+    yield [
+        Case("avro-generic.encode/16-text", encode, 1, len(encoded)),
+        Case("avro-generic.decode/16-text", decode, 1, len(encoded)),
+    ]
+
+
+def _names(payload: str, *operations) -> tuple:
+    return tuple("%s/%s" % (operation, payload) for operation in operations)
+
+
+def all_groups() -> list:
+    # The groups in the order they run, with the names of their cases, none of them built yet.
+    codec = "json.encode", "json.decode", "avro.encode", "avro.decode"
+    groups = [Group(("create/required", "create/all", "create/ext20", "create/from_dict", "create/from_dict-ext20"),
+                    _construction_cases)]
+    for payload, size in PAYLOAD_SIZES:
+        for kind, make_data in ("text", text_data), ("binary", binary_data):
+            name = "%s-%s" % (payload, kind)
+            groups.append(Group(_names(name, *codec), lambda name=name, make_data=make_data, size=size:
+                                _codec_cases(name, make_event(make_data(size)))))
+    batch = "batch%d-1k" % BATCH_SIZE
+    small = "batch%d-16" % BATCH_SIZE
+    groups += [
+        Group(_names("ext20", *codec), lambda: _codec_cases("ext20", make_event(text_data(16), **EXTENSIONS))),
+        Group(_names(batch, "json.encode", "json.decode", "avro.encode_many", "avro.decode_iter", "json.decode_batch",
+                     "avro.decode_batch"), lambda: _batch_cases(batch, mixed_batch())),
+        Group(_names(batch, "validate_batch", "json.decode+validate"), lambda: _validation_cases(batch, mixed_batch())),
+        Group(_names(small, "json.decode", "json.decode+intern", "avro.decode_iter", "avro.decode_iter+intern"),
+              _intern_cases),
+        Group(_names("1k-text", "json.encode+cached", "avro.encode+cached") +
+              _names(small, "json.forward", "json.forward+cached", "avro.forward", "avro.forward+cached"),
+              _encoding_cache_cases),
+        Group(_names(small, "gzip.encode", "gzip.encode+stream", "gzip.decode", "gzip.decode+stream") +
+              _names("single-16", "zlib.compress", "zlib.compress+dictionary"), _compression_cases),
+        Group(_names(batch, "log.append_many", "log.replay") + ("log.get/1k",), _log_cases),
+        Group(_names("avro-%d" % (100 * BATCH_SIZE), "index.build", "index.find", "scan.find", "index.query"),
+              _index_cases),
+        Group(("template.encode_json/16", "create+json.encode/16", "template.encode_avro/16", "create+avro.encode/16"),
+              _template_cases),
+        Group(("create/uuid4", "factory.make/counter", "factory.make/ulid+clock", "factory.make_many/counter",
+               "factory.make_many/ulid+clock"), _factory_cases),
+        Group(("time.parse/rfc3339", "time.parse/strptime", "time.access/uncached", "time.access/cached",
+               "create/datetime"), _time_cases),
+        Group(_names("16-text", "avro-generic.encode", "avro-generic.decode"), _generic_avro_cases),
+    ]
+    return groups
+
+
+def iter_cases(keyword="") -> Iterator[Case]:
+    # Yields the cases whose names contain keyword. A group is built when its first selected case is due,
+    # and freed after its last one.
+    for group in all_groups():
+        if any(keyword in name for name in group.names):
+            with group.build() as cases:
+                yield from (case for case in cases if keyword in case.name)
@@ -0,0 +1,172 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures benchmark cases with the standard library only, and compares results with a stored baseline.
+#
+# Results map case names to metrics:
+#   events_per_sec, bytes_per_sec: best of `repeat` timing runs
+#   allocs_per_event: memory blocks still allocated per event when the results of the calls are kept,
+#                     i.e. the objects an event costs; temporaries freed during the call are not counted
+#   memory_per_event: bytes still allocated per event when the results of the calls are kept, traced with tracemalloc
+#   seconds: for the cold import cases, the best wall time of importing in a fresh interpreter
+
+import gc
+import json
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+
+IMPORTS = (
+    ("import/spce", "import spce"),
+    ("import/spce-all", "import spce, spce.http, spce.kafka, spce.parallel"),
+)
+
+# metric -> True if larger is better
+METRICS = {
+    "events_per_sec": True,
+    "bytes_per_sec": True,
+    "allocs_per_event": False,
+    "memory_per_event": False,
+    "seconds": False,
+}
+
+# allocation counts are exact, but a change below this many blocks per event is not reported
+_ALLOC_SLACK = 0.5
+
+
+def measure(case, repeat=5, min_time=0.2, alloc_calls=100) -> dict:
+    # the setup of the case is called before each timing run
+    timer = timeit.Timer(case.func, case.setup or "pass")
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    seconds = min(timer.repeat(repeat, number)) / number
+    result = {
+        "events_per_sec": case.events / seconds,
+        "allocs_per_event": count_allocations(case.func, alloc_calls, case.setup) / case.events,
+        "memory_per_event": measure_memory(case.func, alloc_calls, case.setup) / case.events,
+    }
+    if case.size:
+        result["bytes_per_sec"] = case.size / seconds
+    return result
+
+
+def count_allocations(func, calls: int, setup=None) -> float:
+    # Returns the memory blocks allocated per call, keeping the results alive.
+    if setup:
+        setup()
+    results = [None] * calls
+    func()
+    gc.collect()
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        for i in range(calls):
+            results[i] = func()
+        after = sys.getallocatedblocks()
+    finally:
+        gc.enable()
+    return (after - before) / calls
+
+
+def measure_memory(func, calls: int, setup=None) -> float:
+    # Returns the bytes allocated per call, keeping the results alive.
+    if setup:
+        setup()
+    results = [None] * calls
+    func()
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(calls):
+            results[i] = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+        gc.enable()
+    return (after - before) / calls
+
+
+def measure_import(statement: str, repeat=5) -> dict:
+    # Cold import time, measured in a fresh interpreter each time.
+    code = "import time; t = time.perf_counter(); %s; print(time.perf_counter() - t)" % statement
+    times = [float(subprocess.check_output([sys.executable, "-c", code])) for _ in range(repeat)]
+    return {"seconds": min(times)}
+
+
+def run(cases, imports=IMPORTS, repeat=5, min_time=0.2, report=None) -> dict:
+    # cases may be an iterator such as cases.iter_cases, which builds the cases as they are due
+    results = {}
+    for case in cases:
+        results[case.name] = measure(case, repeat, min_time)
+        if report:
+            report(case.name, results[case.name])
+    for name, statement in imports:
+        results[name] = measure_import(statement, repeat)
+        if report:
+            report(name, results[name])
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    # Returns (name, metric, baseline value, current value) for each metric that regressed by more than threshold.
+    regressions = []
+    for name, metrics in sorted(results.items()):
+        base_metrics = baseline.get(name)
+        if not base_metrics:
+            continue
+        for metric, value in metrics.items():
+            base = base_metrics.get(metric)
+            if base is None:
+                continue
+            if METRICS[metric]:
+                regressed = value < base * (1 - threshold)
+            else:
+                regressed = value > base * (1 + threshold)
+                if metric == "allocs_per_event":
+                    regressed = regressed and value - base > _ALLOC_SLACK
+            if regressed:
+                regressions.append((name, metric, base, value))
+    return regressions
+
+
+def save(path, results: dict):
+    doc = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load(path) -> dict:
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def format_result(name: str, result: dict) -> str:
+    if "seconds" in result:
+        return "%-32s %10.1f ms" % (name, result["seconds"] * 1000)
+    text = "%-32s %12.0f events/sec %8.1f allocs/event" % (name, result["events_per_sec"], result["allocs_per_event"])
+    if "memory_per_event" in result:
+        text += " %10.0f B/event" % result["memory_per_event"]
+    if "bytes_per_sec" in result:
+        text += " %10.1f MB/sec" % (result["bytes_per_sec"] / 1e6)
+    return text
@@ -13,8 +13,8 @@
 # limitations under the License.
 
 from .avro import Avro
-from .cloudevents import CloudEvent
-from .json import Json
-
-if Avro is None:
-    del Avro
\ No newline at end of file
+from .batch import CloudEventBatch
+from .cloudevents import CloudEvent, LazyCloudEvent
+from .factory import CloudEventFactory
+from .json import Json, JsonLines
+from .template import CloudEventTemplate
@@ -0,0 +1,480 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Avro binary encoding specialized for the CloudEvent schema (see spce/avro.py).
+#
+# The output is byte-identical to the generic avro.io.DatumWriter with that schema.
+# Note that DatumWriter picks the *last* union branch a value validates against,
+# so booleans are written as "int" in attributes and as "double" in data.
+
+from struct import Struct
+
+__all__ = "encode_long", "write_event", "write_attribute_entries", "write_data", "write_string", "read_event", \
+          "read_attributes", "read_projected_attributes", "read_data", "read_raw_data", "skip_data", "StreamView"
+
+_INT_MIN = -(1 << 31)
+_INT_MAX = (1 << 31) - 1
+
+_DOUBLE = Struct("<d")
+_pack_double = _DOUBLE.pack
+_unpack_double = _DOUBLE.unpack_from
+
+# the encoded attribute names of the spec -> the constant strings of the code,
+# decoded events keep these instead of a new string per event
+_ATTRIBUTE_NAMES = {name.encode(): name for name in
+                    ("type", "source", "id", "specversion", "subject", "datacontenttype", "dataschema", "time")}
+
+# zig-zag varint encodings of small non-negative numbers, mostly lengths.
+_SMALL_LONGS = []
+
+
+def _encode_long(n: int) -> bytes:
+    n = (n << 1) ^ (n >> 63)
+    out = bytearray()
+    while n & ~0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+_SMALL_LONGS.extend(_encode_long(n) for n in range(1024))
+
+
+def _long(n: int) -> bytes:
+    if 0 <= n < 1024:
+        return _SMALL_LONGS[n]
+    return _encode_long(n)
+
+
+encode_long = _long
+
+
+def write_event(out: bytearray, attributes: dict, data):
+    if attributes:
+        out += _long(len(attributes))
+        write_attribute_entries(out, attributes)
+    out += b"\x00"
+    _write_data(out, data)
+
+
+def write_attribute_entries(out: bytearray, attributes: dict):
+    # Writes the entries of the attribute map, without the block count and the terminator.
+    small_longs = _SMALL_LONGS
+    for name, value in attributes.items():
+        if not isinstance(name, str):
+            raise TypeError("Avro.encode cannot encode attribute name %r" % (name,))
+        b = name.encode()
+        n = len(b)
+        out += small_longs[n] if n < 1024 else _encode_long(n)
+        out += b
+        if isinstance(value, str):
+            b = value.encode()
+            n = len(b)
+            out += b"\x06"
+            out += small_longs[n] if n < 1024 else _encode_long(n)
+            out += b
+        elif value is None:
+            out += b"\x00"
+        elif isinstance(value, int) and _INT_MIN <= value <= _INT_MAX:
+            out += b"\x04"
+            out += _encode_long(value)
+        elif isinstance(value, bytes):
+            out += b"\x08"
+            out += _long(len(value))
+            out += value
+        else:
+            raise TypeError("Avro.encode cannot encode attribute %s: %r" % (name, value))
+
+
+def _write_data(out: bytearray, data):
+    if isinstance(data, bytes):
+        out += b"\x00"
+        out += _long(len(data))
+        out += data
+    elif isinstance(data, str):
+        b = data.encode()
+        out += b"\x0c"
+        out += _long(len(b))
+        out += b
+    elif data is None:
+        out += b"\x02"
+    elif isinstance(data, (int, float)):
+        out += b"\x0a"
+        out += _pack_double(data)
+    elif isinstance(data, dict) and all(isinstance(k, str) for k in data):
+        out += b"\x06"
+        _write_map(out, data, _write_data_map_value)
+    elif isinstance(data, list):
+        out += b"\x08"
+        _write_array(out, data)
+    else:
+        raise TypeError("Avro.encode cannot encode data: %r" % (data,))
+
+
+def _write_string(out: bytearray, s: str):
+    b = s.encode()
+    out += _long(len(b))
+    out += b
+
+
+write_data = _write_data
+write_string = _write_string
+
+
+def _write_map(out: bytearray, d: dict, write_value):
+    if d:
+        out += _long(len(d))
+        for key, value in d.items():
+            _write_string(out, key)
+            write_value(out, value)
+    out += b"\x00"
+
+
+def _write_array(out: bytearray, items: list):
+    if items:
+        out += _long(len(items))
+        for item in items:
+            _write_record(out, item)
+    out += b"\x00"
+
+
+def _write_data_map_value(out: bytearray, value):
+    # ["null", "boolean", "CloudEventData", "double", "string"]
+    if isinstance(value, str):
+        out += b"\x08"
+        _write_string(out, value)
+    elif value is None:
+        out += b"\x00"
+    elif isinstance(value, (int, float)):
+        out += b"\x06"
+        out += _pack_double(value)
+    elif isinstance(value, dict):
+        out += b"\x04"
+        _write_record(out, value)
+    else:
+        raise TypeError("Avro.encode cannot encode data: %r" % (value,))
+
+
+def _write_record(out: bytearray, record):
+    # CloudEventData: {"value": map of values}
+    if not isinstance(record, dict) or not record.keys() <= {"value"}:
+        raise TypeError("Avro.encode cannot encode data: %r" % (record,))
+    value = record.get("value")
+    if not isinstance(value, dict) or not all(isinstance(k, str) for k in value):
+        raise TypeError("Avro.encode cannot encode data: %r" % (record,))
+    _write_map(out, value, _write_record_value)
+
+
+def _write_record_value(out: bytearray, value):
+    # ["null", "boolean", {map of CloudEventData}, {array of CloudEventData}, "double", "string"]
+    if isinstance(value, str):
+        out += b"\x0a"
+        _write_string(out, value)
+    elif value is None:
+        out += b"\x00"
+    elif isinstance(value, (int, float)):
+        out += b"\x08"
+        out += _pack_double(value)
+    elif isinstance(value, dict) and all(isinstance(k, str) for k in value):
+        out += b"\x04"
+        _write_map(out, value, _write_record)
+    elif isinstance(value, list):
+        out += b"\x06"
+        _write_array(out, value)
+    else:
+        raise TypeError("Avro.encode cannot encode data: %r" % (value,))
+
+
+# Readers take a buffer (bytes, mmap or StreamView) and a position,
+# and return the decoded value and the position after it.
+# Reading past the end of the buffer raises IndexError.
+
+def _read_long(buf, pos):
+    b = buf[pos]
+    pos += 1
+    n = b & 0x7F
+    shift = 7
+    while b & 0x80:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        shift += 7
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _read_bytes(buf, pos):
+    b = buf[pos]
+    if b < 0x80:
+        n = (b >> 1) ^ -(b & 1)
+        pos += 1
+    else:
+        n, pos = _read_long(buf, pos)
+    if n < 0:
+        raise ValueError("Avro.decode: negative length")
+    end = pos + n
+    value = buf[pos:end]
+    if len(value) != n:
+        raise IndexError("Avro.decode: unexpected end of data")
+    return value, end
+
+
+def _read_string(buf, pos):
+    value, pos = _read_bytes(buf, pos)
+    return value.decode(), pos
+
+
+def _read_block_count(buf, pos):
+    count, pos = _read_long(buf, pos)
+    if count < 0:
+        # the block size follows negative counts
+        count = -count
+        _, pos = _read_long(buf, pos)
+    return count, pos
+
+
+def _read_attributes(buf, pos):
+    attributes = {}
+    read_bytes = _read_bytes
+    names = _ATTRIBUTE_NAMES
+    while True:
+        count, pos = _read_block_count(buf, pos)
+        if count == 0:
+            return attributes, pos
+        for _ in range(count):
+            name, pos = read_bytes(buf, pos)
+            index = buf[pos]
+            pos += 1
+            if index == 6:
+                value, pos = read_bytes(buf, pos)
+                value = value.decode()
+            elif index == 0:
+                value = None
+            elif index == 4:
+                value, pos = _read_long(buf, pos)
+            elif index == 8:
+                value, pos = read_bytes(buf, pos)
+                value = bytes(value)
+            elif index == 2:
+                value = buf[pos] == 1
+                pos += 1
+            else:
+                raise ValueError("Avro.decode: invalid attribute union index: %d" % index)
+            attributes[names.get(name) or name.decode()] = value
+
+
+def _read_attribute_value(buf, pos):
+    index = buf[pos]
+    pos += 1
+    if index == 6:
+        return _read_string(buf, pos)
+    elif index == 0:
+        return None, pos
+    elif index == 4:
+        return _read_long(buf, pos)
+    elif index == 8:
+        value, pos = _read_bytes(buf, pos)
+        return bytes(value), pos
+    elif index == 2:
+        return buf[pos] == 1, pos + 1
+    raise ValueError("Avro.decode: invalid attribute union index: %d" % index)
+
+
+def _read_double(buf, pos):
+    end = pos + 8
+    b = buf[pos:end]
+    if len(b) != 8:
+        raise IndexError("Avro.decode: unexpected end of data")
+    return _unpack_double(b)[0], end
+
+
+def _read_data(buf, pos):
+    index = buf[pos]
+    pos += 1
+    if index == 0:
+        value, pos = _read_bytes(buf, pos)
+        return bytes(value), pos
+    elif index == 12:
+        return _read_string(buf, pos)
+    elif index == 2:
+        return None, pos
+    elif index == 4:
+        return buf[pos] == 1, pos + 1
+    elif index == 6:
+        return _read_map(buf, pos, _read_data_map_value)
+    elif index == 8:
+        return _read_array(buf, pos)
+    elif index == 10:
+        return _read_double(buf, pos)
+    raise ValueError("Avro.decode: invalid data union index: %d" % index)
+
+
+def _read_map(buf, pos, read_value):
+    d = {}
+    while True:
+        count, pos = _read_block_count(buf, pos)
+        if count == 0:
+            return d, pos
+        for _ in range(count):
+            key, pos = _read_string(buf, pos)
+            d[key], pos = read_value(buf, pos)
+
+
+def _read_array(buf, pos):
+    items = []
+    while True:
+        count, pos = _read_block_count(buf, pos)
+        if count == 0:
+            return items, pos
+        for _ in range(count):
+            item, pos = _read_record(buf, pos)
+            items.append(item)
+
+
+def _read_data_map_value(buf, pos):
+    index = buf[pos]
+    pos += 1
+    if index == 8:
+        return _read_string(buf, pos)
+    elif index == 0:
+        return None, pos
+    elif index == 2:
+        return buf[pos] == 1, pos + 1
+    elif index == 4:
+        return _read_record(buf, pos)
+    elif index == 6:
+        return _read_double(buf, pos)
+    raise ValueError("Avro.decode: invalid data union index: %d" % index)
+
+
+def _read_record(buf, pos):
+    value, pos = _read_map(buf, pos, _read_record_value)
+    return {"value": value}, pos
+
+
+def _read_record_value(buf, pos):
+    index = buf[pos]
+    pos += 1
+    if index == 10:
+        return _read_string(buf, pos)
+    elif index == 0:
+        return None, pos
+    elif index == 2:
+        return buf[pos] == 1, pos + 1
+    elif index == 4:
+        return _read_map(buf, pos, _read_record)
+    elif index == 6:
+        return _read_array(buf, pos)
+    elif index == 8:
+        return _read_double(buf, pos)
+    raise ValueError("Avro.decode: invalid data union index: %d" % index)
+
+
+def read_event(buf, pos=0):
+    # Returns (attributes, data, position after the event).
+    attributes, pos = _read_attributes(buf, pos)
+    data, pos = _read_data(buf, pos)
+    return attributes, data, pos
+
+
+read_attributes = _read_attributes
+read_data = _read_data
+
+
+def read_raw_data(buf, pos):
+    # Like read_data, but bytes and string data are returned as they are encoded, a slice of buf.
+    # Returns (union index, value, position after the data).
+    index = buf[pos]
+    if index == 0 or index == 12:
+        value, pos = _read_bytes(buf, pos + 1)
+    else:
+        value, pos = _read_data(buf, pos)
+    return index, value, pos
+
+
+def read_projected_attributes(buf, pos, fields):
+    # Like read_attributes, but only the attributes with a name in fields are decoded.
+    attributes = {}
+    read_bytes = _read_bytes
+    names = _ATTRIBUTE_NAMES
+    while True:
+        count, pos = _read_block_count(buf, pos)
+        if count == 0:
+            return attributes, pos
+        for _ in range(count):
+            name, pos = read_bytes(buf, pos)
+            name = names.get(name) or name.decode()
+            if name in fields:
+                value, pos = _read_attribute_value(buf, pos)
+                attributes[name] = value
+                continue
+            index = buf[pos]
+            if index == 6 or index == 8:
+                n, pos = _read_long(buf, pos + 1)
+                pos += n
+            elif index == 4:
+                _, pos = _read_long(buf, pos + 1)
+            elif index == 0:
+                pos += 1
+            elif index == 2:
+                pos += 2
+            else:
+                raise ValueError("Avro.decode: invalid attribute union index: %d" % index)
+
+
+def skip_data(buf, pos):
+    # Returns the position after the data at pos without decoding it; buf must support len.
+    index = buf[pos]
+    if index == 0 or index == 12:
+        n, pos = _read_long(buf, pos + 1)
+        pos += n
+    elif index == 2:
+        pos += 1
+    elif index == 4:
+        pos += 2
+    elif index == 10:
+        pos += 9
+    else:
+        return _read_data(buf, pos)[1]
+    if pos > len(buf):
+        raise IndexError("Avro.decode: unexpected end of data")
+    return pos
+
+
+class StreamView:
+    # Exposes a binary file object as a buffer for the readers above.
+    # Bytes are read from the file only as the readers ask for them,
+    # so the file is left positioned right after the decoded event.
+
+    __slots__ = "_read", "_buf"
+
+    def __init__(self, file):
+        self._read = file.read
+        self._buf = bytearray()
+
+    def __getitem__(self, item):
+        buf = self._buf
+        if isinstance(item, slice):
+            self._fill(item.stop)
+            return bytes(buf[item])
+        self._fill(item + 1)
+        return buf[item]
+
+    def _fill(self, size):
+        buf = self._buf
+        while len(buf) < size:
+            chunk = self._read(size - len(buf))
+            if not chunk:
+                raise IndexError("Avro.decode: unexpected end of data")
+            buf += chunk
@@ -12,14 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import lru_cache, partial
+from typing import Iterable, Iterator, List, Union
+
+from ._avrobinary import write_event, read_event, read_attributes, read_projected_attributes, read_data, \
+    read_raw_data, skip_data, StreamView
+from .batch import CloudEventBatch, _encode_data, _BINARY, _NO_DATA, _TEXT
+from .cloudevents import CloudEvent, LazyCloudEvent, _adopt, _cache_encoding, _normalize, _with_constant_names
+from .instrument import instrumented_async_encoder, instrumented_async_iter_decoder, instrumented_decoder, \
+    instrumented_encoder, instrumented_iter_decoder, instrumented_iter_encoder
+from .interning import InternTable, get_intern_table
+from .validation import get_validator
 
 __all__ = "Avro",
 
+_CHUNK_SIZE = 64 * 1024
 
-def _make_avro_codec():
-    # CloudEvents Avro schema was taken from: https://raw.githubusercontent.com/cloudevents/spec/v1.0/spec.avsc
-    # (c) CloudEvents contributors.
-    schema_text = '''
+# CloudEvents Avro schema was taken from: https://raw.githubusercontent.com/cloudevents/spec/v1.0/spec.avsc
+# (c) CloudEvents contributors.
+_SCHEMA_TEXT = '''
     {
       "namespace":"io.cloudevents",
       "type":"record",
@@ -83,49 +94,349 @@ def _make_avro_codec():
         }
       ]
     }
-    '''
+'''
+
+
+def _chunk_reader(chunks):
+    # Returns a read function for an iterable of chunks, which ignores the size.
+    # Empty chunks are skipped, so they don't end the stream.
+    chunks = filter(None, chunks)
+
+    def read(size):
+        return next(chunks, b"")
 
+    return read
+
+
+@lru_cache(maxsize=None)
+def _load_avro():
+    # The avro package is only needed for the object container files, and it is imported on first use.
     try:
         import avro.schema
-        from avro.datafile import DataFileWriter
-        from avro.io import DatumWriter, DatumReader, BinaryEncoder, BinaryDecoder
+        from avro.datafile import DataFileReader, DataFileWriter
+        from avro.io import DatumWriter, DatumReader
     except ImportError:
-        return None
+        raise ImportError("Avro object container files require the avro package: pip install spce[avro]")
+    return avro.schema.parse(_SCHEMA_TEXT), DataFileReader, DataFileWriter, DatumReader, DatumWriter
+
+
+class Avro:
+    # Events are encoded with a codec specialized for the CloudEvent schema,
+    # which produces the same bytes as the generic avro package, without depending on it.
+
+    # see spce.instrument
+    observer = None
+
+    @classmethod
+    @instrumented_encoder
+    def encode_to(cls, event: CloudEvent, file):
+        file.write(cls._encode(event))
+
+    @classmethod
+    @instrumented_encoder
+    def encode(cls, event: CloudEvent) -> bytes:
+        return cls._encode(event)
+
+    @classmethod
+    def _encode(cls, event: CloudEvent) -> bytes:
+        if not isinstance(event, CloudEvent):
+            raise TypeError("Avro.encode cannot encode %s" % type(event))
+        return cls._encode_event(event)
+
+    @classmethod
+    def _encode_event(cls, event: CloudEvent) -> bytes:
+        if type(event) is LazyCloudEvent and event._codec is Avro:
+            return event._encoded
+        encodings = event._encodings
+        if encodings is None:
+            return cls._render_event(event)
+        encoded = encodings.get(Avro)
+        if encoded is None:
+            encoded = encodings[Avro] = cls._render_event(event)
+        return encoded
+
+    @classmethod
+    def _render_event(cls, event: CloudEvent) -> bytes:
+        out = bytearray()
+        write_event(out, event._attributes, event._data)
+        return bytes(out)
+
+    @classmethod
+    @instrumented_decoder
+    def decode_from(cls, file, validate=False, intern=False) -> CloudEvent:
+        # Reads exactly one event, the file is left positioned after it.
+        validator = get_validator(validate)
+        event = cls._decode(StreamView(file), get_intern_table(intern))
+        return event if validator is None else validator.validate(event)
 
-    from io import BytesIO
-    from .cloudevents import CloudEvent
+    @classmethod
+    @instrumented_decoder
+    def decode(cls, data: bytes, lazy=False, fields: Iterable[str] = None, validate=False,
+               intern=False, cache_encoding=False) -> Union[CloudEvent, dict]:
+        # With fields, a dict of only those attributes is returned and the data is skipped.
+        # With validate=True or a Validator, ValidationError is raised for an invalid event, see spce.validation.
+        # With an InternTable, events decoded with it share equal attribute names and values, see spce.interning.
+        # With cache_encoding=True, the encoding cache of the event is enabled with its original bytes,
+        # see CloudEvent.enable_encoding_cache.
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if not lazy and fields is None and not validate and not cache_encoding:
+            return cls._decode(data, get_intern_table(intern))
+        try:
+            event, _ = cls._event_decoder(lazy, fields, validate, intern, cache_encoding)(data, 0)
+        except IndexError:
+            raise ValueError("Avro.decode: unexpected end of data")
+        return event
 
-    schema = avro.schema.parse(schema_text)
-    writer = DatumWriter(schema)
-    reader = DatumReader(schema)
+    @classmethod
+    @instrumented_encoder
+    def encode_many(cls, events: Iterable[CloudEvent], offsets: list = None) -> bytes:
+        # Encodes events back to back into a single buffer.
+        # If an offsets list is given, the start offset of each event is appended to it.
+        out = bytearray()
+        cls._encode_many(out, events, offsets)
+        return bytes(out)
 
-    class _Avro:
+    @classmethod
+    @instrumented_encoder
+    def encode_views(cls, events: Iterable[CloudEvent]) -> List[memoryview]:
+        # Encodes events into a single buffer and returns a memoryview slice of it for each event.
+        out = bytearray()
+        offsets = []
+        cls._encode_many(out, events, offsets)
+        offsets.append(len(out))
+        view = memoryview(out)
+        return [view[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
 
-        @classmethod
-        def encode_to(cls, event: CloudEvent, file):
-            encoder = BinaryEncoder(file)
-            writer.write({"attribute": event._attributes, "data": event._data}, encoder)
+    @classmethod
+    @instrumented_iter_decoder
+    def decode_iter(cls, file, chunk_size=_CHUNK_SIZE, lazy=False, fields: Iterable[str] = None,
+                    validate=False, intern=False, cache_encoding=False) -> Iterator[Union[CloudEvent, dict]]:
+        # Decodes back to back events from a bytes-like object, a binary file object
+        # or an iterable of bytes chunks until the end.
+        # The file is read in chunks, so it may be read past the last event yielded.
+        decode_event = cls._event_decoder(lazy, fields, validate, intern, cache_encoding)
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            buf = bytes(file)
+            read = None
+        else:
+            buf = b""
+            read = file.read if hasattr(file, "read") else _chunk_reader(file)
+        pos = 0
+        while True:
+            end = len(buf)
+            while pos < end:
+                try:
+                    event, pos = decode_event(buf, pos)
+                except IndexError:
+                    break
+                yield event
+            # read at least as much as the pending bytes, so large events are not re-parsed many times
+            chunk = read(max(chunk_size, end - pos)) if read else b""
+            if not chunk:
+                if pos < end:
+                    raise ValueError("Avro.decode: unexpected end of data")
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
 
-        @classmethod
-        def encode(cls, event: CloudEvent):
-            with BytesIO() as bio:
-                cls.encode_to(event, bio)
-                return bio.getvalue()
+    @classmethod
+    @instrumented_decoder
+    def decode_batch(cls, data: bytes) -> CloudEventBatch:
+        # Decodes back to back events, as encode_many writes them, into a CloudEventBatch
+        # without creating CloudEvent objects. Bytes and string data are copied to the batch without decoding.
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        rows = []
+        events_data = []
+        end = len(data)
+        pos = 0
+        try:
+            while pos < end:
+                attributes, pos = read_attributes(data, pos)
+                index, value, pos = read_raw_data(data, pos)
+                rows.append(attributes)
+                if index == 0 or index == 12:
+                    events_data.append(((_BINARY if index == 0 else _TEXT) if value else _NO_DATA, value))
+                else:
+                    events_data.append(_encode_data(value))
+        except IndexError:
+            raise ValueError("Avro.decode: unexpected end of data")
+        batch = CloudEventBatch()
+        batch._extend(rows, events_data, normalize=True)
+        return batch
 
-        @classmethod
-        def decode_from(cls, file) -> CloudEvent:
-            decoder = BinaryDecoder(file)
-            raw_event = reader.read(decoder)
+    @classmethod
+    @instrumented_iter_encoder
+    def iter_encode(cls, events: Iterable[CloudEvent], chunk_size=_CHUNK_SIZE) -> Iterator[bytes]:
+        # Yields the events encoded back to back, as encode_many does, in chunks of about chunk_size bytes;
+        # events are pulled from the iterable only when the next chunk is needed.
+        return cls._iter_encode(events, chunk_size)
+
+    @classmethod
+    def _iter_encode(cls, events: Iterable[CloudEvent], chunk_size: int) -> Iterator[bytes]:
+        out = bytearray()
+        for event in events:
+            cls._encode_many(out, (event,), None)
+            if len(out) >= chunk_size:
+                yield bytes(out)
+                out = bytearray()
+        if out:
+            yield bytes(out)
+
+    @classmethod
+    @instrumented_async_encoder
+    async def aencode_to(cls, events: Iterable[CloudEvent], writer, chunk_size=_CHUNK_SIZE):
+        # Writes events back to back to an asyncio.StreamWriter in chunks of about chunk_size bytes,
+        # waiting for the transport to drain after each one.
+        for chunk in cls._iter_encode(events, chunk_size):
+            writer.write(chunk)
+            await writer.drain()
+
+    @classmethod
+    @instrumented_async_iter_decoder
+    async def aiter_decode(cls, reader, chunk_size=_CHUNK_SIZE, lazy=False, fields: Iterable[str] = None,
+                           validate=False, intern=False, cache_encoding=False):
+        # Async version of decode_iter for an asyncio.StreamReader:
+        # async for event in Avro.aiter_decode(reader)
+        decode_event = cls._event_decoder(lazy, fields, validate, intern, cache_encoding)
+        buf = b""
+        pos = 0
+        while True:
+            end = len(buf)
+            while pos < end:
+                try:
+                    event, pos = decode_event(buf, pos)
+                except IndexError:
+                    break
+                yield event
+            chunk = await reader.read(max(chunk_size, end - pos))
+            if not chunk:
+                if pos < end:
+                    raise ValueError("Avro.decode: unexpected end of data")
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
+
+    @classmethod
+    def write_container(cls, events: Iterable[CloudEvent], file, codec="deflate", block_size=None):
+        # Writes an Avro Object Container File with the CloudEvent schema.
+        # A block is closed when it reaches block_size bytes before compression,
+        # the avro package caps the block size to its own sync interval.
+        # The file is flushed, but not closed.
+        schema, _, DataFileWriter, _, DatumWriter = _load_avro()
+        container = DataFileWriter(file, DatumWriter(), schema, codec=codec)
+        append = container.append
+        buffer = container.buffer_writer
+        for event in events:
+            append({"attribute": event._attributes, "data": event._data})
+            if block_size and buffer.tell() >= block_size:
+                container.sync()
+        container.flush()
+
+    @classmethod
+    def read_container(cls, file, validate=False, intern=False) -> Iterator[CloudEvent]:
+        # Reads events from an Avro Object Container File written with the CloudEvent schema.
+        # The file is not closed.
+        _, DataFileReader, _, DatumReader, _ = _load_avro()
+        validator = get_validator(validate)
+        table = get_intern_table(intern)
+        make_event = cls._make_event
+        for raw_event in DataFileReader(file, DatumReader()):
             attributes = raw_event.get("attribute") or {}
-            attributes["data"] = raw_event.get("data") or ""
-            return CloudEvent(**attributes)
+            attributes = _with_constant_names(attributes) if table is None else table.attributes(attributes)
+            event = make_event(attributes, raw_event.get("data"))
+            yield event if validator is None else validator.validate(event)
+
+    @classmethod
+    def _encode_many(cls, out: bytearray, events: Iterable[CloudEvent], offsets: list):
+        for event in events:
+            if not isinstance(event, CloudEvent):
+                raise TypeError("Avro.encode cannot encode %s" % type(event))
+            if offsets is not None:
+                offsets.append(len(out))
+            if type(event) is LazyCloudEvent and event._codec is Avro:
+                out += event._encoded
+            elif event._encodings is not None:
+                out += cls._encode_event(event)
+            else:
+                write_event(out, event._attributes, event._data)
+
+    @classmethod
+    def _event_decoder(cls, lazy: bool, fields: Iterable[str], validate=False, intern=False, cache_encoding=False):
+        # Returns a function that decodes the event at a position of a buffer,
+        # and returns it with the position after it.
+        validator = get_validator(validate, fields)
+        if lazy and fields is not None:
+            raise ValueError("lazy cannot be used with fields")
+        table = get_intern_table(intern)
+        decode_event = cls._decode_lazy if lazy else cls._decode_eager
+        if table is not None:
+            decode_event = partial(decode_event, table=table)
+        if cache_encoding and fields is None:
+            decode_uncached = decode_event
+
+            def decode_cached(buf, pos):
+                event, end = decode_uncached(buf, pos)
+                # a lazy event keeps its encoding already
+                encoded = event._encoded if lazy else buf[pos:end]
+                return _cache_encoding(event, Avro, encoded), end
+
+            decode_event = decode_cached
+        if validator is not None:
+            validate_event = validator.validate
+
+            def decode_validated(buf, pos):
+                event, pos = decode_event(buf, pos)
+                return validate_event(event), pos
+
+            return decode_validated
+        if fields is not None:
+            fields = frozenset(fields)
+
+            def decode_projected(buf, pos):
+                attributes, pos = read_projected_attributes(buf, pos, fields)
+                return attributes, skip_data(buf, pos)
+
+            return decode_projected
+        return decode_event
+
+    @classmethod
+    def _decode_eager(cls, buf, pos: int, table: InternTable = None):
+        attributes, data, pos = read_event(buf, pos)
+        if table is not None:
+            attributes = table.attributes(attributes)
+        return cls._make_event(attributes, data), pos
 
-        @classmethod
-        def decode(cls, data: bytes) -> CloudEvent:
-            with BytesIO(data) as f:
-                return cls.decode_from(f)
+    @classmethod
+    def _decode(cls, buf, table: InternTable = None) -> CloudEvent:
+        try:
+            attributes, data, _ = read_event(buf)
+        except IndexError:
+            raise ValueError("Avro.decode: unexpected end of data")
+        if table is not None:
+            attributes = table.attributes(attributes)
+        return cls._make_event(attributes, data)
 
-    return _Avro
+    @classmethod
+    def _decode_lazy(cls, buf: bytes, pos: int, table: InternTable = None):
+        # Returns the event at pos and the position after it, only the attributes are decoded.
+        start = pos
+        attributes, data_pos = read_attributes(buf, pos)
+        if table is not None:
+            attributes = table.attributes(attributes)
+        end = skip_data(buf, data_pos)
+        if start == 0 and end == len(buf):
+            encoded = buf
+        else:
+            encoded = buf[start:end]
+            data_pos -= start
+        return LazyCloudEvent(_normalize(attributes), Avro, encoded, data_pos), end
 
+    @classmethod
+    def _load_data(cls, encoded: bytes, data_pos: int):
+        return read_data(encoded, data_pos)[0]
 
-Avro = _make_avro_codec()
\ No newline at end of file
+    @classmethod
+    def _make_event(cls, attributes: dict, data) -> CloudEvent:
+        return _adopt(attributes or {}, data)
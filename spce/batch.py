@@ -0,0 +1,310 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Columnar event batches.
+#
+# A CloudEventBatch keeps each attribute in a column instead of a dict per event.
+# The columns of the attributes with few distinct values (type, source, ...) are dictionary encoded:
+# each distinct value is stored once, and the column is an array of 32 bit codes.
+# The data of all events is kept in a single buffer, with an array of offsets into it.
+#
+# Json.decode_batch and Avro.decode_batch fill a batch without creating CloudEvent objects,
+# events are created only when they are accessed.
+
+import json
+from array import array
+from itertools import accumulate, chain, islice, repeat
+from typing import Callable, Iterable, Iterator, List, Union
+
+from .cloudevents import CloudEvent, _OPTIONAL_ATTRIBUTES, _REQUIRED_ATTRIBUTES, _format_time, _new_event
+
+__all__ = "CloudEventBatch",
+
+# the order of the attributes in CloudEvent
+_ATTRIBUTE_ORDER = _REQUIRED_ATTRIBUTES + ("specversion",) + _OPTIONAL_ATTRIBUTES
+
+_DICTIONARY_ATTRIBUTES = frozenset(("type", "source", "specversion", "datacontenttype", "dataschema"))
+
+# kinds of data
+_NO_DATA, _BINARY, _TEXT, _JSON = range(4)
+
+_ENCODER = json.JSONEncoder(separators=(",", ":"))
+_DECODER = json.JSONDecoder()
+
+# the value of an attribute that an event doesn't have
+_MISSING = object()
+
+
+class CloudEventBatch:
+
+    __slots__ = "_columns", "_payload", "_offsets", "_kinds", "_length"
+
+    def __init__(self, events: Iterable[CloudEvent] = ()):
+        # attribute name -> column, in the order the attributes were first seen
+        self._columns = {}
+        self._payload = bytearray()
+        # the data of event i is _payload[_offsets[i]:_offsets[i + 1]], its kind is _kinds[i]
+        self._offsets = array("Q", [0])
+        self._kinds = bytearray()
+        self._length = 0
+        self.extend(events)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self) -> Iterator[CloudEvent]:
+        names = list(self._columns)
+        columns = [column.to_list() for column in self._columns.values()]
+        rows = zip(*columns) if columns else repeat((), self._length)
+        data = self.data
+        for i, row in enumerate(rows):
+            attributes = {name: value for name, value in zip(names, row) if value is not _MISSING}
+            yield _new_event(attributes, data(i))
+
+    def __getitem__(self, item) -> Union[CloudEvent, "CloudEventBatch"]:
+        if isinstance(item, slice):
+            return self.take(range(*item.indices(self._length)))
+        index = range(self._length)[item]
+        attributes = {}
+        for name, column in self._columns.items():
+            value = column.get(index)
+            if value is not _MISSING:
+                attributes[name] = value
+        return _new_event(attributes, self.data(index))
+
+    def __repr__(self):
+        return "CloudEventBatch(%d events, attributes: %s)" % (self._length, ", ".join(self._columns))
+
+    def append(self, event: CloudEvent):
+        self.extend((event,))
+
+    def extend(self, events: Iterable[CloudEvent]):
+        events = list(events)
+        for event in events:
+            if not isinstance(event, CloudEvent):
+                raise TypeError("CloudEventBatch cannot hold %s" % type(event))
+        self._extend([event._attributes for event in events], [_encode_data(event._data) for event in events])
+
+    def to_events(self) -> List[CloudEvent]:
+        return list(self)
+
+    @property
+    def attribute_names(self) -> tuple:
+        return tuple(self._columns)
+
+    def column(self, name: str) -> list:
+        # Returns the values of an attribute, None for the events which don't have it.
+        column = self._columns.get(name)
+        if column is None:
+            return [None] * self._length
+        return [None if value is _MISSING else value for value in column.to_list()]
+
+    def data(self, index: int):
+        kind = self._kinds[index]
+        if kind == _NO_DATA:
+            return None
+        payload = self._payload[self._offsets[index]:self._offsets[index + 1]]
+        if kind == _BINARY:
+            return bytes(payload)
+        if kind == _TEXT:
+            return payload.decode()
+        return _DECODER.decode(payload.decode())
+
+    def filter(self, name: str, value) -> "CloudEventBatch":
+        # Returns the events whose attribute is equal to value, or for which value(attribute) is true
+        # if value is callable. The attribute is None for the events which don't have it.
+        # For dictionary encoded attributes, the condition is evaluated once for each distinct value.
+        predicate = value if callable(value) else lambda v: v == value
+        column = self._columns.get(name)
+        if column is None:
+            return self.take(range(self._length) if predicate(None) else ())
+        return self.take(column.where(predicate))
+
+    def select(self, *names: str) -> "CloudEventBatch":
+        # Returns the events with only the given attributes, and their data.
+        return self._take(range(self._length), [name for name in names if name in self._columns])
+
+    def sort(self, name: str, reverse=False) -> "CloudEventBatch":
+        # Returns the events ordered by an attribute, the ones which don't have it (or have None) first.
+        # The sort is stable.
+        column = self._columns.get(name)
+        if column is None:
+            return self.take(range(self._length))
+        keys = column.sort_keys()
+        return self.take(sorted(range(self._length), key=keys.__getitem__, reverse=reverse))
+
+    def take(self, indices: Iterable[int]) -> "CloudEventBatch":
+        # Returns the events at the given indices, in that order.
+        return self._take(indices, self._columns)
+
+    def _take(self, indices: Iterable[int], names: Iterable[str]) -> "CloudEventBatch":
+        indices = list(indices)
+        batch = CloudEventBatch()
+        batch._columns = {name: self._columns[name].take(indices) for name in names}
+        payload = self._payload
+        offsets = self._offsets
+        new_payload = batch._payload
+        new_offsets = batch._offsets
+        for i in indices:
+            new_payload += payload[offsets[i]:offsets[i + 1]]
+            new_offsets.append(len(new_payload))
+        kinds = self._kinds
+        batch._kinds = bytearray(kinds[i] for i in indices)
+        batch._length = len(indices)
+        return batch
+
+    def _extend(self, rows: list, data: list, normalize=False):
+        # Adds events column by column. rows are the attribute dicts of the events,
+        # data are the (kind, payload) pairs of their data, see _encode_data.
+        # With normalize, rows are the keyword arguments of CloudEvent (without data),
+        # and the attributes are added as CloudEvent would keep them.
+        columns = self._columns
+        length = self._length
+        names = dict.fromkeys(chain.from_iterable(rows))
+        if normalize:
+            # CloudEvent always sets the required attributes and specversion, and it keeps the spec's attributes first
+            order = [name for name in _ATTRIBUTE_ORDER if name in names or name not in _OPTIONAL_ATTRIBUTES]
+            names = dict.fromkeys(chain(order, names))
+        for name in names:
+            if name not in columns:
+                columns[name] = _new_column(name, length)
+        for name, column in columns.items():
+            if name in names:
+                column.extend(_normalized_values(rows, name) if normalize else [d.get(name, _MISSING) for d in rows])
+            else:
+                column.extend([_MISSING] * len(rows))
+        payloads = [payload for _, payload in data]
+        start = len(self._payload)
+        self._payload += b"".join(payloads)
+        self._offsets.extend(islice(accumulate(chain((start,), map(len, payloads))), 1, None))
+        self._kinds += bytes(kind for kind, _ in data)
+        self._length += len(rows)
+
+
+class _Column:
+    # The values of an attribute, _MISSING for the events which don't have it.
+
+    __slots__ = "values",
+
+    def __init__(self, values: list):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def extend(self, values: list):
+        self.values.extend(values)
+
+    def get(self, index: int):
+        return self.values[index]
+
+    def to_list(self) -> list:
+        return self.values
+
+    def take(self, indices: list) -> "_Column":
+        values = self.values
+        return _Column([values[i] for i in indices])
+
+    def where(self, predicate: Callable) -> list:
+        return [i for i, value in enumerate(self.values) if predicate(None if value is _MISSING else value)]
+
+    def sort_keys(self) -> list:
+        return [_sort_key(value) for value in self.values]
+
+
+class _DictionaryColumn:
+    # Each distinct value of an attribute is stored once, and codes holds the index of the value of each event.
+    # Code 0 is _MISSING. The values only grow, so they are shared by the columns taken from this one.
+
+    __slots__ = "codes", "values", "_index"
+
+    def __init__(self, codes: array, values: list, index: dict):
+        self.codes = codes
+        self.values = values
+        # value -> code; values other than strings are keyed with their type, so that 1 and True are different
+        self._index = index
+
+    def __len__(self):
+        return len(self.codes)
+
+    def extend(self, values: list):
+        index = self._index
+        set_default = index.setdefault
+        self.codes.extend([set_default(value if type(value) is str else (type(value), value), len(index))
+                           for value in values])
+        if len(index) > len(self.values):
+            self.values.extend(key if type(key) is str else key[1] for key in islice(index, len(self.values), None))
+
+    def get(self, index: int):
+        return self.values[self.codes[index]]
+
+    def to_list(self) -> list:
+        values = self.values
+        return [values[code] for code in self.codes]
+
+    def take(self, indices: list) -> "_DictionaryColumn":
+        codes = self.codes
+        return _DictionaryColumn(array("I", [codes[i] for i in indices]), self.values, self._index)
+
+    def where(self, predicate: Callable) -> list:
+        selected = [predicate(None if value is _MISSING else value) for value in self.values]
+        return [i for i, code in enumerate(self.codes) if selected[code]]
+
+    def sort_keys(self) -> list:
+        values = self.values
+        ranks = [0] * len(values)
+        for rank, code in enumerate(sorted(range(len(values)), key=lambda c: _sort_key(values[c]))):
+            ranks[code] = rank
+        return [ranks[code] for code in self.codes]
+
+
+def _new_column(name: str, length: int):
+    # a column for an attribute first seen after length events, which don't have it
+    if name in _DICTIONARY_ATTRIBUTES:
+        return _DictionaryColumn(array("I", [0]) * length, [_MISSING], {(object, _MISSING): 0})
+    return _Column([_MISSING] * length)
+
+
+def _sort_key(value):
+    if value is None or value is _MISSING:
+        return False, ""
+    return True, value
+
+
+def _encode_data(data) -> tuple:
+    # Returns the kind and the encoding of the data of an event.
+    if not data:
+        return _NO_DATA, b""
+    if isinstance(data, bytes):
+        return _BINARY, data
+    if isinstance(data, str):
+        return _TEXT, data.encode()
+    return _JSON, _ENCODER.encode(data).encode()
+
+
+def _normalized_values(rows: list, name: str) -> list:
+    # Returns the values of an attribute of CloudEvent(**d) for each d in rows, without creating the events.
+    if name in _REQUIRED_ATTRIBUTES:
+        try:
+            return [d[name] for d in rows]
+        except KeyError:
+            raise TypeError("missing required attribute: %s" % name)
+    if name == "specversion":
+        return [d.get(name, "1.0") for d in rows]
+    if name == "time":
+        return [_MISSING if not value else value if type(value) is str else _format_time(value)
+                for value in (d.get(name) for d in rows)]
+    if name in _OPTIONAL_ATTRIBUTES:
+        return [d.get(name) or _MISSING for d in rows]
+    return [d.get(name, _MISSING) for d in rows]
@@ -14,14 +14,25 @@
 
 import builtins
 from datetime import datetime
-from typing import Union
+from typing import Optional, Union
 
-__all__ = "CloudEvent",
+from ._rfc3339 import parse_rfc3339, format_rfc3339
+
+__all__ = "CloudEvent", "LazyCloudEvent"
+
+_REQUIRED_ATTRIBUTES = "type", "source", "id"
+# dropped if they are blank
+_OPTIONAL_ATTRIBUTES = "subject", "datacontenttype", "dataschema", "time"
+# the attribute names of the spec as the constant strings of the code, events keep them instead of a decoder's copies
+_ATTRIBUTE_NAMES = {name: name for name in _REQUIRED_ATTRIBUTES + ("specversion",) + _OPTIONAL_ATTRIBUTES}
 
 
 class CloudEvent:
 
-    __slots__ = "_attributes", "_data", "_has_binary_data"
+    # _time caches the parsed time attribute, it is set on first access by _parsed_time.
+    # _encodings is None, or a dict of codec -> encoding of the event when the encoding cache is enabled,
+    # see enable_encoding_cache.
+    __slots__ = "_attributes", "_data", "_has_binary_data", "_time", "_encodings"
 
     NOW = "now"
 
@@ -44,30 +55,20 @@ class CloudEvent:
             "specversion": specversion,
         }
 
-        if isinstance(time, datetime):
-            # if the time has timezone information, convert it directly to isoformat
-            if time.tzinfo is not None and time.tzinfo.utcoffset(time) is not None:
-                time = time.isoformat()
-            else:
-                # time is naive, assume it is UTC
-                time = "%sZ" % time.isoformat()
-        elif isinstance(time, str):
-            pass
-        elif time:
-            raise TypeError("time must be either a string or a datetime.datetime, but it is: %s"
-                            % builtins.type(time))
+        time = _format_time(time)
 
         if subject: attrs["subject"] = subject
         if datacontenttype: attrs["datacontenttype"] = datacontenttype
         if dataschema: attrs["dataschema"] = dataschema
         if time: attrs["time"] = time
 
-        # TODO: validation
+        # not validated, see spce.validation
 
         self._attributes = attrs
         self._data = data or None
         self._attributes.update(attributes)
         self._has_binary_data = isinstance(data, bytes)
+        self._encodings = None
 
     type = property(lambda self: self._attributes.get("type"))
     source = property(lambda self: self._attributes.get("source"))
@@ -79,9 +80,35 @@ class CloudEvent:
     subject = property(lambda self: self._attributes.get("subject"))
     time = property(lambda self: self._attributes.get("time"))
 
+    @property
+    def time_datetime(self) -> Optional[datetime]:
+        # The time attribute as an aware datetime, or None if it is not set.
+        parsed = self._parsed_time()
+        return parsed[0] if parsed else None
+
+    @property
+    def time_epoch_ns(self) -> Optional[int]:
+        # The time attribute as nanoseconds since the epoch, or None if it is not set.
+        parsed = self._parsed_time()
+        return parsed[1] if parsed else None
+
+    @classmethod
+    def from_dict(cls, attributes: dict) -> "CloudEvent":
+        # A fast path for the decoders, which makes the same event as CloudEvent(**attributes),
+        # but the dict is adopted as the attributes of the event after the data is popped from it.
+        # The attributes keep their order, and the dict must not be changed afterwards.
+        return _adopt(attributes, attributes.pop("data", None))
+
     def attribute(self, name):
         return self._attributes.get(name)
 
+    def enable_encoding_cache(self) -> "CloudEvent":
+        # Keeps the encodings of the event, so encoding it again with Json, JsonLines or Avro
+        # returns the stored encoding. Events must not be changed after their encoding is cached.
+        if self._encodings is None:
+            self._encodings = {}
+        return self
+
     def __str__(self):
         return str(self._attributes)
 
@@ -95,4 +122,92 @@ class CloudEvent:
             and self._data == other._data
 
     def __hash__(self):
-        return hash(self._attributes, self._data)
\ No newline at end of file
+        return hash(self._attributes, self._data)
+
+    def _parsed_time(self):
+        try:
+            return self._time
+        except AttributeError:
+            pass
+        time = self._attributes.get("time")
+        self._time = parsed = parse_rfc3339(time) if time else None
+        return parsed
+
+
+def _format_time(time: Union[str, datetime]) -> str:
+    if isinstance(time, datetime):
+        return format_rfc3339(time)
+    elif isinstance(time, str):
+        return time
+    elif time:
+        raise TypeError("time must be either a string or a datetime.datetime, but it is: %s"
+                        % builtins.type(time))
+    return time
+
+
+def _adopt(attributes: dict, data) -> CloudEvent:
+    return _new_event(_normalize(attributes), data)
+
+
+def _normalize(attributes: dict) -> dict:
+    # Checks and normalizes decoded attributes in place like CloudEvent.__init__.
+    if "type" not in attributes or "source" not in attributes or "id" not in attributes:
+        missing = [name for name in _REQUIRED_ATTRIBUTES if name not in attributes]
+        raise TypeError("CloudEvent missing required attributes: %s" % ", ".join(missing))
+    if "specversion" not in attributes:
+        attributes["specversion"] = "1.0"
+    for name in _OPTIONAL_ATTRIBUTES:
+        if not attributes.get(name, True):
+            del attributes[name]
+    time = attributes.get("time")
+    if time is not None and type(time) is not str:
+        attributes["time"] = _format_time(time)
+    return attributes
+
+
+def _with_constant_names(attributes: dict) -> dict:
+    # Copies decoded attributes with the spec attribute names replaced by the constant ones,
+    # so the event doesn't keep the strings the decoder allocated for them.
+    names = _ATTRIBUTE_NAMES
+    return {names.get(name, name): value for name, value in attributes.items()}
+
+
+def _new_event(attributes: dict, data) -> CloudEvent:
+    # Makes an event of attributes which are already normalized, without copying them.
+    event = CloudEvent.__new__(CloudEvent)
+    event._attributes = attributes
+    event._data = data or None
+    event._has_binary_data = isinstance(data, bytes)
+    event._encodings = None
+    return event
+
+
+def _cache_encoding(event: CloudEvent, codec, encoded) -> CloudEvent:
+    # Enables the encoding cache of a decoded event with its original encoding.
+    event._encodings = {codec: encoded}
+    return event
+
+
+class LazyCloudEvent(CloudEvent):
+    # An event decoded with lazy=True by the Json or Avro codecs.
+    # The data is decoded from the original encoding on first access,
+    # and encoding the event with the same codec returns the original encoding.
+
+    __slots__ = "_encoded", "_codec", "_pending"
+
+    def __init__(self, attributes: dict, codec, encoded, pending):
+        # _data and _has_binary_data are left unset until the data is first accessed, see __getattr__.
+        self._attributes = attributes
+        self._codec = codec
+        self._encoded = encoded
+        self._pending = pending
+        self._encodings = None
+
+    def __getattr__(self, name):
+        if name == "_data" or name == "_has_binary_data":
+            data = self._codec._load_data(self._encoded, self._pending)
+            self._data = data or None
+            self._has_binary_data = isinstance(data, bytes)
+            self._pending = None
+            return getattr(self, name)
+        raise AttributeError("%r object has no attribute %r" % (builtins.type(self).__name__, name))
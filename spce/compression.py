@@ -0,0 +1,222 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Streaming compression of encoded events.
+#
+# compress and decompress work on iterables of chunks, so they plug into the streaming encoders and decoders,
+# and only a chunk of the encoded events is kept in memory at a time:
+#
+#   chunks = compress(Json.iter_encode(events), "gzip")
+#   events = Json.iter_decode(decompress(chunks, "gzip"))
+#
+# The same works with JsonLines.iter_encode/iter_decode and Avro.iter_encode/decode_iter.
+# The methods are gzip and zlib with the zlib module, bz2 and lzma (xz);
+# bz2 and lzma are optional modules of the standard library, they are imported on first use.
+#
+# PresetDictionary compresses small messages one by one with a zlib preset dictionary trained from sample events,
+# which gets good ratios where compressing each message on its own doesn't.
+
+import zlib
+from base64 import b64encode
+from collections import Counter
+from functools import lru_cache
+from importlib import import_module
+from typing import Iterable, Iterator, Union
+
+from ._avrobinary import write_attribute_entries, write_data
+from .avro import Avro
+from .cloudevents import CloudEvent
+from .json import Json, JsonLines
+
+__all__ = "compress", "compress_to", "decompress", "PresetDictionary"
+
+_CHUNK_SIZE = 64 * 1024
+_METHODS = "gzip", "zlib", "bz2", "lzma"
+
+# zlib limits the preset dictionary to the 32K window
+_MAX_DICTIONARY_SIZE = 32 * 1024
+# compressors for single messages need little memory, and they are faster to copy with less
+_MEM_LEVEL = 4
+
+
+def compress(chunks: Iterable[Union[str, bytes]], method="gzip", level: int = None) -> Iterator[bytes]:
+    # Yields the compressed chunks, str chunks are encoded with UTF-8.
+    # The level is the compression level of the method, its default if it is None.
+    compressor = _compressor(method, level)
+    compress_chunk = compressor.compress
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        out = compress_chunk(chunk)
+        if out:
+            yield out
+    out = compressor.flush()
+    if out:
+        yield out
+
+
+def compress_to(chunks: Iterable[Union[str, bytes]], fp, method="gzip", level: int = None):
+    # Writes the compressed chunks to a binary file object, which is not closed.
+    write = fp.write
+    for chunk in compress(chunks, method, level):
+        write(chunk)
+
+
+def decompress(source, method="gzip", chunk_size=_CHUNK_SIZE) -> Iterator[bytes]:
+    # source is compressed bytes, a binary file object or an iterable of bytes chunks.
+    # Concatenated streams, like appended gzip members, are decompressed one after the other.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        chunks = source,
+    elif hasattr(source, "read"):
+        chunks = iter(lambda: source.read(chunk_size), b"")
+    else:
+        chunks = source
+    decompressor = _decompressor(method)
+    # whether a stream is started but not finished
+    pending = False
+    for chunk in chunks:
+        while chunk:
+            if decompressor.eof:
+                decompressor = _decompressor(method)
+            pending = True
+            out = decompressor.decompress(chunk)
+            if out:
+                yield out
+            if decompressor.eof:
+                pending = False
+                chunk = decompressor.unused_data
+            else:
+                chunk = b""
+    if pending:
+        raise ValueError("decompress: unexpected end of %s data" % method)
+
+
+class PresetDictionary:
+    # Compresses small messages, like single encoded events, one by one with a zlib preset dictionary.
+    # The output is raw deflate without a header or a checksum, so both sides must use the same dictionary.
+
+    __slots__ = "_dictionary", "_compressor"
+
+    def __init__(self, dictionary: bytes, level=6):
+        if not dictionary:
+            raise ValueError("the preset dictionary is empty")
+        dictionary = bytes(dictionary[-_MAX_DICTIONARY_SIZE:])
+        self._dictionary = dictionary
+        # a window twice the dictionary, so the end of a message can refer back to its start
+        wbits = min(15, max(9, (2 * len(dictionary) - 1).bit_length()))
+        # each message is compressed with a copy of this compressor,
+        # which is faster than setting the dictionary of a new one
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -wbits, _MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+                                            dictionary)
+
+    dictionary = property(lambda self: self._dictionary)
+
+    @classmethod
+    def train(cls, events: Iterable[CloudEvent], codec=Json, size=8 * 1024, level=6) -> "PresetDictionary":
+        # Makes a dictionary of the attributes and the data of sample events as the codec encodes them.
+        # The most common ones are put at the end of the dictionary, where they are the cheapest to refer to,
+        # and the least common ones are left out when the dictionary is longer than size bytes.
+        if codec is Avro:
+            fragments, separator = _avro_fragments, b""
+        elif codec is Json or codec is JsonLines:
+            fragments, separator = _json_fragments, b","
+        else:
+            raise TypeError("PresetDictionary.train cannot train for %s" % codec)
+        counts = Counter()
+        for event in events:
+            counts.update(fragments(event))
+        if not counts:
+            raise ValueError("PresetDictionary.train requires sample events")
+        size = min(size, _MAX_DICTIONARY_SIZE)
+        ranked = sorted(counts, key=lambda fragment: counts[fragment] * len(fragment), reverse=True)
+        selected = []
+        total = 0
+        for fragment in ranked:
+            # fragments which don't fit are skipped, a smaller one may still fit
+            if total + len(fragment) + len(separator) <= size:
+                total += len(fragment) + len(separator)
+                selected.append(fragment)
+        selected.reverse()
+        # or the end of the top fragment, if none of them fits
+        return cls(separator.join(selected) or ranked[0][-size:], level)
+
+    def compress(self, data: Union[str, bytes]) -> bytes:
+        if isinstance(data, str):
+            data = data.encode()
+        compressor = self._compressor.copy()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        decompressor = zlib.decompressobj(-15, zdict=self._dictionary)
+        out = decompressor.decompress(data)
+        if not decompressor.eof:
+            raise ValueError("PresetDictionary.decompress: unexpected end of data")
+        return out
+
+
+def _json_fragments(event: CloudEvent) -> list:
+    encode = Json._ENCODER.encode
+    fragments = ['"%s":%s' % (name, encode(value)) for name, value in event._attributes.items() if value]
+    if event._data:
+        if event._has_binary_data:
+            fragments.append('"data_base64":%s' % encode(b64encode(event._data).decode()))
+        else:
+            fragments.append('"data":%s' % encode(event._data))
+    return [fragment.encode() for fragment in fragments]
+
+
+def _avro_fragments(event: CloudEvent) -> list:
+    fragments = []
+    for name, value in event._attributes.items():
+        out = bytearray()
+        write_attribute_entries(out, {name: value})
+        fragments.append(bytes(out))
+    out = bytearray()
+    write_data(out, event._data)
+    fragments.append(bytes(out))
+    return fragments
+
+
+def _compressor(method: str, level: int):
+    if method == "gzip":
+        # a gzip header and trailer
+        return zlib.compressobj(-1 if level is None else level, zlib.DEFLATED, 31)
+    if method == "zlib":
+        return zlib.compressobj(-1 if level is None else level)
+    if method == "bz2":
+        return _load_module("bz2").BZ2Compressor(9 if level is None else level)
+    if method == "lzma":
+        return _load_module("lzma").LZMACompressor(preset=level)
+    raise ValueError("unknown compression method: %r, it must be one of: %s" % (method, ", ".join(_METHODS)))
+
+
+def _decompressor(method: str):
+    if method == "gzip":
+        return zlib.decompressobj(31)
+    if method == "zlib":
+        return zlib.decompressobj()
+    if method == "bz2":
+        return _load_module("bz2").BZ2Decompressor()
+    if method == "lzma":
+        return _load_module("lzma").LZMADecompressor()
+    raise ValueError("unknown compression method: %r, it must be one of: %s" % (method, ", ".join(_METHODS)))
+
+
+@lru_cache(maxsize=None)
+def _load_module(name: str):
+    # bz2 and lzma are missing from Python builds without their libraries
+    try:
+        return import_module(name)
+    except ImportError:
+        raise ImportError("%s compression requires Python built with the %s module" % (name, name))
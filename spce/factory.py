@@ -0,0 +1,221 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Events with generated ids, made in bulk.
+#
+# A CloudEventFactory makes the events of a CloudEventTemplate with ids from an id generator,
+# and optionally the time from a clock. Id generators and clocks are callables without arguments,
+# so e.g. lambda: str(uuid.uuid4()) and datetime.utcnow can be used as well.
+#
+# CounterIds generates a per-process random prefix followed by a counter, and UlidIds generates
+# monotonic ULIDs (https://github.com/ulid/spec). Both start over with new random bits in a forked child,
+# so the processes don't generate the same ids.
+
+import os
+import threading
+import weakref
+from datetime import datetime, timedelta, timezone
+from itertools import count, islice, repeat
+from time import time as _time
+from typing import Iterable, List, Union
+
+from .cloudevents import CloudEvent, _format_time, _new_event
+from .template import CloudEventTemplate
+
+__all__ = "CloudEventFactory", "CounterIds", "UlidIds", "CoarseClock"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# 10 bits -> 2 characters
+_PAIRS = tuple(a + b for a in _CROCKFORD for b in _CROCKFORD)
+_MASK40 = (1 << 40) - 1
+
+# id generators which start over in a forked child
+_GENERATORS = weakref.WeakSet()
+
+
+class CounterIds:
+
+    __slots__ = "_prefix", "_random_prefix", "_count", "__weakref__"
+
+    def __init__(self, prefix: str = None):
+        # Without a prefix, a random one is generated per process.
+        # A given prefix must be unique to the process, since the counter starts over in a forked child.
+        self._random_prefix = prefix is None
+        self._prefix = prefix
+        self._reset()
+        _GENERATORS.add(self)
+
+    def __call__(self) -> str:
+        return "%s%d" % (self._prefix, next(self._count))
+
+    def many(self, n: int) -> List[str]:
+        prefix = self._prefix
+        return [prefix + str(i) for i in islice(self._count, n)]
+
+    def _reset(self):
+        if self._random_prefix:
+            self._prefix = "%s-" % _encode_base32(int.from_bytes(os.urandom(10), "big"), 16)
+        # next on itertools.count is atomic, so the ids are unique across threads without a lock
+        self._count = count(1)
+
+
+class UlidIds:
+    # Within a millisecond, the random part of the last ULID is incremented, so the ids sort in generation order.
+    # The encoded timestamp and the high half of the random part are cached until they change.
+
+    __slots__ = "_lock", "_ms", "_high", "_low", "_prefix", "__weakref__"
+
+    def __init__(self):
+        self._reset()
+        _GENERATORS.add(self)
+
+    def __call__(self) -> str:
+        ms = int(_time() * 1000)
+        with self._lock:
+            return self._next(ms)
+
+    def many(self, n: int) -> List[str]:
+        ms = int(_time() * 1000)
+        next_id = self._next
+        with self._lock:
+            return [next_id(ms) for _ in range(n)]
+
+    def _next(self, ms: int) -> str:
+        if ms > self._ms:
+            random = int.from_bytes(os.urandom(10), "big")
+            self._ms = ms
+            self._high = random >> 40
+            self._low = random & _MASK40
+            self._update_prefix()
+        else:
+            # the same millisecond, or the clock went back
+            self._low += 1
+            if self._low > _MASK40:
+                self._low = 0
+                self._high += 1
+                if self._high > _MASK40:
+                    # the random part overflowed, borrow the next millisecond
+                    self._high = 0
+                    self._ms += 1
+                self._update_prefix()
+        low = self._low
+        pairs = _PAIRS
+        return "%s%s%s%s%s" % (self._prefix, pairs[low >> 30], pairs[(low >> 20) & 0x3FF],
+                               pairs[(low >> 10) & 0x3FF], pairs[low & 0x3FF])
+
+    def _update_prefix(self):
+        self._prefix = _encode_base32(self._ms, 10) + _encode_base32(self._high, 8)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._ms = -1
+        self._high = 0
+        self._low = 0
+        self._prefix = ""
+
+
+class CoarseClock:
+    # Returns the current time as an RFC 3339 string in UTC, truncated to the resolution in seconds.
+    # The string is formatted once per resolution interval.
+
+    __slots__ = "_step", "_timespec", "_next", "_text"
+
+    def __init__(self, resolution=0.001):
+        if resolution <= 0:
+            raise ValueError("resolution must be positive, but it is: %s" % resolution)
+        # in microseconds, so the time is truncated with integer arithmetic
+        self._step = max(round(resolution * 1000000), 1)
+        if resolution >= 1:
+            self._timespec = "seconds"
+        elif resolution >= 0.001:
+            self._timespec = "milliseconds"
+        else:
+            self._timespec = "microseconds"
+        self._next = 0.0
+        self._text = ""
+
+    def __call__(self) -> str:
+        now = _time()
+        if now >= self._next:
+            step = self._step
+            start = int(now * 1000000) // step * step
+            text = (_EPOCH + timedelta(microseconds=start)).isoformat(timespec=self._timespec)
+            # replace +00:00, the text is set before _next so other threads don't see a stale one
+            self._text = "%sZ" % text[:-6]
+            self._next = (start + step) / 1000000
+        return self._text
+
+
+class CloudEventFactory:
+    # Makes events of a template with generated ids, and the time from the clock if there is one.
+    # The events are created without the keyword argument processing of CloudEvent.__init__.
+
+    __slots__ = "_template", "_prototype", "_ids", "_clock"
+
+    def __init__(self, template: CloudEventTemplate, ids=None, clock=None):
+        self._template = template
+        self._ids = CounterIds() if ids is None else ids
+        self._clock = clock
+        # the attributes in the order CloudEvent keeps them, assigning id and time keeps their positions
+        prototype = template._head.copy()
+        prototype["id"] = ""
+        prototype.update(template._middle)
+        if clock is not None:
+            prototype["time"] = ""
+        prototype.update(template._tail)
+        self._prototype = prototype
+
+    template = property(lambda self: self._template)
+
+    def make(self, data: Union[str, bytes] = "") -> CloudEvent:
+        attrs = self._prototype.copy()
+        attrs["id"] = self._ids()
+        if self._clock is not None:
+            attrs["time"] = _format_time(self._clock())
+        return _new_event(attrs, data)
+
+    def make_many(self, n: int, data: Iterable[Union[str, bytes]] = None) -> List[CloudEvent]:
+        # Makes n events, with the data taken from the data iterable if it is given.
+        many = getattr(self._ids, "many", None)
+        ids = many(n) if many is not None else [self._ids() for _ in range(n)]
+        prototype = self._prototype
+        clock = self._clock
+        events = []
+        append = events.append
+        for id, value in zip(ids, repeat("", n) if data is None else islice(data, n)):
+            attrs = prototype.copy()
+            attrs["id"] = id
+            if clock is not None:
+                attrs["time"] = _format_time(clock())
+            append(_new_event(attrs, value))
+        if len(events) < n:
+            raise ValueError("make_many: %d events requested, but data has %d items" % (n, len(events)))
+        return events
+
+
+def _encode_base32(value: int, length: int) -> str:
+    # Crockford's base32 of the lowest 5 * length bits of value, length is even.
+    pairs = _PAIRS
+    return "".join([pairs[(value >> shift) & 0x3FF] for shift in range(5 * length - 10, -1, -10)])
+
+
+def _after_fork():
+    for generator in list(_GENERATORS):
+        generator._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
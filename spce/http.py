@@ -0,0 +1,164 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# CloudEvents HTTP protocol binding: https://github.com/cloudevents/spec/blob/v1.0/http-protocol-binding.md
+#
+# Messages are (headers, body) pairs. Headers are returned as a dict of str to str,
+# and may be given as a mapping or a sequence of (name, value) pairs of str or bytes (e.g. ASGI headers).
+# The body is returned as bytes; binary data is handed out as is, without a copy.
+# A bytes body of a binary mode message becomes the data as is; other bytes-like bodies
+# (bytearray, memoryview) are copied into bytes, since only bytes data is binary data of an event.
+
+import re
+from base64 import b64encode
+from typing import Iterable, List, Tuple
+from urllib.parse import quote, unquote
+
+from .avro import Avro
+from .cloudevents import CloudEvent
+from .json import Json
+
+__all__ = "to_binary", "from_binary", "to_structured", "from_structured", "to_batch", "from_batch", "from_http"
+
+JSON_CONTENT_TYPE = "application/cloudevents+json"
+AVRO_CONTENT_TYPE = "application/cloudevents+avro"
+BATCH_CONTENT_TYPE = "application/cloudevents-batch+json"
+
+_CONTENT_TYPE = "content-type"
+
+# attribute name -> header name
+_HEADER_NAMES = {name: "ce-%s" % name for name in ("type", "source", "id", "specversion", "subject", "dataschema", "time")}
+_HEADER_NAMES["datacontenttype"] = _CONTENT_TYPE
+# header name as received -> attribute name, or "" if it is not a CloudEvents header
+_ATTRIBUTE_NAMES = {}
+# the caches are not filled past this size, so arbitrary header names don't bloat them
+_CACHE_LIMIT = 1024
+
+# characters outside U+0021-U+007E, space, double quote and percent are percent-encoded
+_UNSAFE = re.compile(r'[^\x21\x23\x24\x26-\x7e]')
+_SAFE = "".join(chr(c) for c in range(0x21, 0x7f) if chr(c) not in '"%')
+
+
+def to_binary(event: CloudEvent) -> Tuple[dict, bytes]:
+    headers = {}
+    header_names = _HEADER_NAMES
+    for name, value in event._attributes.items():
+        if value:
+            headers[header_names.get(name) or _header_name(name)] = _header_value(value)
+    return headers, _body(event)
+
+
+def from_binary(headers, body: bytes) -> CloudEvent:
+    attribute_names = _ATTRIBUTE_NAMES
+    attributes = {}
+    for header, value in headers.items() if hasattr(headers, "items") else headers:
+        name = attribute_names.get(header)
+        if name is None:
+            name = _attribute_name(header)
+        if name:
+            if isinstance(value, bytes):
+                value = value.decode("latin-1")
+            attributes[name] = unquote(value) if "%" in value else value
+    # a copy of a bytearray or memoryview body, which the caller may reuse or change
+    attributes["data"] = body if isinstance(body, bytes) else bytes(body)
+    return CloudEvent.from_dict(attributes)
+
+
+def to_structured(event: CloudEvent, codec=Json) -> Tuple[dict, bytes]:
+    if codec is Avro:
+        return {_CONTENT_TYPE: AVRO_CONTENT_TYPE}, Avro.encode(event)
+    return {_CONTENT_TYPE: JSON_CONTENT_TYPE}, Json.encode(event).encode()
+
+
+def from_structured(headers, body: bytes) -> CloudEvent:
+    if _content_type(headers).startswith(AVRO_CONTENT_TYPE):
+        return Avro.decode(body)
+    event = Json.decode(body)
+    if not isinstance(event, CloudEvent):
+        raise ValueError("HTTP structured mode message contains a batch")
+    return event
+
+
+def to_batch(events: Iterable[CloudEvent]) -> Tuple[dict, bytes]:
+    return {_CONTENT_TYPE: BATCH_CONTENT_TYPE}, "".join(Json.iter_encode(events)).encode()
+
+
+def from_batch(headers, body: bytes) -> List[CloudEvent]:
+    events = Json.decode(body)
+    if isinstance(events, CloudEvent):
+        raise ValueError("HTTP batch mode message doesn't contain a batch")
+    return events
+
+
+def from_http(headers, body: bytes):
+    # Decodes a message in any of the modes; returns a list of events for batch mode.
+    content_type = _content_type(headers)
+    if content_type.startswith(BATCH_CONTENT_TYPE):
+        return from_batch(headers, body)
+    if content_type.startswith("application/cloudevents+"):
+        return from_structured(headers, body)
+    return from_binary(headers, body)
+
+
+def _header_name(name: str) -> str:
+    header = "ce-%s" % name
+    if len(_HEADER_NAMES) < _CACHE_LIMIT:
+        _HEADER_NAMES[name] = header
+    return header
+
+
+def _attribute_name(header) -> str:
+    lowered = (header.decode("latin-1") if isinstance(header, bytes) else header).lower()
+    if lowered.startswith("ce-"):
+        name = lowered[3:]
+    elif lowered == _CONTENT_TYPE:
+        name = "datacontenttype"
+    else:
+        name = ""
+    if len(_ATTRIBUTE_NAMES) < _CACHE_LIMIT:
+        _ATTRIBUTE_NAMES[header] = name
+    return name
+
+
+def _header_value(value) -> str:
+    if isinstance(value, str):
+        return quote(value, safe=_SAFE) if _UNSAFE.search(value) else value
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    elif isinstance(value, bytes):
+        return b64encode(value).decode()
+    return str(value)
+
+
+def _body(event: CloudEvent) -> bytes:
+    data = event._data
+    if data is None:
+        return b""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode()
+    # JSON values decoded from structured mode messages
+    return Json._ENCODER.encode(data).encode()
+
+
+def _content_type(headers) -> str:
+    attribute_names = _ATTRIBUTE_NAMES
+    for header, value in headers.items() if hasattr(headers, "items") else headers:
+        name = attribute_names.get(header)
+        if name is None:
+            name = _attribute_name(header)
+        if name == "datacontenttype":
+            return (value.decode("latin-1") if isinstance(value, bytes) else value).lower()
+    return ""
@@ -0,0 +1,319 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Secondary indexes over files of encoded events.
+#
+# EventIndex.build scans a JSON Lines file ("jsonl"), a JSON batch ("json") or back to back Avro events ("avro")
+# once, decoding only the id, source, type and time attributes, and records the position of each event in the file.
+# The index has a hash index on (source, id), a list of events for each type, and the events sorted by time.
+# Queries look the events up in the index, and decode only the matching events from the memory mapped file.
+#
+# Avro events are skipped over without decoding their data, and so is the data of JSON events when it is a long string,
+# see Json.decode(fields=...). A JSON batch is scanned in chunks, so neither format is read into memory as a whole.
+#
+# The index is saved to a file of its own, and loaded for the same, unchanged file of events.
+
+import codecs
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from hashlib import blake2b
+from typing import Iterator, List, Union
+
+from ._avrobinary import read_projected_attributes, skip_data
+from ._rfc3339 import format_rfc3339, parse_rfc3339
+from .avro import Avro
+from .cloudevents import CloudEvent
+from .json import Json, _BatchScanner, _CHUNK_SIZE, _project_text
+
+__all__ = "EventIndex",
+
+_FORMATS = "json", "jsonl", "avro"
+_FIELDS = frozenset(("id", "source", "type", "time"))
+
+# magic, version, size of the indexed file, number of events, size of the metadata
+_HEADER = struct.Struct("<4sB3xQQI")
+_MAGIC = b"SPCI"
+_VERSION = 1
+
+
+class EventIndex:
+
+    __slots__ = "_path", "_format", "_size", "_starts", "_lengths", "_hashes", "_hash_records", "_types", \
+                "_times", "_time_records"
+
+    def __init__(self, path: str, fmt: str, size: int):
+        # use build or load
+        self._path = path
+        self._format = fmt
+        self._size = size
+        # the position and the length of each event in the file, events are numbered in file order
+        self._starts = array("q")
+        self._lengths = array("I")
+        # the sorted hashes of (source, id), and the event of each
+        self._hashes = array("q")
+        self._hash_records = array("I")
+        # type -> the events of the type in order
+        self._types = {}
+        # the sorted times in nanoseconds since the epoch, and the event of each
+        self._times = array("q")
+        self._time_records = array("I")
+
+    path = property(lambda self: self._path)
+    format = property(lambda self: self._format)
+
+    @property
+    def types(self) -> dict:
+        # type -> number of events
+        return {type: len(records) for type, records in self._types.items()}
+
+    def __len__(self):
+        return len(self._starts)
+
+    @classmethod
+    def build(cls, path: str, fmt: str) -> "EventIndex":
+        # Events without a valid time attribute are left out of the time index.
+        _check_format(fmt)
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            index = cls(path, fmt, size)
+            if size == 0:
+                return index
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                if fmt == "avro":
+                    events = _scan_avro(buffer)
+                elif fmt == "jsonl":
+                    events = _scan_lines(buffer)
+                else:
+                    events = _scan_batch(buffer)
+                index._add(events)
+        return index
+
+    def _add(self, events):
+        starts = self._starts
+        lengths = self._lengths
+        types = self._types
+        hashes = []
+        times = []
+        for record, (start, length, attributes) in enumerate(events):
+            starts.append(start)
+            lengths.append(length)
+            source = attributes.get("source")
+            id = attributes.get("id")
+            if isinstance(source, str) and isinstance(id, str):
+                hashes.append((_hash_key(source, id), record))
+            type = attributes.get("type")
+            if isinstance(type, str):
+                records = types.get(type)
+                if records is None:
+                    types[type] = records = array("I")
+                records.append(record)
+            time = attributes.get("time")
+            if time:
+                try:
+                    times.append((parse_rfc3339(time)[1], record))
+                except (TypeError, ValueError):
+                    pass
+        hashes.sort()
+        self._hashes.extend(h for h, _ in hashes)
+        self._hash_records.extend(r for _, r in hashes)
+        times.sort()
+        self._times.extend(t for t, _ in times)
+        self._time_records.extend(r for _, r in times)
+
+    def save(self, path: str):
+        metadata = json.dumps({
+            "format": self._format,
+            "types": [[type, len(records)] for type, records in self._types.items()],
+            "hashes": len(self._hashes),
+            "times": len(self._times),
+        }).encode()
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self._size, len(self._starts), len(metadata)))
+            f.write(metadata)
+            for items in self._arrays() + tuple(self._types.values()):
+                f.write(_little_endian(items).tobytes())
+
+    @classmethod
+    def load(cls, path: str, events_path: str) -> "EventIndex":
+        # Loads an index saved with save for the file of events at events_path.
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("%s is not an event index" % path)
+        magic, version, size, count, metadata_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("%s is not an event index" % path)
+        if os.path.getsize(events_path) != size:
+            raise ValueError("%s changed after it was indexed" % events_path)
+        pos = _HEADER.size + metadata_size
+        metadata = json.loads(data[_HEADER.size:pos].decode())
+        index = cls(events_path, metadata["format"], size)
+        arrays = list(zip(index._arrays(), (count, count, metadata["hashes"], metadata["hashes"],
+                                            metadata["times"], metadata["times"])))
+        for type, n in metadata["types"]:
+            index._types[type] = records = array("I")
+            arrays.append((records, n))
+        for items, n in arrays:
+            end = pos + n * items.itemsize
+            if end > len(data):
+                raise ValueError("%s is truncated" % path)
+            items.frombytes(data[pos:end])
+            if sys.byteorder == "big":
+                items.byteswap()
+            pos = end
+        return index
+
+    def _arrays(self) -> tuple:
+        # in the order they are saved, followed by the events of each type
+        return self._starts, self._lengths, self._hashes, self._hash_records, self._times, self._time_records
+
+    def find(self, source: str, id: str) -> List[CloudEvent]:
+        # Returns the events with the source and id, in file order.
+        key = _hash_key(source, id)
+        hashes = self._hashes
+        i = bisect_left(hashes, key)
+        records = []
+        while i < len(hashes) and hashes[i] == key:
+            records.append(self._hash_records[i])
+            i += 1
+        # a hash may be shared by other events
+        return [event for event in self._read(sorted(records)) if event.source == source and event.id == id]
+
+    def query(self, type: str = None, start: Union[str, datetime, int] = None,
+              end: Union[str, datetime, int] = None) -> Iterator[CloudEvent]:
+        # Yields the events of the type, with a time in [start, end), in file order.
+        # start and end are RFC 3339 strings, datetimes (naive ones are in UTC) or nanoseconds since the epoch.
+        # Events without a time are only yielded if neither start nor end are given.
+        return self._read(self.records(type, start, end))
+
+    def records(self, type: str = None, start: Union[str, datetime, int] = None,
+                end: Union[str, datetime, int] = None) -> List[int]:
+        # Returns the numbers of the events query yields, the events are numbered from 0 in file order.
+        records = None
+        if type is not None:
+            records = self._types.get(type, ())
+        if start is None and end is None:
+            return list(range(len(self._starts)) if records is None else records)
+        times = self._times
+        low = 0 if start is None else bisect_left(times, _epoch_ns(start))
+        high = len(times) if end is None else bisect_left(times, _epoch_ns(end))
+        in_range = self._time_records[low:high]
+        if records is None:
+            return sorted(in_range)
+        if len(in_range) < len(records):
+            in_range, records = records, in_range
+        selected = set(in_range)
+        return sorted(record for record in records if record in selected)
+
+    def _read(self, records: List[int]) -> Iterator[CloudEvent]:
+        if not records:
+            return
+        decode = Avro.decode if self._format == "avro" else Json.decode
+        starts = self._starts
+        lengths = self._lengths
+        with open(self._path, "rb") as f:
+            if f.seek(0, os.SEEK_END) != self._size:
+                raise ValueError("%s changed after it was indexed" % self._path)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for record in records:
+                    start = starts[record]
+                    yield decode(buffer[start:start + lengths[record]])
+
+
+def _scan_avro(buffer) -> Iterator[tuple]:
+    pos = 0
+    end = len(buffer)
+    try:
+        while pos < end:
+            start = pos
+            attributes, pos = read_projected_attributes(buffer, pos, _FIELDS)
+            pos = skip_data(buffer, pos)
+            yield start, pos - start, attributes
+    except IndexError:
+        raise ValueError("Avro.decode: unexpected end of data")
+
+
+def _scan_lines(buffer) -> Iterator[tuple]:
+    find = buffer.find
+    size = len(buffer)
+    pos = 0
+    while pos < size:
+        end = find(b"\n", pos)
+        if end < 0:
+            end = size
+        line = buffer[pos:end]
+        if line and not line.isspace():
+            yield pos, end - pos, _project_text(line, _FIELDS)
+        pos = end + 1
+
+
+def _scan_batch(buffer) -> Iterator[tuple]:
+    # The buffer is scanned in chunks, so only the current events are in memory.
+    # The scanner reports positions in the text, which differ from positions in the UTF-8 data after non-ASCII
+    # characters; those can only be in the events, as whitespace and the separators between them are ASCII.
+    scanner = _BatchScanner(spans=True, fields=_FIELDS)
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    ascii = True
+    # the number of bytes more than characters before the current event
+    extra = 0
+    size = len(buffer)
+    pos = 0
+    while True:
+        chunk = buffer[pos:pos + _CHUNK_SIZE]
+        pos += len(chunk)
+        final = pos == size
+        text = decode(chunk, final)
+        ascii = ascii and len(text) == len(chunk)
+        values = scanner.feed(text)
+        if final:
+            values += scanner.close()
+        for attributes, span, start in values:
+            length = len(span) if ascii else len(span.encode())
+            yield start + extra, length, attributes
+            extra += length - len(span)
+        if final:
+            return
+
+
+def _hash_key(source: str, id: str) -> int:
+    # a stable 64-bit hash, unlike hash() of str
+    digest = blake2b(("%s\0%s" % (source, id)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _epoch_ns(time: Union[str, datetime, int]) -> int:
+    if isinstance(time, int):
+        return time
+    if isinstance(time, datetime):
+        time = format_rfc3339(time)
+    return parse_rfc3339(time)[1]
+
+
+def _little_endian(items: array) -> array:
+    # the index is saved in little endian byte order
+    if sys.byteorder == "big":
+        items = array(items.typecode, items)
+        items.byteswap()
+    return items
+
+
+def _check_format(fmt: str):
+    if fmt not in _FORMATS:
+        raise ValueError("unknown format: %r, it must be one of: %s" % (fmt, ", ".join(_FORMATS)))
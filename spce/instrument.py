@@ -0,0 +1,322 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Codec instrumentation.
+#
+# Each codec class has an observer attribute, which is None by default. When it is set,
+# the encode and decode methods report every call to it:
+#
+#     stats = CodecStats()
+#     Json.observer = stats
+#     Avro.observer = stats
+#     ...
+#     stats.snapshot()  # {"Json.decode": {"calls": 10, "events": 1000, ...}, ...}
+#
+# size is the length of the encoded form: characters for str, bytes otherwise.
+# It is 0 when decoding from a file or a stream, and when encoding to one.
+
+import threading
+from functools import wraps
+from time import perf_counter
+from typing import Iterable, Sized
+
+from .batch import CloudEventBatch
+
+__all__ = "CodecObserver", "CodecStats"
+
+
+class CodecObserver:
+    # Base class of codec observers, its methods do nothing.
+    # codec is the name of the codec class, operation is the name of the method.
+
+    def record(self, codec: str, operation: str, events: int, size: int, seconds: float):
+        pass
+
+    def failed(self, codec: str, operation: str, error: Exception, seconds: float):
+        pass
+
+
+class CodecStats(CodecObserver):
+    # Collects calls, events, bytes, failures and seconds in memory for each codec operation.
+
+    _FIELDS = "calls", "events", "bytes", "failures", "seconds"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, codec: str, operation: str, events: int, size: int, seconds: float):
+        with self._lock:
+            stats = self._get("%s.%s" % (codec, operation))
+            stats["calls"] += 1
+            stats["events"] += events
+            stats["bytes"] += size
+            stats["seconds"] += seconds
+
+    def failed(self, codec: str, operation: str, error: Exception, seconds: float):
+        with self._lock:
+            stats = self._get("%s.%s" % (codec, operation))
+            stats["calls"] += 1
+            stats["failures"] += 1
+            stats["seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        # Returns a copy of the stats: {"Codec.operation": {"calls": ..., "events": ..., ...}}
+        with self._lock:
+            return {key: dict(stats) for key, stats in self._stats.items()}
+
+    def reset(self) -> dict:
+        # Clears the stats, and returns them as they were before.
+        with self._lock:
+            stats, self._stats = self._stats, {}
+        return stats
+
+    def _get(self, key: str) -> dict:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = dict.fromkeys(self._FIELDS, 0)
+        return stats
+
+
+def instrumented_encoder(func):
+    # Decorates an encoding classmethod whose first argument is an event or an iterable of events.
+    # Iterables without a length are counted as the method consumes them.
+    operation = func.__name__
+
+    @wraps(func)
+    def encode(cls, events, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return func(cls, events, *args, **kwargs)
+        events, count = _count(events)
+        start = perf_counter()
+        try:
+            encoded = func(cls, events, *args, **kwargs)
+        except Exception as e:
+            observer.failed(cls.__name__, operation, e, perf_counter() - start)
+            raise
+        seconds = perf_counter() - start
+        observer.record(cls.__name__, operation, count(), _size(encoded), seconds)
+        return encoded
+
+    return encode
+
+
+def instrumented_iter_encoder(func):
+    # Decorates an encoding classmethod which returns an iterator of encoded chunks.
+    # Only the time spent producing the chunks is counted, and the call is recorded when the iterator is exhausted.
+    operation = func.__name__
+
+    @wraps(func)
+    def encode(cls, events, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return func(cls, events, *args, **kwargs)
+        events, count = _count(events)
+        return _observe_chunks(observer, cls.__name__, operation, func(cls, events, *args, **kwargs), count)
+
+    return encode
+
+
+def instrumented_async_encoder(func):
+    # Decorates an encoding coroutine classmethod which writes the events to a stream.
+    operation = func.__name__
+
+    @wraps(func)
+    async def encode(cls, events, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return await func(cls, events, *args, **kwargs)
+        events, count = _count(events)
+        start = perf_counter()
+        try:
+            result = await func(cls, events, *args, **kwargs)
+        except Exception as e:
+            observer.failed(cls.__name__, operation, e, perf_counter() - start)
+            raise
+        observer.record(cls.__name__, operation, count(), 0, perf_counter() - start)
+        return result
+
+    return encode
+
+
+def instrumented_decoder(func):
+    # Decorates a decoding classmethod whose first argument is the encoded form,
+    # and which returns an event (or a dict), a list of them or a CloudEventBatch.
+    operation = func.__name__
+
+    @wraps(func)
+    def decode(cls, data, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return func(cls, data, *args, **kwargs)
+        start = perf_counter()
+        try:
+            decoded = func(cls, data, *args, **kwargs)
+        except Exception as e:
+            observer.failed(cls.__name__, operation, e, perf_counter() - start)
+            raise
+        seconds = perf_counter() - start
+        count = len(decoded) if isinstance(decoded, (list, CloudEventBatch)) else 1
+        observer.record(cls.__name__, operation, count, _size(data), seconds)
+        return decoded
+
+    return decode
+
+
+def instrumented_iter_decoder(func):
+    # Decorates a decoding classmethod which returns an iterator of events.
+    # Only the time spent producing the events is counted, and the call is recorded when the iterator is exhausted.
+    operation = func.__name__
+
+    @wraps(func)
+    def decode(cls, data, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return func(cls, data, *args, **kwargs)
+        return _observe_iter(observer, cls.__name__, operation, func(cls, data, *args, **kwargs), _size(data))
+
+    return decode
+
+
+def instrumented_file_decoder(func):
+    # Decorates a decoding classmethod whose first argument is the path of a file,
+    # and which returns a list of events, or an iterator of them like the ones of instrumented_iter_decoder.
+    operation = func.__name__
+
+    @wraps(func)
+    def decode(cls, path, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return func(cls, path, *args, **kwargs)
+        start = perf_counter()
+        try:
+            decoded = func(cls, path, *args, **kwargs)
+        except Exception as e:
+            observer.failed(cls.__name__, operation, e, perf_counter() - start)
+            raise
+        if isinstance(decoded, list):
+            observer.record(cls.__name__, operation, len(decoded), 0, perf_counter() - start)
+            return decoded
+        return _observe_iter(observer, cls.__name__, operation, decoded, 0)
+
+    return decode
+
+
+def instrumented_async_iter_decoder(func):
+    # Decorates a decoding classmethod which returns an async iterator of events read from a stream.
+    operation = func.__name__
+
+    @wraps(func)
+    def decode(cls, reader, *args, **kwargs):
+        observer = cls.observer
+        if observer is None:
+            return func(cls, reader, *args, **kwargs)
+        return _observe_async_iter(observer, cls.__name__, operation, func(cls, reader, *args, **kwargs))
+
+    return decode
+
+
+def _observe_iter(observer: CodecObserver, codec: str, operation: str, events, size: int):
+    count = 0
+    seconds = 0.0
+    next_event = iter(events).__next__
+    while True:
+        start = perf_counter()
+        try:
+            event = next_event()
+        except StopIteration:
+            break
+        except Exception as e:
+            observer.failed(codec, operation, e, seconds + perf_counter() - start)
+            raise
+        seconds += perf_counter() - start
+        count += 1
+        yield event
+    observer.record(codec, operation, count, size, seconds + perf_counter() - start)
+
+
+async def _observe_async_iter(observer: CodecObserver, codec: str, operation: str, events):
+    count = 0
+    seconds = 0.0
+    next_event = events.__anext__
+    while True:
+        start = perf_counter()
+        try:
+            event = await next_event()
+        except StopAsyncIteration:
+            break
+        except Exception as e:
+            observer.failed(codec, operation, e, seconds + perf_counter() - start)
+            raise
+        seconds += perf_counter() - start
+        count += 1
+        yield event
+    observer.record(codec, operation, count, 0, seconds + perf_counter() - start)
+
+
+def _observe_chunks(observer: CodecObserver, codec: str, operation: str, chunks, count):
+    size = 0
+    seconds = 0.0
+    next_chunk = iter(chunks).__next__
+    while True:
+        start = perf_counter()
+        try:
+            chunk = next_chunk()
+        except StopIteration:
+            break
+        except Exception as e:
+            observer.failed(codec, operation, e, seconds + perf_counter() - start)
+            raise
+        seconds += perf_counter() - start
+        size += len(chunk)
+        yield chunk
+    observer.record(codec, operation, count(), size, seconds + perf_counter() - start)
+
+
+def _count(events):
+    # Returns the events, and a function which returns the number of events.
+    # Iterables without a length are wrapped to be counted while they are consumed, rather than read into a list.
+    if not isinstance(events, Iterable):
+        return events, lambda: 1
+    if isinstance(events, Sized):
+        return events, lambda count=len(events): count
+    counted = _CountedEvents(events)
+    return counted, lambda: counted.count
+
+
+class _CountedEvents:
+
+    __slots__ = "_next", "count"
+
+    def __init__(self, events: Iterable):
+        self._next = iter(events).__next__
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self._next()
+        self.count += 1
+        return event
+
+
+def _size(value) -> int:
+    if isinstance(value, (str, bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, list):
+        # the memoryviews returned by Avro.encode_views
+        return sum(len(v) for v in value)
+    return 0
@@ -0,0 +1,82 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Interning of attribute names and values across decoded events.
+#
+# The decoders create new strings for the attribute names and values of each event,
+# although most events of a batch or a stream share their type, source, specversion, etc.
+# Pass intern=True to the decoders of the Json, JsonLines and Avro codecs to share them within a call,
+# or an InternTable to share them across calls.
+#
+# The table keeps the values of each attribute separately, and clears the values of an attribute
+# when they reach max_values, so the unique values of an attribute like id don't evict the values of the others.
+
+from typing import Optional
+
+__all__ = "InternTable",
+
+
+class InternTable:
+
+    __slots__ = "_tables", "_max_values", "_max_names"
+
+    def __init__(self, max_values=1024, max_names=1024):
+        # attribute name -> (the shared name, {value: the shared value})
+        self._tables = {}
+        self._max_values = max_values
+        self._max_names = max_names
+
+    def __len__(self):
+        # the number of strings in the table
+        return sum(len(values) + 1 for _, values in self._tables.values())
+
+    def attributes(self, attributes: dict) -> dict:
+        # Returns the attributes with shared names and string values.
+        tables = self._tables
+        max_values = self._max_values
+        interned = {}
+        for name, value in attributes.items():
+            table = tables.get(name)
+            if table is None:
+                table = self._add_name(name)
+            name, values = table
+            if type(value) is str:
+                shared = values.setdefault(value, value)
+                if shared is value and len(values) > max_values:
+                    values.clear()
+                    values[value] = value
+                value = shared
+            interned[name] = value
+        return interned
+
+    def clear(self):
+        self._tables.clear()
+
+    def _add_name(self, name: str) -> tuple:
+        table = name, {}
+        if len(self._tables) < self._max_names:
+            self._tables[name] = table
+        return table
+
+
+def get_intern_table(intern) -> Optional[InternTable]:
+    # Returns the table for the intern argument of the decoders: an InternTable, True for a new one,
+    # or None for no interning.
+    if isinstance(intern, InternTable):
+        return intern
+    if not intern:
+        return None
+    if intern is True:
+        return InternTable()
+    raise TypeError("intern must be either a bool or an InternTable, but it is: %s" % type(intern))
@@ -12,52 +12,798 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import codecs
+import io
 import json
+import mmap
+import re
 from base64 import b64encode, b64decode
-from typing import Union, Iterable
+from functools import partial
+from itertools import islice
+from typing import Union, Iterable, Iterator, Optional, Tuple
 
-from .cloudevents import CloudEvent
+from .batch import CloudEventBatch, _encode_data
+from .cloudevents import CloudEvent, LazyCloudEvent, _adopt, _cache_encoding, _normalize
+from .instrument import instrumented_async_encoder, instrumented_async_iter_decoder, instrumented_decoder, \
+    instrumented_encoder, instrumented_file_decoder, instrumented_iter_decoder, instrumented_iter_encoder
+from .interning import InternTable, get_intern_table
+from .validation import get_validator, validate_decoded
 
-__all__ = "Json",
+__all__ = "Json", "JsonLines"
+
+_CHUNK_SIZE = 64 * 1024
+# decode_batch fills the columns with the events of this much text at a time
+_BATCH_CHUNK_SIZE = 1024 * 1024
 
 
 class Json:
 
     _ENCODER = json.JSONEncoder()
 
+    # see spce.instrument
+    observer = None
+
     @classmethod
+    @instrumented_encoder
     def encode(cls, event: Union[CloudEvent, Iterable[CloudEvent]]) -> str:
+        return cls._encode(event)
+
+    @classmethod
+    def _encode(cls, event) -> str:
         if isinstance(event, Iterable):
-            encoded = [cls.encode(e) for e in event]
+            encoded = [cls._encode(e) for e in event]
             return "[%s]" % ",".join(encoded)
         elif isinstance(event, CloudEvent):
-            kvs = []
-            encoder = cls._ENCODER
-            for attr, value in event._attributes.items():
-                if value:
-                    kvs.append('"%s":%s' % (attr, encoder.encode(value)))
-            if event._data:
-                if event._has_binary_data:
-                    kvs.append('"data_base64":%s' % encoder.encode(b64encode(event._data).decode()))
-                else:
-                    kvs.append('"data":%s' % encoder.encode(event._data))
-            return "{%s}" % ",".join(kvs)
+            return cls._encode_event(event)
         else:
             raise TypeError("JSON.encode cannot encode %s" % type(event))
 
     @classmethod
-    def decode(cls, text: str) -> Union[CloudEvent, Iterable[CloudEvent]]:
+    @instrumented_iter_encoder
+    def iter_encode(cls, events: Iterable[CloudEvent], chunk_size=_CHUNK_SIZE) -> Iterator[str]:
+        # Yields the batch array in chunks of about chunk_size characters;
+        # events are pulled from the iterable only when the next chunk is needed.
+        return cls._iter_encode(events, chunk_size)
+
+    @classmethod
+    def _iter_encode(cls, events: Iterable[CloudEvent], chunk_size: int) -> Iterator[str]:
+        parts = ["["]
+        size = 1
+        sep = ""
+        for event in events:
+            if not isinstance(event, CloudEvent):
+                raise TypeError("JSON.encode cannot encode %s" % type(event))
+            encoded = cls._encode_event(event)
+            parts.append(sep)
+            parts.append(encoded)
+            size += len(encoded) + 1
+            sep = ","
+            if size >= chunk_size:
+                yield "".join(parts)
+                parts = []
+                size = 0
+        parts.append("]")
+        yield "".join(parts)
+
+    @classmethod
+    @instrumented_encoder
+    def encode_to(cls, events: Iterable[CloudEvent], fp, chunk_size=_CHUNK_SIZE):
+        # fp may be a text or a binary file object; UTF-8 is used for the latter.
+        write = fp.write
+        if isinstance(fp, io.TextIOBase):
+            for chunk in cls._iter_encode(events, chunk_size):
+                write(chunk)
+        else:
+            for chunk in cls._iter_encode(events, chunk_size):
+                write(chunk.encode())
+
+    @classmethod
+    @instrumented_async_encoder
+    async def aencode_to(cls, events: Iterable[CloudEvent], writer, chunk_size=_CHUNK_SIZE):
+        # writer is an asyncio.StreamWriter, the encoded batch is written in chunks,
+        # waiting for the transport to drain after each one.
+        for chunk in cls._iter_encode(events, chunk_size):
+            writer.write(chunk.encode())
+            await writer.drain()
+
+    @classmethod
+    def _encode_event(cls, event: CloudEvent) -> str:
+        if type(event) is LazyCloudEvent and event._codec is Json:
+            return event._encoded
+        encodings = event._encodings
+        if encodings is None:
+            return cls._render_event(event)
+        encoded = encodings.get(Json)
+        if encoded is None:
+            encoded = encodings[Json] = cls._render_event(event)
+        return encoded
+
+    @classmethod
+    def _render_event(cls, event: CloudEvent) -> str:
+        kvs = []
+        encoder = cls._ENCODER
+        for attr, value in event._attributes.items():
+            if value:
+                kvs.append('"%s":%s' % (attr, encoder.encode(value)))
+        if event._data:
+            if event._has_binary_data:
+                kvs.append('"data_base64":%s' % encoder.encode(b64encode(event._data).decode()))
+            else:
+                kvs.append('"data":%s' % encoder.encode(event._data))
+        return "{%s}" % ",".join(kvs)
+
+    @classmethod
+    @instrumented_decoder
+    def decode(cls, text: str, lazy=False, fields: Iterable[str] = None,
+               validate=False, intern=False, cache_encoding=False) -> Union[CloudEvent, Iterable[CloudEvent]]:
+        # With fields, dicts of only those attributes are returned instead of events,
+        # and the data is not decoded if it can be skipped, see _project_object. It cannot be used with lazy.
+        # With validate=True or a Validator, ValidationError is raised for invalid events, see spce.validation.
+        # With intern=True or an InternTable, the events share equal attribute names and values, see spce.interning.
+        # With cache_encoding=True, the encoding cache of the events is enabled with their original text,
+        # see CloudEvent.enable_encoding_cache.
+        validator = get_validator(validate, fields)
+        if fields is not None:
+            _check_projection(lazy)
+            return cls._decode_projected(text, tuple(fields))
+        table = get_intern_table(intern)
+        if lazy or cache_encoding:
+            decoded = cls._decode_spans(text, cls._span_event_maker(lazy, table, cache_encoding))
+        else:
+            decoded = cls._decode_eager(text, table)
+        if validator is not None:
+            validate_decoded(decoded, validator)
+        return decoded
+
+    @classmethod
+    def _decode_eager(cls, text: str, table: InternTable = None) -> Union[CloudEvent, Iterable[CloudEvent]]:
         d = json.loads(text)
+        make_event = cls._make_event if table is None else cls._interning_event_maker(table)
         if isinstance(d, dict):
-            return CloudEvent(**cls._normalize_data(d))
+            return make_event(d)
         elif isinstance(d, Iterable):
-            return [CloudEvent(**cls._normalize_data(it)) for it in d]
+            return [make_event(it) for it in d]
         else:
             raise TypeError("JSON.decode cannot decode %s" % type(d))
 
     @classmethod
-    def _normalize_data(cls, d: dict) -> dict:
+    @instrumented_decoder
+    def decode_batch(cls, text: str) -> CloudEventBatch:
+        # Decodes a batch, or a single event, into a CloudEventBatch without creating CloudEvent objects.
+        # The columns of a long text are filled with the events of each chunk as the scanner reads them.
+        if not isinstance(text, str):
+            text = bytes(text).decode()
+        batch = CloudEventBatch()
+        if len(text) <= _BATCH_CHUNK_SIZE:
+            d = json.loads(text)
+            if isinstance(d, dict):
+                d = [d]
+            elif not isinstance(d, list):
+                raise TypeError("JSON.decode cannot decode %s" % type(d))
+            _extend_batch(batch, d)
+            return batch
+        scanner = _BatchScanner()
+        for pos in range(0, len(text), _BATCH_CHUNK_SIZE):
+            _extend_batch(batch, scanner.feed(text[pos:pos + _BATCH_CHUNK_SIZE]))
+        _extend_batch(batch, scanner.close())
+        # without the room the payload was over-allocated by while it grew chunk by chunk
+        batch._payload = bytearray(batch._payload)
+        return batch
+
+    @classmethod
+    @instrumented_iter_decoder
+    def iter_decode(cls, source, chunk_size=_CHUNK_SIZE, fields: Iterable[str] = None,
+                    validate=False, intern=False) -> Iterator[CloudEvent]:
+        # source is a text or binary file object, or an iterable of str/bytes chunks.
+        # Events are yielded as soon as their closing brace is read,
+        # so only the current event and the unread tail of the last chunk are kept in memory.
+        make_event = cls._event_maker(fields, validate, intern)
+        scanner = _BatchScanner(fields=None if fields is None else tuple(fields))
+        for chunk in _iter_text_chunks(source, chunk_size):
+            for d in scanner.feed(chunk):
+                yield make_event(d)
+        for d in scanner.close():
+            yield make_event(d)
+
+    @classmethod
+    @instrumented_async_iter_decoder
+    async def aiter_decode(cls, reader, chunk_size=_CHUNK_SIZE, fields: Iterable[str] = None, validate=False,
+                           intern=False):
+        # Async version of iter_decode for an asyncio.StreamReader:
+        # async for event in Json.aiter_decode(reader)
+        make_event = cls._event_maker(fields, validate, intern)
+        scanner = _BatchScanner(fields=None if fields is None else tuple(fields))
+        decode = codecs.getincrementaldecoder("utf-8")().decode
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk:
+                break
+            for d in scanner.feed(decode(chunk)):
+                yield make_event(d)
+        for d in scanner.feed(decode(b"", True)) + scanner.close():
+            yield make_event(d)
+
+    @classmethod
+    def _event_maker(cls, fields: Iterable[str], validate, intern=False):
+        # Returns a function that makes an event from a parsed JSON object,
+        # or which returns the dict of fields the scanner projected the object to.
+        validator = get_validator(validate, fields)
+        if fields is not None:
+            return lambda d: d
+        table = get_intern_table(intern)
+        make_event = cls._make_event if table is None else cls._interning_event_maker(table)
+        if validator is None:
+            return make_event
+        validate_event = validator.validate
+        return lambda d: validate_event(make_event(d))
+
+    @classmethod
+    def _make_event(cls, d) -> CloudEvent:
+        if not isinstance(d, dict):
+            raise TypeError("JSON.decode cannot decode %s" % type(d))
+        data = d.pop("data", None)
         if "data_base64" in d:
-            d["data"] = b64decode(d["data_base64"])
-            del d["data_base64"]
-        return d
+            data = b64decode(d.pop("data_base64"))
+        return _adopt(d, data)
+
+    @classmethod
+    def _interning_event_maker(cls, table: InternTable):
+        # Like _make_event, but the attributes are interned; the data is taken out first, so it is not.
+        intern_attributes = table.attributes
+
+        def make_event(d) -> CloudEvent:
+            if not isinstance(d, dict):
+                raise TypeError("JSON.decode cannot decode %s" % type(d))
+            data = d.pop("data", "")
+            if "data_base64" in d:
+                data = b64decode(d.pop("data_base64"))
+            return _adopt(intern_attributes(d), data)
+
+        return make_event
+
+    @classmethod
+    def _decode_projected(cls, text: str, fields: tuple) -> Union[dict, Iterable[dict]]:
+        if not isinstance(text, str):
+            text = bytes(text).decode()
+        pos = _WHITESPACE.match(text).end()
+        if text[pos:pos + 1] == "[":
+            pos = _WHITESPACE.match(text, pos + 1).end()
+        if text.find("}", pos) - pos < _SKIPPED_DATA_SIZE:
+            # the data of the first event is short if there is any, see _project_object
+            return cls._project(json.loads(text), fields)
+        scanner = _BatchScanner(fields=fields)
+        values = scanner.feed(text) + scanner.close()
+        if scanner.is_batch:
+            return values
+        return values[0]
+
+    @classmethod
+    def _project(cls, d, fields: tuple) -> Union[dict, Iterable[dict]]:
+        if isinstance(d, dict):
+            return cls._project_event(d, fields)
+        elif isinstance(d, list):
+            return [cls._project_event(it, fields) for it in d]
+        else:
+            raise TypeError("JSON.decode cannot decode %s" % type(d))
+
+    @classmethod
+    def _project_event(cls, d, fields: tuple) -> dict:
+        if not isinstance(d, dict):
+            raise TypeError("JSON.decode cannot decode %s" % type(d))
+        return {name: d[name] for name in fields if name in d}
+
+    @classmethod
+    def _decode_spans(cls, text: str, make_event) -> Union[CloudEvent, Iterable[CloudEvent]]:
+        # Decodes the events with make_event(parsed object, text of the object).
+        if not isinstance(text, str):
+            text = bytes(text).decode()
+        scanner = _BatchScanner(spans=True)
+        events = [make_event(d, span) for d, span, _ in scanner.feed(text) + scanner.close()]
+        if scanner.is_batch:
+            return events
+        return events[0]
+
+    @classmethod
+    def _span_event_maker(cls, lazy: bool, table: InternTable, cache_encoding: bool):
+        # Returns a function that makes an event from a parsed JSON object and its text.
+        make_json_event = cls._make_event if table is None else cls._interning_event_maker(table)
+        make_lazy_event = cls._make_lazy_event if table is None else partial(cls._make_lazy_event, table=table)
+        make_event = make_lazy_event if lazy else lambda d, encoded: make_json_event(d)
+        if not cache_encoding:
+            return make_event
+        return lambda d, encoded: _cache_encoding(make_event(d, encoded), Json, encoded)
+
+    @classmethod
+    def _make_lazy_event(cls, d, encoded: str, table: InternTable = None) -> CloudEvent:
+        if not isinstance(d, dict):
+            raise TypeError("JSON.decode cannot decode %s" % type(d))
+        if "data_base64" in d:
+            pending = True, d.pop("data_base64")
+        else:
+            pending = False, d.pop("data", None)
+        if table is not None:
+            d = table.attributes(d)
+        return LazyCloudEvent(_normalize(d), Json, encoded, pending)
+
+    @classmethod
+    def _load_data(cls, encoded: str, pending):
+        is_base64, value = pending
+        return b64decode(value) if is_base64 else value
+
+
+class JsonLines:
+    # Newline delimited JSON: one structured mode event per line.
+    # Blank lines are skipped, but they are counted for the start/stop line ranges.
+
+    # see spce.instrument
+    observer = None
+
+    @classmethod
+    @instrumented_encoder
+    def encode(cls, events: Iterable[CloudEvent]) -> str:
+        return "".join(cls._encode_line(e) for e in events)
+
+    @classmethod
+    @instrumented_encoder
+    def encode_to(cls, events: Iterable[CloudEvent], fp):
+        write = fp.write
+        if isinstance(fp, io.TextIOBase):
+            for event in events:
+                write(cls._encode_line(event))
+        else:
+            for event in events:
+                write(cls._encode_line(event).encode())
+
+    @classmethod
+    @instrumented_iter_encoder
+    def iter_encode(cls, events: Iterable[CloudEvent], chunk_size=_CHUNK_SIZE) -> Iterator[str]:
+        # Yields the lines in chunks of about chunk_size characters;
+        # events are pulled from the iterable only when the next chunk is needed.
+        return cls._iter_encode(events, chunk_size)
+
+    @classmethod
+    def _iter_encode(cls, events: Iterable[CloudEvent], chunk_size: int) -> Iterator[str]:
+        lines = []
+        size = 0
+        for event in events:
+            line = cls._encode_line(event)
+            lines.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield "".join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield "".join(lines)
+
+    @classmethod
+    @instrumented_async_encoder
+    async def aencode_to(cls, events: Iterable[CloudEvent], writer, chunk_size=_CHUNK_SIZE):
+        # writer is an asyncio.StreamWriter; lines are written in chunks of about chunk_size bytes,
+        # waiting for the transport to drain after each one.
+        for chunk in cls._iter_encode(events, chunk_size):
+            writer.write(chunk.encode())
+            await writer.drain()
+
+    @classmethod
+    @instrumented_decoder
+    def decode(cls, text: Union[str, bytes], start=0, stop=None, lazy=False,
+               fields: Iterable[str] = None, validate=False, intern=False,
+               cache_encoding=False) -> Iterable[CloudEvent]:
+        return list(cls._iter_decode(text, start, stop, lazy, fields, validate, intern, cache_encoding))
+
+    @classmethod
+    @instrumented_iter_decoder
+    def iter_decode(cls, source, start=0, stop=None, lazy=False, fields: Iterable[str] = None,
+                    validate=False, intern=False, cache_encoding=False) -> Iterator[CloudEvent]:
+        # source is a str/bytes, a text or binary file object, or an iterable of str/bytes chunks.
+        # With cache_encoding=True, the encoding cache of the events is enabled with their original line,
+        # see CloudEvent.enable_encoding_cache.
+        return cls._iter_decode(source, start, stop, lazy, fields, validate, intern, cache_encoding)
+
+    @classmethod
+    def _iter_decode(cls, source, start, stop, lazy, fields, validate, intern,
+                     cache_encoding) -> Iterator[CloudEvent]:
+        make_event = cls._event_maker(lazy, fields, validate, intern, cache_encoding)
+        for line in islice(_iter_lines(source), start, stop):
+            if line and not line.isspace():
+                yield make_event(line)
+
+    @classmethod
+    @instrumented_async_iter_decoder
+    async def aiter_decode(cls, reader, chunk_size=_CHUNK_SIZE, lazy=False, fields: Iterable[str] = None,
+                           validate=False, intern=False, cache_encoding=False):
+        # Async version of iter_decode for an asyncio.StreamReader.
+        # The stream is read in chunks instead of with readline, so lines are not limited by the reader's buffer limit.
+        make_event = cls._event_maker(lazy, fields, validate, intern, cache_encoding)
+        tail = b""
+        while True:
+            # read at least as much as the pending bytes, so a long line is not copied many times
+            chunk = await reader.read(max(chunk_size, len(tail)))
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                if line and not line.isspace():
+                    yield make_event(line)
+        if tail and not tail.isspace():
+            yield make_event(tail)
+
+    @classmethod
+    @instrumented_file_decoder
+    def iter_decode_file(cls, path, start=0, stop=None, lazy=False, fields: Iterable[str] = None,
+                         validate=False, intern=False, cache_encoding=False) -> Iterator[CloudEvent]:
+        # Memory maps the file, so only the lines in [start, stop) are read from it.
+        return cls._iter_decode_file(path, start, stop, lazy, fields, validate, intern, cache_encoding)
+
+    @classmethod
+    def _iter_decode_file(cls, path, start, stop, lazy, fields, validate, intern,
+                          cache_encoding) -> Iterator[CloudEvent]:
+        make_event = cls._event_maker(lazy, fields, validate, intern, cache_encoding)
+        with open(path, "rb") as f:
+            if f.seek(0, io.SEEK_END) == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                find = mm.find
+                size = len(mm)
+                pos = 0
+                line_no = 0
+                while line_no < start and pos < size:
+                    pos = find(b"\n", pos) + 1 or size
+                    line_no += 1
+                while pos < size and (stop is None or line_no < stop):
+                    end = find(b"\n", pos)
+                    if end < 0:
+                        end = size
+                    line = mm[pos:end]
+                    if line and not line.isspace():
+                        yield make_event(line)
+                    pos = end + 1
+                    line_no += 1
+
+    @classmethod
+    @instrumented_file_decoder
+    def decode_file(cls, path, start=0, stop=None, lazy=False, fields: Iterable[str] = None,
+                    validate=False, intern=False, cache_encoding=False) -> Iterable[CloudEvent]:
+        return list(cls._iter_decode_file(path, start, stop, lazy, fields, validate, intern, cache_encoding))
+
+    @classmethod
+    def _encode_line(cls, event: CloudEvent) -> str:
+        if not isinstance(event, CloudEvent):
+            raise TypeError("JSON.encode cannot encode %s" % type(event))
+        encoded = Json._encode_event(event)
+        if "\n" in encoded:
+            # the original encoding of a lazy event may span lines
+            encoded = Json._render_event(event)
+        return "%s\n" % encoded
+
+    @classmethod
+    def _event_maker(cls, lazy: bool, fields: Iterable[str], validate, intern=False, cache_encoding=False):
+        # Returns a function that makes an event (or a dict of fields) from a line.
+        validator = get_validator(validate, fields)
+        if fields is not None:
+            _check_projection(lazy)
+            fields = tuple(fields)
+            return lambda line: _project_text(line, fields)
+        loads = json.loads
+        table = get_intern_table(intern)
+        if lazy or cache_encoding:
+            make_span_event = Json._span_event_maker(lazy, table, cache_encoding)
+
+            def make_event(line) -> CloudEvent:
+                return make_span_event(loads(line), _line_text(line))
+        else:
+            make_json_event = Json._make_event if table is None else Json._interning_event_maker(table)
+
+            def make_event(line) -> CloudEvent:
+                return make_json_event(loads(line))
+        if validator is None:
+            return make_event
+        validate_event = validator.validate
+        return lambda line: validate_event(make_event(line))
+
+
+def _line_text(line) -> str:
+    if not isinstance(line, str):
+        line = line.decode()
+    return line.strip()
+
+
+def _iter_lines(source):
+    if isinstance(source, memoryview):
+        source = source.tobytes()
+    if isinstance(source, str):
+        return iter(source.split("\n"))
+    if isinstance(source, (bytes, bytearray)):
+        return iter(source.split(b"\n"))
+    if hasattr(source, "read"):
+        # file objects are iterated line by line natively
+        return iter(source)
+    return _split_chunks(source)
+
+
+def _split_chunks(chunks):
+    tail = None
+    for chunk in chunks:
+        if tail:
+            chunk = tail + chunk
+        lines = chunk.split(b"\n" if isinstance(chunk, (bytes, bytearray)) else "\n")
+        tail = lines.pop()
+        yield from lines
+    if tail:
+        yield tail
+
+
+def _extend_batch(batch: CloudEventBatch, rows: list):
+    if not rows:
+        return
+    data = []
+    for it in rows:
+        if not isinstance(it, dict):
+            raise TypeError("JSON.decode cannot decode %s" % type(it))
+        value = it.pop("data", None)
+        if "data_base64" in it:
+            value = b64decode(it.pop("data_base64"))
+        data.append(_encode_data(value))
+    batch._extend(rows, data, normalize=True)
+
+
+def _iter_text_chunks(source, chunk_size):
+    if isinstance(source, (str, bytes, bytearray, memoryview)):
+        chunks = source,
+    elif hasattr(source, "read"):
+        chunks = iter(lambda: source.read(chunk_size), source.read(0))
+    else:
+        chunks = source
+    decoder = None
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            yield chunk
+            continue
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+        yield decoder.decode(chunk)
+    if decoder is not None:
+        yield decoder.decode(b"", True)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# a comma between values, and the whitespace around it
+_SEPARATOR = re.compile(r"[ \t\n\r]*,[ \t\n\r]*")
+# what can follow the last value of a group, see _parse_group
+_GROUP_END = re.compile(r"[ \t\n\r]*[,\]]")
+
+# the key of the data of an event whose value is a string: text or base64,
+# after the start of the object or a comma, so that it is not a string value
+_DATA_KEY = re.compile(r'[{,][ \t\n\r]*("data(?:_base64)?")[ \t\n\r]*:[ \t\n\r]*"')
+# the JSON parser reads short strings faster than they can be skipped,
+# so the data of a projected event is only skipped if the event can be at least this long
+_SKIPPED_DATA_SIZE = 4096
+
+
+def _check_projection(lazy: bool):
+    if lazy:
+        raise ValueError("lazy cannot be used with fields")
+
+
+def _project_text(text: Union[str, bytes], fields: tuple) -> dict:
+    # Projects the JSON object which is the whole text.
+    if len(text) < _SKIPPED_DATA_SIZE:
+        return Json._project_event(json.loads(text), fields)
+    if not isinstance(text, str):
+        text = text.decode()
+    pos = _WHITESPACE.match(text).end()
+    d, pos = _project_object(text, pos, fields)
+    if _WHITESPACE.match(text, pos).end() != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+    return d
+
+
+def _project_object(text: str, pos: int, fields: tuple) -> Tuple[dict, int]:
+    # Returns the fields of the JSON object at pos, and the position after the object.
+    # Like with Avro, the data is skipped without being decoded or checked, if it is a string (text or base64)
+    # after the attributes, as Json.encode writes it, and it is long; other objects are parsed as a whole.
+    if "data" not in fields and "data_base64" not in fields:
+        parsed = _parse_attributes(text, pos)
+        if parsed is not None:
+            return Json._project_event(parsed[0], fields), parsed[1]
+    d, end = _BatchScanner._DECODER.raw_decode(text, pos)
+    return Json._project_event(d, fields), end
+
+
+def _parse_attributes(text: str, pos: int) -> Optional[Tuple[dict, int]]:
+    # Parses the members of the object at pos which come before its data, and returns them with the end of the object,
+    # if the data is a long string which is the last member, and the members before it are not objects or arrays.
+    # Returns None otherwise.
+    if text[pos:pos + 1] != "{":
+        return None
+    find = text.find
+    close = find("}", pos)
+    if close - pos < _SKIPPED_DATA_SIZE:
+        return None
+    m = _DATA_KEY.search(text, pos, close)
+    if m is None:
+        return None
+    key = m.start(1)
+    if find("{", pos + 1, key) >= 0 or find("[", pos, key) >= 0:
+        return None
+    # the closing quote, escaped quotes are left to the JSON parser
+    end = find('"', m.end()) + 1
+    if not end or text[end - 2] == "\\":
+        return None
+    end = _WHITESPACE.match(text, end).end()
+    if text[end:end + 1] != "}":
+        return None
+    head = text[pos:key].rstrip(" \t\n\r")
+    try:
+        return json.loads(head[:-1] + "}" if head[-1] == "," else head + "}"), end + 1
+    except ValueError:
+        # the caller parses the whole object, which reports the error at its position in text
+        return None
+
+
+def _parse_group(text: str, pos: int, end: int) -> Optional[Tuple[list, int]]:
+    # Parses the complete values of a batch from pos with a single call, so that like with json.loads,
+    # the values share the strings of their keys, which is faster to parse and to look up than a new string per value.
+    # Returns the values and the position after them, or None if they are not found.
+    # The values end at the last "}" before end which is followed by a comma or "]". If that "}" is inside a string
+    # or a nested value, the group is not valid JSON: the string is not terminated, or the brackets don't match.
+    rfind = text.rfind
+    match_end = _GROUP_END.match
+    close = rfind("}", pos, end)
+    while close >= 0 and match_end(text, close + 1, end) is None:
+        close = rfind("}", pos, close)
+    if close < 0:
+        return None
+    try:
+        return json.loads("[%s]" % text[pos:close + 1]), close + 1
+    except ValueError:
+        return None
+
+
+class _BatchScanner:
+    # Splits a JSON batch into its top-level values while the text arrives in chunks.
+    # A single JSON object is accepted as well and produces one value.
+
+    __slots__ = "_buf", "_pos", "_offset", "_pending", "_pending_size", "_need", "_state", "_spans", "_fields", \
+                "is_batch"
+
+    _START, _FIRST, _VALUE, _SINGLE, _SEPARATOR, _DONE = range(6)
+
+    _DECODER = json.JSONDecoder()
+
+    def __init__(self, spans=False, fields: tuple = None):
+        # with spans, (value, text of the value, position of the value in the whole text) are returned instead of values,
+        # with fields, the values are dicts of those fields, see _project_object
+        self._spans = spans
+        self._fields = fields
+        self.is_batch = False
+        self._buf = ""
+        self._pos = 0
+        # the position of _buf in the whole text
+        self._offset = 0
+        self._pending = []
+        self._pending_size = 0
+        self._need = 0
+        self._state = self._START
+
+    def feed(self, text: str) -> list:
+        if text:
+            self._pending.append(text)
+            self._pending_size += len(text)
+        if len(self._buf) - self._pos + self._pending_size < self._need:
+            return []
+        self._flush()
+        return self._scan(False)
+
+    def close(self) -> list:
+        self._flush()
+        values = self._scan(True)
+        if self._state != self._DONE:
+            raise json.JSONDecodeError("Unexpected end of batch", self._buf, self._pos)
+        return values
+
+    def _flush(self):
+        self._pending.insert(0, self._buf[self._pos:])
+        self._buf = "".join(self._pending)
+        self._offset += self._pos
+        self._pos = 0
+        self._pending = []
+        self._pending_size = 0
+        self._need = 0
+
+    def _scan(self, final: bool) -> list:
+        values = []
+        buf = self._buf
+        end = len(buf)
+        pos = self._pos
+        state = self._state
+        skip_whitespace = _WHITESPACE.match
+        skip_separator = _SEPARATOR.match
+        scan_once = self._DECODER.scan_once
+        fields = self._fields
+        spans = self._spans
+        bulk = fields is None and not spans
+        wait = False
+        while True:
+            pos = skip_whitespace(buf, pos).end()
+            if pos == end:
+                break
+            ch = buf[pos]
+            if state == self._SEPARATOR:
+                if ch == ",":
+                    state = self._VALUE
+                elif ch == "]":
+                    state = self._DONE
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+                pos += 1
+            elif state == self._START:
+                if ch == "[":
+                    self.is_batch = True
+                    state = self._FIRST
+                    pos += 1
+                elif ch == "{":
+                    state = self._SINGLE
+                else:
+                    raise json.JSONDecodeError("Expecting '[' or '{'", buf, pos)
+            elif state == self._DONE:
+                raise json.JSONDecodeError("Extra data", buf, pos)
+            elif state == self._FIRST and ch == "]":
+                state = self._DONE
+                pos += 1
+            else:
+                if bulk and state != self._SINGLE:
+                    group = _parse_group(buf, pos, end)
+                    if group is not None:
+                        values += group[0]
+                        pos = group[1]
+                        state = self._SEPARATOR
+                        continue
+                    # the values are parsed one by one for the rest of the text
+                    bulk = False
+                # the values of a batch, and the commas between them, are read in this loop
+                while True:
+                    if not final and ch == "{" and buf.rfind("}", pos) < 0:
+                        # the object is not complete yet, and parsing it would fail after reading all of it
+                        wait = True
+                        break
+                    start = pos
+                    try:
+                        if fields is None:
+                            # like raw_decode, without its overhead for every value
+                            value, pos = scan_once(buf, pos)
+                        else:
+                            value, pos = _project_object(buf, pos, fields)
+                    except StopIteration as e:
+                        if final:
+                            raise json.JSONDecodeError("Expecting value", buf, e.value) from None
+                        wait = True
+                        break
+                    except json.JSONDecodeError:
+                        if final:
+                            raise
+                        wait = True
+                        break
+                    values.append((value, buf[start:pos], self._offset + start) if spans else value)
+                    if state == self._SINGLE:
+                        state = self._DONE
+                        break
+                    m = skip_separator(buf, pos)
+                    if m is None:
+                        state = self._SEPARATOR
+                        break
+                    pos = m.end()
+                    state = self._VALUE
+                    if pos == end:
+                        break
+                    ch = buf[pos]
+                if wait:
+                    # the value is not complete yet; wait until the unread text doubles
+                    # so that a large value is not re-parsed for every small chunk.
+                    self._need = 2 * (end - pos)
+                    break
+        self._pos = pos
+        self._state = state
+        return values
@@ -0,0 +1,165 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# CloudEvents Kafka protocol binding: https://github.com/cloudevents/spec/blob/v1.0/kafka-protocol-binding.md
+#
+# Messages are (key, headers, value) tuples, where headers is a list of (str, bytes) pairs
+# as used by the Kafka clients. The key is the partitionkey extension attribute encoded in UTF-8,
+# or None. No Kafka client is needed.
+
+from base64 import b64encode
+from typing import Iterable, List, Optional, Tuple
+
+from .avro import Avro
+from .cloudevents import CloudEvent
+from .http import AVRO_CONTENT_TYPE, JSON_CONTENT_TYPE, _body as _value
+from .json import Json
+
+__all__ = "to_binary", "from_binary", "to_structured", "from_structured", "from_kafka", \
+          "to_binary_batch", "to_structured_batch", "from_kafka_batch"
+
+Message = Tuple[Optional[bytes], List[Tuple[str, bytes]], bytes]
+
+_CONTENT_TYPE = "content-type"
+_PARTITION_KEY = "partitionkey"
+
+# attribute name -> header name
+_HEADER_NAMES = {name: "ce_%s" % name
+                 for name in ("type", "source", "id", "specversion", "subject", "dataschema", "time", _PARTITION_KEY)}
+_HEADER_NAMES["datacontenttype"] = _CONTENT_TYPE
+# header name as received -> attribute name, or "" if it is not a CloudEvents header
+_ATTRIBUTE_NAMES = {}
+# the caches are not filled past this size, so arbitrary header names don't bloat them
+_CACHE_LIMIT = 1024
+
+_JSON_HEADERS = (_CONTENT_TYPE, JSON_CONTENT_TYPE.encode()),
+_AVRO_HEADERS = (_CONTENT_TYPE, AVRO_CONTENT_TYPE.encode()),
+
+
+def to_binary(event: CloudEvent) -> Message:
+    header_names = _HEADER_NAMES
+    headers = [
+        (header_names.get(name) or _header_name(name), _header_value(value))
+        for name, value in event._attributes.items() if value
+    ]
+    return _key(event), headers, _value(event)
+
+
+def from_binary(key: Optional[bytes], headers, value: bytes) -> CloudEvent:
+    attribute_names = _ATTRIBUTE_NAMES
+    attributes = {}
+    for header, header_value in headers:
+        name = attribute_names.get(header)
+        if name is None:
+            name = _attribute_name(header)
+        if name and header_value is not None:
+            attributes[name] = header_value.decode() if isinstance(header_value, bytes) else header_value
+    if key is not None and _PARTITION_KEY not in attributes:
+        attributes[_PARTITION_KEY] = key.decode() if isinstance(key, bytes) else key
+    attributes["data"] = value if value is None or isinstance(value, bytes) else bytes(value)
+    return CloudEvent.from_dict(attributes)
+
+
+def to_structured(event: CloudEvent, codec=Json) -> Message:
+    if codec is Avro:
+        return _key(event), list(_AVRO_HEADERS), Avro.encode(event)
+    return _key(event), list(_JSON_HEADERS), Json.encode(event).encode()
+
+
+def from_structured(key: Optional[bytes], headers, value: bytes) -> CloudEvent:
+    if _content_type(headers).startswith(AVRO_CONTENT_TYPE):
+        return Avro.decode(value)
+    event = Json.decode(value)
+    if not isinstance(event, CloudEvent):
+        raise ValueError("Kafka structured mode message contains a batch")
+    return event
+
+
+def from_kafka(key: Optional[bytes], headers, value: bytes) -> CloudEvent:
+    # Decodes a message in either mode.
+    if _content_type(headers).startswith("application/cloudevents+"):
+        return from_structured(key, headers, value)
+    return from_binary(key, headers, value)
+
+
+def to_binary_batch(events: Iterable[CloudEvent]) -> List[Message]:
+    return [to_binary(event) for event in events]
+
+
+def to_structured_batch(events: Iterable[CloudEvent], codec=Json) -> List[Message]:
+    if codec is Avro:
+        encode = Avro.encode
+        headers = _AVRO_HEADERS
+    else:
+        encode = Json._encode_event
+        headers = _JSON_HEADERS
+    messages = []
+    for event in events:
+        if not isinstance(event, CloudEvent):
+            raise TypeError("Kafka binding cannot encode %s" % type(event))
+        encoded = encode(event)
+        messages.append((_key(event), list(headers), encoded if isinstance(encoded, bytes) else encoded.encode()))
+    return messages
+
+
+def from_kafka_batch(messages: Iterable[Message]) -> List[CloudEvent]:
+    return [from_kafka(key, headers, value) for key, headers, value in messages]
+
+
+def _key(event: CloudEvent) -> Optional[bytes]:
+    key = event._attributes.get(_PARTITION_KEY)
+    if key is None:
+        return None
+    return key.encode() if isinstance(key, str) else _header_value(key)
+
+
+def _header_name(name: str) -> str:
+    header = "ce_%s" % name
+    if len(_HEADER_NAMES) < _CACHE_LIMIT:
+        _HEADER_NAMES[name] = header
+    return header
+
+
+def _attribute_name(header) -> str:
+    lowered = (header.decode() if isinstance(header, bytes) else header).lower()
+    if lowered.startswith("ce_"):
+        name = lowered[3:]
+    elif lowered == _CONTENT_TYPE:
+        name = "datacontenttype"
+    else:
+        name = ""
+    if len(_ATTRIBUTE_NAMES) < _CACHE_LIMIT:
+        _ATTRIBUTE_NAMES[header] = name
+    return name
+
+
+def _header_value(value) -> bytes:
+    if isinstance(value, str):
+        return value.encode()
+    elif isinstance(value, bool):
+        return b"true" if value else b"false"
+    elif isinstance(value, bytes):
+        return b64encode(value)
+    return str(value).encode()
+
+
+def _content_type(headers) -> str:
+    attribute_names = _ATTRIBUTE_NAMES
+    for header, value in headers:
+        name = attribute_names.get(header)
+        if name is None:
+            name = _attribute_name(header)
+        if name == "datacontenttype" and value is not None:
+            return (value.decode() if isinstance(value, bytes) else value).lower()
+    return ""
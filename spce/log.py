@@ -0,0 +1,464 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Append-only event log in segment files.
+#
+# Events are encoded with Avro or Json, and appended to the active segment as records of the length and the CRC-32
+# of the encoded event followed by the encoded event. A new segment is started when a record would take the active
+# one past segment_size bytes. The events have consecutive offsets from 0, and each segment file is named after
+# the offset of its first event.
+#
+# A sparse index next to each segment has the offset and the position of a record every index_interval bytes,
+# so reading from an offset bisects the index and skips at most index_interval bytes of records.
+# Segments are read through mmap.
+#
+# The oldest segments are removed when the log is larger than retention_bytes, or when their last event was
+# appended more than retention_seconds ago. Retention is applied when the log is opened and when a segment is
+# started; the active segment is never removed.
+#
+# When the log is opened, a torn or corrupt record at the end of the last segment, e.g. after a crash while it was
+# written, is truncated away along with the records after it.
+
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from bisect import bisect_right
+from typing import Iterable, Iterator
+from zlib import crc32
+
+from .avro import Avro
+from .cloudevents import CloudEvent
+from .json import Json
+
+__all__ = "EventLog", "CorruptLogError"
+
+_SEGMENT_SUFFIX = ".log"
+_INDEX_SUFFIX = ".index"
+_SEGMENT_NAME = re.compile(r"(\d{20})\.log\Z")
+
+# magic, version, codec, reserved
+_HEADER = struct.Struct("<4sBBH")
+_MAGIC = b"SPCL"
+_VERSION = 1
+_CODECS = {Avro: 1, Json: 2}
+_CODEC_NAMES = {1: "Avro", 2: "Json"}
+
+# length, CRC-32 of the encoded event
+_RECORD = struct.Struct("<II")
+# offset relative to the segment base, position in the segment
+_INDEX_ENTRY = struct.Struct("<II")
+
+_MAX_SEGMENT_SIZE = 2 ** 32 - 1
+
+
+class CorruptLogError(ValueError):
+    pass
+
+
+class EventLog:
+
+    def __init__(self, directory: str, codec=Avro, segment_size=64 * 1024 * 1024, index_interval=4096,
+                 retention_bytes: int = None, retention_seconds: float = None, sync=False):
+        # The directory is created if it doesn't exist. The codec must be the one the log was written with.
+        # With sync=True, appends are flushed and fsynced before they return, otherwise they are buffered
+        # until flush or close.
+        if codec not in _CODECS:
+            raise TypeError("EventLog cannot store events with %s" % codec)
+        if not _HEADER.size < segment_size <= _MAX_SEGMENT_SIZE:
+            raise ValueError("segment_size must be between %d and %d, but it is: %s"
+                             % (_HEADER.size + 1, _MAX_SEGMENT_SIZE, segment_size))
+        if index_interval <= 0:
+            raise ValueError("index_interval must be positive, but it is: %s" % index_interval)
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._codec = codec
+        self._codec_id = _CODECS[codec]
+        self._segment_size = segment_size
+        self._index_interval = index_interval
+        self._retention_bytes = retention_bytes
+        self._retention_seconds = retention_seconds
+        self._sync = sync
+        self._lock = threading.Lock()
+        self._segments = []
+        self._bases = []
+        # the files of the active segment
+        self._file = None
+        self._index_file = None
+        for base in _segment_bases(directory):
+            segment = _Segment(directory, base)
+            segment.size = os.path.getsize(segment.path)
+            self._add_segment(segment)
+        base = 0
+        while self._segments and self._segments[-1].size < _HEADER.size:
+            # the last segment was created but its header not written, the one before it is active again
+            base = self._remove_last_segment()
+        if self._segments:
+            self._recover(self._segments[-1])
+        else:
+            self._create_segment(base)
+        self._open_active()
+        self._apply_retention()
+
+    directory = property(lambda self: self._directory)
+    codec = property(lambda self: self._codec)
+
+    @property
+    def start_offset(self) -> int:
+        # the offset of the oldest event which is kept
+        return self._segments[0].base
+
+    @property
+    def end_offset(self) -> int:
+        # the offset of the next appended event
+        active = self._segments[-1]
+        return active.base + active.count
+
+    def append(self, event: CloudEvent) -> int:
+        # Returns the offset of the event.
+        payload = self._encode(event)
+        with self._lock:
+            self._check_open()
+            offset = self._append(payload)
+            self._appended()
+        return offset
+
+    def append_many(self, events: Iterable[CloudEvent]) -> range:
+        # Returns the range of the offsets of the events.
+        encode = self._encode
+        with self._lock:
+            self._check_open()
+            start = self.end_offset
+            for event in events:
+                self._append(encode(event))
+            self._appended()
+            return range(start, self.end_offset)
+
+    def replay(self, offset=0) -> Iterator[CloudEvent]:
+        # Yields the events from offset up to the end of the log at the time the replay starts.
+        # IndexError is raised if offset is before the start of the log, e.g. when retention removed it.
+        with self._lock:
+            segments, position, skip = self._locate(offset)
+        decode = self._codec.decode
+        for segment, size in segments:
+            buffer = segment.map(size)
+            try:
+                _check_header(buffer, segment.path, self._codec_id)
+                if skip:
+                    position = _skip_records(buffer, position, skip, segment.path)
+                    skip = 0
+                for payload in _read_records(buffer, position, segment.path):
+                    yield decode(payload)
+            finally:
+                buffer.close()
+            position = _HEADER.size
+
+    def get(self, offset: int) -> CloudEvent:
+        # Returns the event at offset, IndexError is raised if the log doesn't have it.
+        if offset >= self.end_offset:
+            raise IndexError("offset %d is past the end of the log at %d" % (offset, self.end_offset))
+        events = self.replay(offset)
+        try:
+            return next(events)
+        finally:
+            events.close()
+
+    def apply_retention(self) -> int:
+        # Removes the segments which are past the retention limits, returns the number of removed segments.
+        with self._lock:
+            return self._apply_retention()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush(self._sync)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush(self._sync)
+                self._file.close()
+                self._index_file.close()
+                self._file = None
+                self._index_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _encode(self, event: CloudEvent) -> bytes:
+        encoded = self._codec.encode(event)
+        return encoded.encode() if isinstance(encoded, str) else encoded
+
+    def _append(self, payload: bytes) -> int:
+        segment = self._segments[-1]
+        size = _RECORD.size + len(payload)
+        if segment.count and segment.size + size > self._segment_size:
+            segment = self._roll()
+        position = segment.size
+        if not segment.positions or position - segment.positions[-1] >= self._index_interval:
+            segment.offsets.append(segment.count)
+            segment.positions.append(position)
+            self._index_file.write(_INDEX_ENTRY.pack(segment.count, position))
+        self._file.write(_RECORD.pack(len(payload), crc32(payload)))
+        self._file.write(payload)
+        segment.size = position + size
+        segment.count += 1
+        return segment.base + segment.count - 1
+
+    def _appended(self):
+        if self._sync:
+            self._flush(True)
+
+    def _flush(self, fsync: bool):
+        self._file.flush()
+        self._index_file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index_file.fileno())
+
+    def _roll(self) -> "_Segment":
+        self._flush(self._sync)
+        self._file.close()
+        self._index_file.close()
+        self._create_segment(self.end_offset)
+        self._open_active()
+        self._apply_retention()
+        return self._segments[-1]
+
+    def _create_segment(self, base: int):
+        segment = _Segment(self._directory, base)
+        with open(segment.path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self._codec_id, 0))
+            if self._sync:
+                os.fsync(f.fileno())
+        open(segment.index_path, "wb").close()
+        if self._sync:
+            _fsync_directory(self._directory)
+        segment.size = _HEADER.size
+        segment.count = 0
+        segment.offsets = []
+        segment.positions = []
+        self._add_segment(segment)
+
+    def _add_segment(self, segment: "_Segment"):
+        self._segments.append(segment)
+        self._bases.append(segment.base)
+
+    def _remove_last_segment(self) -> int:
+        segment = self._segments.pop()
+        del self._bases[-1]
+        segment.remove()
+        return segment.base
+
+    def _open_active(self):
+        segment = self._segments[-1]
+        self._file = open(segment.path, "ab")
+        self._index_file = open(segment.index_path, "ab")
+
+    def _recover(self, segment: "_Segment"):
+        end = segment.load(self._codec_id, self._index_interval)
+        if end < segment.size:
+            with open(segment.path, "r+b") as f:
+                f.truncate(end)
+            segment.size = end
+
+    def _check_open(self):
+        if self._file is None:
+            raise ValueError("the event log is closed")
+
+    def _locate(self, offset: int):
+        # Returns the segments from the one with offset on with their current sizes,
+        # the position of the indexed record before offset, and the number of records from it to offset.
+        if offset < self.start_offset:
+            raise IndexError("offset %d is before the start of the log at %d" % (offset, self.start_offset))
+        if offset >= self.end_offset:
+            return [], 0, 0
+        if self._file is not None:
+            self._file.flush()
+        i = bisect_right(self._bases, offset) - 1
+        segment = self._segments[i]
+        if segment.offsets is None:
+            segment.load(self._codec_id, self._index_interval)
+        relative = offset - segment.base
+        entry = bisect_right(segment.offsets, relative) - 1
+        if entry < 0:
+            position, skip = _HEADER.size, relative
+        else:
+            position, skip = segment.positions[entry], relative - segment.offsets[entry]
+        return [(s, s.size) for s in self._segments[i:]], position, skip
+
+    def _apply_retention(self) -> int:
+        now = time.time()
+        total = sum(segment.size for segment in self._segments)
+        removed = 0
+        while len(self._segments) > 1:
+            segment = self._segments[0]
+            too_large = self._retention_bytes is not None and total > self._retention_bytes
+            too_old = (self._retention_seconds is not None
+                       and now - os.path.getmtime(segment.path) > self._retention_seconds)
+            if not (too_large or too_old):
+                break
+            segment.remove()
+            del self._segments[0]
+            del self._bases[0]
+            total -= segment.size
+            removed += 1
+        return removed
+
+
+class _Segment:
+
+    __slots__ = "base", "path", "index_path", "size", "count", "offsets", "positions"
+
+    def __init__(self, directory: str, base: int):
+        self.base = base
+        name = os.path.join(directory, "%020d" % base)
+        self.path = name + _SEGMENT_SUFFIX
+        self.index_path = name + _INDEX_SUFFIX
+        self.size = 0
+        # the number of events, kept up to date for the active segment only
+        self.count = 0
+        # the sparse index, the offsets relative to base and the positions of some of the records in order,
+        # loaded on first use
+        self.offsets = None
+        self.positions = None
+
+    def map(self, size=0) -> mmap.mmap:
+        # maps the first size bytes, the whole file if size is 0
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+    def load(self, codec_id: int, interval: int) -> int:
+        # Reads the index, and scans the records after its last entry for the number of events.
+        # A missing index is rebuilt, and the index is rewritten if it changed.
+        # Returns the position after the last valid record.
+        buffer = self.map()
+        try:
+            _check_header(buffer, self.path, codec_id)
+            offsets, positions = _read_index(self.index_path, len(buffer))
+            changed = False
+            end = len(buffer)
+            offset, position = (offsets[-1], positions[-1]) if positions else (0, _HEADER.size)
+            while position < end:
+                length, crc = _RECORD.unpack_from(buffer, position) if position + _RECORD.size <= end else (0, None)
+                start = position + _RECORD.size
+                if crc is None or start + length > end or crc32(buffer[start:start + length]) != crc:
+                    # torn or corrupt
+                    break
+                if not positions or position - positions[-1] >= interval:
+                    offsets.append(offset)
+                    positions.append(position)
+                    changed = True
+                offset += 1
+                position = start + length
+            if positions and positions[-1] >= position:
+                # the last indexed record is corrupt
+                offsets.pop()
+                positions.pop()
+                changed = True
+        finally:
+            buffer.close()
+        if changed:
+            with open(self.index_path, "wb") as f:
+                f.write(b"".join(_INDEX_ENTRY.pack(o, p) for o, p in zip(offsets, positions)))
+        self.count = offset
+        self.offsets = offsets
+        self.positions = positions
+        return position
+
+    def remove(self):
+        os.remove(self.path)
+        try:
+            os.remove(self.index_path)
+        except FileNotFoundError:
+            pass
+
+
+def _segment_bases(directory: str) -> list:
+    bases = []
+    for name in os.listdir(directory):
+        match = _SEGMENT_NAME.match(name)
+        if match:
+            bases.append(int(match.group(1)))
+    bases.sort()
+    return bases
+
+
+def _read_index(path: str, end: int):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        data = b""
+    offsets = []
+    positions = []
+    # a torn entry at the end is dropped
+    for offset, position in _INDEX_ENTRY.iter_unpack(data[:len(data) - len(data) % _INDEX_ENTRY.size]):
+        # entries past the end of a truncated segment, or out of order ones are dropped with the rest
+        if position >= end or (positions and (offset <= offsets[-1] or position <= positions[-1])):
+            break
+        offsets.append(offset)
+        positions.append(position)
+    return offsets, positions
+
+
+def _check_header(buffer, path: str, codec_id: int):
+    if len(buffer) < _HEADER.size:
+        raise CorruptLogError("%s is not an event log segment" % path)
+    magic, version, stored_codec, _ = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC or version != _VERSION:
+        raise CorruptLogError("%s is not an event log segment" % path)
+    if stored_codec != codec_id:
+        raise ValueError("%s has %s encoded events, not %s" % (path, _CODEC_NAMES.get(stored_codec, "unknown"),
+                                                               _CODEC_NAMES[codec_id]))
+
+
+def _read_records(buffer, position: int, path: str) -> Iterator[bytes]:
+    end = len(buffer)
+    unpack = _RECORD.unpack_from
+    while position < end:
+        if position + _RECORD.size > end:
+            raise CorruptLogError("truncated record at position %d of %s" % (position, path))
+        length, crc = unpack(buffer, position)
+        start = position + _RECORD.size
+        payload = buffer[start:start + length]
+        if len(payload) != length or crc32(payload) != crc:
+            raise CorruptLogError("corrupt record at position %d of %s" % (position, path))
+        yield payload
+        position = start + length
+
+
+def _skip_records(buffer, position: int, count: int, path: str) -> int:
+    end = len(buffer)
+    unpack = _RECORD.unpack_from
+    for _ in range(count):
+        if position + _RECORD.size > end:
+            raise CorruptLogError("truncated record at position %d of %s" % (position, path))
+        position += _RECORD.size + unpack(buffer, position)[0]
+    return position
+
+
+def _fsync_directory(directory: str):
+    # makes a new file in the directory durable, not possible on Windows
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
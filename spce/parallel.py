@@ -0,0 +1,173 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Encodes and decodes large batches on a process pool.
+#
+# A JSON batch (application/cloudevents-batch+json) or back to back Avro events (Avro.encode_many)
+# are split into chunks of chunk_size events, and the chunks are encoded/decoded by worker processes.
+# The results are in the original order.
+#
+# Events are pickled between the processes, which costs about as much as decoding JSON,
+# so the pool mostly pays off for Avro, and for JSON only with large data payloads.
+# Batches smaller than min_size (bytes for decoding, events for encoding) are processed in-process.
+
+import json
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Iterable, List, Union
+
+from ._avrobinary import read_projected_attributes, skip_data
+from .avro import Avro
+from .cloudevents import CloudEvent
+from .json import Json, _WHITESPACE
+
+__all__ = "decode_batch", "encode_batch"
+
+_JSON = "json"
+_AVRO = "avro"
+
+_NO_FIELDS = frozenset()
+
+_DECODER = json.JSONDecoder()
+# an object with strings, and objects or arrays of strings in it, but no escaped quotes in its strings
+_STRING = r'"[^"]*(?<!\\)"'
+_OTHER = r'[^"{}\[\]]*'
+_INNER = r'[\[{](?:%s%s)*%s[\]}]' % (_OTHER, _STRING, _OTHER)
+_FLAT_OBJECT = r'\{(?:%s(?:%s|%s))*%s\}' % (_OTHER, _STRING, _INNER, _OTHER)
+
+
+def decode_batch(data: Union[str, bytes], fmt=_JSON, workers: int = None, chunk_size=10000,
+                 min_size=1 << 20, executor: Executor = None) -> List[CloudEvent]:
+    _check_format(fmt)
+    if len(data) < min_size:
+        return _decode_chunk(fmt, data)
+    if fmt == _JSON:
+        if not isinstance(data, str):
+            data = bytes(data).decode()
+        chunks = _split_json(data, chunk_size)
+    else:
+        data = bytes(data)
+        chunks = _split_avro(data, chunk_size)
+    if len(chunks) < 2:
+        return _decode_chunk(fmt, data)
+    events = []
+    for decoded in _map(_decode_chunk, fmt, chunks, workers, executor):
+        events.extend(decoded)
+    return events
+
+
+def encode_batch(events: Iterable[CloudEvent], fmt=_JSON, workers: int = None, chunk_size=10000,
+                 min_size=10000, executor: Executor = None) -> Union[str, bytes]:
+    # Returns a JSON batch, or back to back Avro events.
+    _check_format(fmt)
+    events = list(events)
+    if len(events) < min_size:
+        return Json.encode(events) if fmt == _JSON else Avro.encode_many(events)
+    chunks = [events[i:i + chunk_size] for i in range(0, len(events), chunk_size)]
+    encoded = _map(_encode_chunk, fmt, chunks, workers, executor)
+    if fmt == _JSON:
+        return "[%s]" % ",".join(encoded)
+    return b"".join(encoded)
+
+
+def _map(func, fmt, chunks, workers, executor):
+    formats = [fmt] * len(chunks)
+    if executor is not None:
+        return list(executor.map(func, formats, chunks))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(func, formats, chunks))
+
+
+def _decode_chunk(fmt: str, chunk) -> List[CloudEvent]:
+    if fmt == _JSON:
+        events = Json.decode(chunk)
+        return [events] if isinstance(events, CloudEvent) else events
+    return list(Avro.decode_iter(chunk))
+
+
+def _encode_chunk(fmt: str, events: List[CloudEvent]) -> Union[str, bytes]:
+    # JSON chunks are encoded without the enclosing brackets, so they can be joined with commas.
+    if fmt == _JSON:
+        return Json.encode(events)[1:-1]
+    return Avro.encode_many(events)
+
+
+def _split_json(text: str, chunk_size: int) -> List[str]:
+    # Splits a JSON batch into JSON batches of chunk_size events.
+    # The events are not parsed, only their extents are found: a chunk of flat objects (see _FLAT_OBJECT)
+    # is matched with a single regular expression, and only the events of other chunks are scanned
+    # with the C scanner of the json module. The chunks are checked when they are decoded.
+    skip_whitespace = _WHITESPACE.match
+    raw_decode = _DECODER.raw_decode
+    match_chunk = re.compile(r"(?:%s[ \t\n\r]*,[ \t\n\r]*){%d}%s" % (_FLAT_OBJECT, chunk_size - 1, _FLAT_OBJECT)).match
+    pos = skip_whitespace(text).end()
+    if text[pos:pos + 1] != "[":
+        # a single event
+        return [text]
+    pos = skip_whitespace(text, pos + 1).end()
+    if text[pos:pos + 1] == "]":
+        return []
+    chunks = []
+    start = pos
+    count = 0
+    while True:
+        pos = skip_whitespace(text, pos).end()
+        match = match_chunk(text, pos) if count == 0 else None
+        if match is not None:
+            pos = match.end()
+            count = chunk_size
+        else:
+            _, pos = raw_decode(text, pos)
+            count += 1
+        pos = skip_whitespace(text, pos).end()
+        ch = text[pos:pos + 1]
+        if ch != "," and ch != "]":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+        if count == chunk_size or ch == "]":
+            chunks.append("[%s]" % text[start:pos])
+            start = pos + 1
+            count = 0
+        pos += 1
+        if ch == "]":
+            break
+    if skip_whitespace(text, pos).end() != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+    return chunks
+
+
+def _split_avro(data: bytes, chunk_size: int) -> List[bytes]:
+    # Splits back to back Avro events into chunks of chunk_size events, skipping over the events.
+    chunks = []
+    start = pos = 0
+    end = len(data)
+    count = 0
+    try:
+        while pos < end:
+            _, pos = read_projected_attributes(data, pos, _NO_FIELDS)
+            pos = skip_data(data, pos)
+            count += 1
+            if count == chunk_size:
+                chunks.append(data[start:pos])
+                start = pos
+                count = 0
+    except IndexError:
+        raise ValueError("Avro.decode: unexpected end of data")
+    if start < end:
+        chunks.append(data[start:])
+    return chunks
+
+
+def _check_format(fmt: str):
+    if fmt != _JSON and fmt != _AVRO:
+        raise ValueError("fmt must be either json or avro, but it is: %s" % fmt)
@@ -0,0 +1,118 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from base64 import b64encode
+from datetime import datetime
+from typing import Union
+
+from ._avrobinary import encode_long, write_attribute_entries, write_data, write_string
+from .cloudevents import CloudEvent, _format_time, _new_event
+from .json import Json
+
+__all__ = "CloudEventTemplate",
+
+# attributes which CloudEvent puts between id and time
+_MIDDLE = frozenset(("specversion", "subject", "datacontenttype", "dataschema"))
+
+_AVRO_ID_KEY = b"\x04id\x06"
+_AVRO_TIME_KEY = b"\x08time\x06"
+
+
+class CloudEventTemplate:
+    # Stamps out events which share all attributes except id, time and data.
+    # The constant attributes are encoded once, when the template is created,
+    # and the encodings are the same as encoding the event made with the same arguments.
+
+    __slots__ = "_head", "_middle", "_tail", "_json_head", "_json_middle", "_json_tail", \
+                "_avro_head", "_avro_middle", "_avro_tail", "_avro_count"
+
+    def __init__(self, *,
+                 type: str,
+                 source: str,
+                 specversion="1.0",
+                 subject="",
+                 datacontenttype="",
+                 dataschema="",
+                 **attributes
+                 ):
+        if "id" in attributes or "time" in attributes or "data" in attributes:
+            raise TypeError("id, time and data are set per event, they can't be a part of the template")
+        prototype = CloudEvent(type=type, source=source, id="", specversion=specversion, subject=subject,
+                               datacontenttype=datacontenttype, dataschema=dataschema, **attributes)
+        # attributes before id, between id and time, and after time in the order CloudEvent keeps them
+        names = list(prototype._attributes)
+        at = names.index("id")
+        self._head = {name: prototype._attributes[name] for name in names[:at]}
+        self._middle = {name: prototype._attributes[name] for name in names[at + 1:] if name in _MIDDLE}
+        self._tail = {name: prototype._attributes[name] for name in names[at + 1:] if name not in _MIDDLE}
+
+        encode = Json._ENCODER.encode
+        self._json_head, self._json_middle, self._json_tail = (
+            "".join(',"%s":%s' % (name, encode(value)) for name, value in attrs.items() if value)
+            for attrs in (self._head, self._middle, self._tail)
+        )
+
+        self._avro_head, self._avro_middle, self._avro_tail = (
+            self._encode_avro_entries(attrs) for attrs in (self._head, self._middle, self._tail)
+        )
+        self._avro_count = len(self._head) + len(self._middle) + len(self._tail)
+
+    def make(self, id: str, time: Union[str, datetime] = "", data: Union[str, bytes] = "") -> CloudEvent:
+        attrs = self._head.copy()
+        attrs["id"] = id
+        attrs.update(self._middle)
+        if time:
+            attrs["time"] = _format_time(time)
+        attrs.update(self._tail)
+        return _new_event(attrs, data)
+
+    def encode_json(self, id: str, time: Union[str, datetime] = "", data: Union[str, bytes] = "") -> str:
+        encode = Json._ENCODER.encode
+        parts = [self._json_head]
+        if id:
+            parts.append(',"id":%s' % encode(id))
+        parts.append(self._json_middle)
+        if time:
+            parts.append(',"time":%s' % encode(_format_time(time)))
+        parts.append(self._json_tail)
+        if data:
+            if isinstance(data, bytes):
+                parts.append(',"data_base64":%s' % encode(b64encode(data).decode()))
+            else:
+                parts.append(',"data":%s' % encode(data))
+        # drop the leading comma
+        return "{%s}" % "".join(parts)[1:]
+
+    def encode_avro(self, id: str, time: Union[str, datetime] = "", data: Union[str, bytes] = "") -> bytes:
+        out = bytearray(encode_long(self._avro_count + (2 if time else 1)))
+        out += self._avro_head
+        if isinstance(id, str):
+            out += _AVRO_ID_KEY
+            write_string(out, id)
+        else:
+            write_attribute_entries(out, {"id": id})
+        out += self._avro_middle
+        if time:
+            out += _AVRO_TIME_KEY
+            write_string(out, _format_time(time))
+        out += self._avro_tail
+        out += b"\x00"
+        write_data(out, data or None)
+        return bytes(out)
+
+    @classmethod
+    def _encode_avro_entries(cls, attributes: dict) -> bytes:
+        out = bytearray()
+        write_attribute_entries(out, attributes)
+        return bytes(out)
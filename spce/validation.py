@@ -0,0 +1,239 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Validation of events against the CloudEvents spec: https://github.com/cloudevents/spec/blob/v1.0/spec.md
+#
+# Events are not validated when they are created. Validate them with a Validator,
+# or pass validate=True (or a Validator) to the decoders of the Json, JsonLines and Avro codecs.
+#
+# A Validator remembers the attribute names and the string values that passed its checks,
+# so in a batch, where most events share their source, type, etc., only the values seen for the first time
+# are checked, and validating costs a fraction of decoding.
+
+import re
+from datetime import date
+from typing import Iterable, List, Optional
+
+from .cloudevents import CloudEvent
+
+__all__ = "Validator", "ValidationError", "validate"
+
+_ATTRIBUTE_NAME = re.compile(r"[a-z0-9]+\Z")
+# RFC 3986 URI-reference and URI, checking the scheme, the allowed characters and the percent-encoding
+_URI_CHARS = r"(?:[A-Za-z0-9\-._~!$&'()*+,;=:@/?#\[\]]|%[0-9A-Fa-f]{2})*\Z"
+_URI_REFERENCE = re.compile(r"(?:[A-Za-z][A-Za-z0-9+.\-]*:)?" + _URI_CHARS)
+_URI = re.compile(r"[A-Za-z][A-Za-z0-9+.\-]*:" + _URI_CHARS)
+# RFC 2046 media type, the parameters are not checked
+_TOKEN = r"[!#$%&'*+.^_`|~0-9A-Za-z\-]+"
+_MEDIA_TYPE = re.compile(r"%s/%s[ \t]*(?:;.*)?\Z" % (_TOKEN, _TOKEN), re.DOTALL)
+# RFC 3339 timestamp with the ranges of the fields checked, whether the day exists in the month is checked separately
+_TIMESTAMP = re.compile(
+    r"[0-9]{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12][0-9]|3[01])[Tt ](?:[01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]"
+    r"(?:\.[0-9]+)?(?:[Zz]|[+-](?:[01][0-9]|2[0-3]):[0-5][0-9])\Z"
+)
+
+_INT_MIN = -2 ** 31
+_INT_MAX = 2 ** 31 - 1
+
+# the caches are not filled past these sizes, so arbitrary attribute names and values don't bloat them
+_CACHE_LIMIT = 1024
+_VALUE_CACHE_LIMIT = 4096
+
+
+class ValidationError(ValueError):
+
+    def __init__(self, message: str, errors: List[str]):
+        super().__init__(message)
+        self.errors = errors
+
+
+class Validator:
+
+    def __init__(self, max_name_length: Optional[int] = 20, specversions: Iterable[str] = ("1.0",)):
+        # The spec recommends attribute names of at most 20 characters, pass max_name_length=None to allow longer names.
+        self._max_name_length = max_name_length
+        self._specversions = frozenset(specversions)
+        # attribute name -> check function
+        self._checks = {
+            "id": _check_string,
+            "source": _check_uri_reference,
+            "specversion": self._check_specversion,
+            "type": _check_string,
+            "datacontenttype": _check_media_type,
+            "dataschema": _check_uri,
+            "subject": _check_string,
+            "time": self._check_time,
+        }
+        # extension attribute name -> error message, or "" if it is valid
+        self._names = {}
+        # attribute name -> string values that are valid for it
+        self._values = {}
+        # dates of valid timestamps: "YYYY-MM-DD"
+        self._dates = set()
+
+    def errors(self, event: CloudEvent) -> List[str]:
+        # Returns the problems of the event, an empty list if it is valid.
+        if not isinstance(event, CloudEvent):
+            return ["not a CloudEvent: %s" % type(event)]
+        attributes = event._attributes
+        get = attributes.get
+        errors = []
+        if not (get("id") and get("source") and get("specversion") and get("type")):
+            errors.extend("required attribute %s is missing" % name
+                          for name in ("id", "source", "specversion", "type") if not get(name))
+        known_values = self._values
+        for name, value in attributes.items():
+            if type(value) is str:
+                values = known_values.get(name)
+                if values is not None and value in values:
+                    continue
+            error = self._check_attribute(name, value)
+            if error:
+                errors.append(error)
+        return errors
+
+    def validate(self, event: CloudEvent) -> CloudEvent:
+        # Raises ValidationError if the event is not valid, returns the event otherwise.
+        errors = self.errors(event)
+        if errors:
+            raise ValidationError("invalid event: %s" % "; ".join(errors), errors)
+        return event
+
+    def validate_batch(self, events: Iterable[CloudEvent]):
+        # Raises ValidationError for the first invalid event, with its index in the message.
+        errors_of = self.errors
+        for i, event in enumerate(events):
+            errors = errors_of(event)
+            if errors:
+                raise ValidationError("invalid event at index %d: %s" % (i, "; ".join(errors)), errors)
+
+    def _check_attribute(self, name: str, value) -> str:
+        check = self._checks.get(name)
+        if check is not None:
+            if value is None or value == "":
+                # not set
+                return ""
+            error = check(name, value)
+        else:
+            error = self._names.get(name)
+            if error is None:
+                error = self._check_name(name)
+            if not error and value is not None:
+                error = _check_extension_value(name, value)
+        if not error and type(value) is str and name != "time":
+            self._remember(name, value)
+        return error
+
+    def _remember(self, name: str, value: str):
+        values = self._values.get(name)
+        if values is None:
+            if len(self._values) >= _CACHE_LIMIT:
+                return
+            values = self._values[name] = set()
+        if len(values) < _VALUE_CACHE_LIMIT:
+            values.add(value)
+
+    def _check_name(self, name: str) -> str:
+        if not isinstance(name, str) or not _ATTRIBUTE_NAME.match(name):
+            error = "attribute name %r must consist of lowercase letters and digits" % (name,)
+        elif self._max_name_length is not None and len(name) > self._max_name_length:
+            error = "attribute name %r is longer than %d characters" % (name, self._max_name_length)
+        else:
+            error = ""
+        if len(self._names) < _CACHE_LIMIT:
+            self._names[name] = error
+        return error
+
+    def _check_specversion(self, name: str, value) -> str:
+        if value not in self._specversions:
+            return "unsupported specversion %r" % (value,)
+        return ""
+
+    def _check_time(self, name: str, value) -> str:
+        if not isinstance(value, str) or not _TIMESTAMP.match(value):
+            return "attribute time must be an RFC 3339 timestamp: %r" % (value,)
+        day = value[:10]
+        if day not in self._dates:
+            try:
+                date(int(day[:4]), int(day[5:7]), int(day[8:10]))
+            except ValueError:
+                return "attribute time must be an RFC 3339 timestamp: %r" % (value,)
+            if len(self._dates) < _VALUE_CACHE_LIMIT:
+                self._dates.add(day)
+        return ""
+
+
+def _check_string(name: str, value) -> str:
+    if not isinstance(value, str):
+        return "attribute %s must be a string, but it is: %s" % (name, type(value))
+    return ""
+
+
+def _check_uri_reference(name: str, value) -> str:
+    if not isinstance(value, str) or not _URI_REFERENCE.match(value):
+        return "attribute %s must be a URI-reference: %r" % (name, value)
+    return ""
+
+
+def _check_uri(name: str, value) -> str:
+    if not isinstance(value, str) or not _URI.match(value):
+        return "attribute %s must be an absolute URI: %r" % (name, value)
+    return ""
+
+
+def _check_media_type(name: str, value) -> str:
+    if not isinstance(value, str) or not _MEDIA_TYPE.match(value):
+        return "attribute %s must be a media type: %r" % (name, value)
+    return ""
+
+
+def _check_extension_value(name: str, value) -> str:
+    value_type = type(value)
+    if value_type is str or value_type is bool or value_type is bytes:
+        return ""
+    if value_type is int:
+        if _INT_MIN <= value <= _INT_MAX:
+            return ""
+        return "attribute %s is out of the 32 bit integer range: %d" % (name, value)
+    return "attribute %s has unsupported type %s" % (name, value_type)
+
+
+_DEFAULT = Validator()
+
+
+def validate(event: CloudEvent) -> CloudEvent:
+    # Validates an event with the default Validator.
+    return _DEFAULT.validate(event)
+
+
+def get_validator(validate, fields=None) -> Optional[Validator]:
+    # Returns the validator for the validate argument of the decoders: a Validator, True for the default one,
+    # or None for no validation.
+    if not validate:
+        return None
+    if fields is not None:
+        raise ValueError("validate cannot be used with fields")
+    if validate is True:
+        return _DEFAULT
+    if isinstance(validate, Validator):
+        return validate
+    raise TypeError("validate must be either a bool or a Validator, but it is: %s" % type(validate))
+
+
+def validate_decoded(decoded, validator: Validator):
+    # Validates the result of a decoder, which is either an event or a list of them.
+    if isinstance(decoded, list):
+        validator.validate_batch(decoded)
+    else:
+        validator.validate(decoded)
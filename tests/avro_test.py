@@ -15,7 +15,9 @@
 import json
 import unittest
 
-from spce import CloudEvent, Avro
+from spce import CloudEvent, Avro, Json, LazyCloudEvent
+from spce._avrobinary import write_event
+from spce.cloudevents import _ATTRIBUTE_NAMES
 
 
 class AvroEncoderTests(unittest.TestCase):
@@ -166,3 +168,346 @@ class AvroDecoderTests(unittest.TestCase):
         )
         event = Avro.decode(encoded_event)
         self.assertEqual(target, event)
+
+    def test_decode_constant_attribute_names(self):
+        event = Avro.decode(Avro.encode(CloudEvent(type="t", source="s", id="1", subject="x", external1="foo")))
+        for name in event._attributes:
+            if name in _ATTRIBUTE_NAMES:
+                self.assertIs(_ATTRIBUTE_NAMES[name], name)
+        self.assertEqual("foo", event.attribute("external1"))
+
+
+class AvroContainerTests(unittest.TestCase):
+
+    EVENTS = [
+        CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id=str(1000 + i),
+            datacontenttype="application/json",
+            data=b'\x01binarydata\x02' if i % 2 else json.dumps({"spo2": 90 + i}),
+            time="2020-09-28T21:33:21Z",
+        )
+        for i in range(100)
+    ]
+
+    def test_write_read_container(self):
+        import io
+        for codec in ("null", "deflate"):
+            f = io.BytesIO()
+            Avro.write_container(iter(self.EVENTS), f, codec=codec)
+            self.assertTrue(f.getvalue().startswith(b"Obj\x01"))
+            f.seek(0)
+            self.assertEqual(self.EVENTS, list(Avro.read_container(f)))
+
+    def test_container_block_size(self):
+        import io
+        f = io.BytesIO()
+        Avro.write_container(self.EVENTS, f, codec="null", block_size=1000)
+        encoded = f.getvalue()
+        sync_marker = encoded[-16:]
+        # header + one sync marker per block
+        self.assertGreater(encoded.count(sync_marker), 5)
+        f.seek(0)
+        self.assertEqual(self.EVENTS, list(Avro.read_container(f)))
+
+    def test_container_deflate_is_smaller(self):
+        import io
+        null_file, deflate_file = io.BytesIO(), io.BytesIO()
+        Avro.write_container(self.EVENTS, null_file, codec="null")
+        Avro.write_container(self.EVENTS, deflate_file, codec="deflate")
+        self.assertLess(len(deflate_file.getvalue()), len(null_file.getvalue()))
+
+    def test_empty_container(self):
+        import io
+        f = io.BytesIO()
+        Avro.write_container([], f)
+        f.seek(0)
+        self.assertEqual([], list(Avro.read_container(f)))
+
+
+try:
+    import avro.io
+    import avro.schema
+except ImportError:
+    avro = None
+
+
+@unittest.skipIf(avro is None, "avro package is not installed")
+class AvroGenericCodecCompatibilityTests(unittest.TestCase):
+
+    DATA = [
+        None,
+        "",
+        "text ünicode",
+        b"\x00\x01" * 200,
+        1.5,
+        7,
+        True,
+        {"a": None, "b": True, "c": 1.25, "d": "x", "e": {"value": {}}},
+        {"nested": {"value": {
+            "n": None, "b": False, "i": 3, "s": "str",
+            "m": {"k": {"value": {"x": "y"}}},
+            "a": [{"value": {"z": 1.0}}, {"value": {}}],
+        }}},
+        [{"value": {"x": [{"value": {}}]}}],
+        [],
+        {},
+    ]
+
+    ATTRIBUTES = [
+        {},
+        {"type": "OximeterMeasured", "source": "oximeter/123", "id": "1000", "specversion": "1.0"},
+        {"type": "t" * 300, "none": None, "flag": True, "count": -42, "big": 2 ** 31 - 1,
+         "raw": b"\xff" * 2000, "unicode": "ğüşiöç"},
+    ]
+
+    def setUp(self):
+        from spce.avro import _SCHEMA_TEXT
+        schema = avro.schema.parse(_SCHEMA_TEXT)
+        self.writer = avro.io.DatumWriter(schema)
+        self.reader = avro.io.DatumReader(schema)
+
+    def generic_encode(self, attributes, data):
+        import io
+        bio = io.BytesIO()
+        self.writer.write({"attribute": attributes, "data": data}, avro.io.BinaryEncoder(bio))
+        return bio.getvalue()
+
+    def generic_decode(self, encoded):
+        import io
+        return self.reader.read(avro.io.BinaryDecoder(io.BytesIO(encoded)))
+
+    def test_same_bytes(self):
+        from spce._avrobinary import write_event, read_event
+        for attributes in self.ATTRIBUTES:
+            for data in self.DATA:
+                out = bytearray()
+                write_event(out, attributes, data)
+                target = self.generic_encode(attributes, data)
+                self.assertEqual(target, bytes(out), (attributes, data))
+                raw_event = self.generic_decode(target)
+                decoded_attributes, decoded_data, pos = read_event(target)
+                self.assertEqual(len(target), pos)
+                self.assertEqual(raw_event["attribute"], decoded_attributes)
+                self.assertEqual(raw_event["data"], decoded_data)
+
+    def test_invalid_values(self):
+        from spce._avrobinary import write_event
+        invalid = [
+            ({"big": 2 ** 31}, None),
+            ({"float": 1.5}, None),
+            ({1: "x"}, None),
+            ({}, {"a": {"b": 1}}),
+            ({}, [1]),
+            ({}, object()),
+        ]
+        for attributes, data in invalid:
+            with self.assertRaises(Exception):
+                self.generic_encode(attributes, data)
+            with self.assertRaises(TypeError):
+                write_event(bytearray(), attributes, data)
+
+
+class AvroStreamTests(unittest.TestCase):
+
+    def test_decode_from_consecutive(self):
+        import io
+        events = [
+            CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(i), data=b"\x01" * i)
+            for i in range(1, 4)
+        ]
+        f = io.BytesIO()
+        for event in events:
+            Avro.encode_to(event, f)
+        f.seek(0)
+        self.assertEqual(events, [Avro.decode_from(f) for _ in events])
+        self.assertEqual(b"", f.read())
+
+    def test_decode_truncated(self):
+        encoded = Avro.encode(CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000"))
+        with self.assertRaises(ValueError):
+            Avro.decode(encoded[:-3])
+
+    def test_encode_invalid(self):
+        with self.assertRaises(TypeError):
+            Avro.encode(CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", ratio=0.5))
+
+
+class AvroBulkTests(unittest.TestCase):
+
+    EVENTS = AvroContainerTests.EVENTS
+
+    def test_encode_many(self):
+        offsets = []
+        encoded = Avro.encode_many(iter(self.EVENTS), offsets)
+        self.assertEqual(b"".join(Avro.encode(e) for e in self.EVENTS), encoded)
+        self.assertEqual(len(self.EVENTS), len(offsets))
+        self.assertEqual(self.EVENTS[1], Avro.decode(encoded[offsets[1]:offsets[2]]))
+
+    def test_encode_views(self):
+        views = Avro.encode_views(self.EVENTS)
+        self.assertEqual([Avro.encode(e) for e in self.EVENTS], [bytes(v) for v in views])
+        self.assertEqual([], Avro.encode_views([]))
+
+    def test_encode_many_invalid(self):
+        with self.assertRaises(TypeError):
+            Avro.encode_many([self.EVENTS[0], None])
+
+    def test_decode_iter(self):
+        import io
+        encoded = Avro.encode_many(self.EVENTS)
+        self.assertEqual(self.EVENTS, list(Avro.decode_iter(encoded)))
+        self.assertEqual(self.EVENTS, list(Avro.decode_iter(io.BytesIO(encoded), chunk_size=7)))
+        self.assertEqual([], list(Avro.decode_iter(io.BytesIO())))
+
+    def test_decode_iter_large_event(self):
+        import io
+        events = [CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", data=b"\x01" * 100000)]
+        events.extend(self.EVENTS[:3])
+        encoded = Avro.encode_many(events)
+        self.assertEqual(events, list(Avro.decode_iter(io.BytesIO(encoded), chunk_size=100)))
+
+    def test_decode_iter_truncated(self):
+        import io
+        encoded = Avro.encode_many(self.EVENTS[:2])
+        events = Avro.decode_iter(io.BytesIO(encoded[:-1]))
+        self.assertEqual(self.EVENTS[0], next(events))
+        with self.assertRaises(ValueError):
+            next(events)
+
+
+class AvroLazyDecoderTests(unittest.TestCase):
+
+    EVENTS = AvroContainerTests.EVENTS
+
+    def test_decode_lazy(self):
+        encoded = Avro.encode(self.EVENTS[1])
+        event = Avro.decode(encoded, lazy=True)
+        self.assertIsInstance(event, LazyCloudEvent)
+        self.assertEqual("OximeterMeasured", event.type)
+        self.assertIsNotNone(event._pending)
+        self.assertEqual(b'\x01binarydata\x02', event.data)
+        self.assertIsNone(event._pending)
+        self.assertEqual(self.EVENTS[1], event)
+
+    def test_decode_lazy_normalized(self):
+        encoded = bytearray()
+        write_event(encoded, {"type": "t", "source": "s", "id": "1", "subject": ""}, b"x")
+        event = Avro.decode(bytes(encoded), lazy=True)
+        eager = Avro.decode(bytes(encoded))
+        self.assertEqual("1.0", event.specversion)
+        self.assertIsNone(event.subject)
+        self.assertEqual(eager._attributes, event._attributes)
+        self.assertEqual(eager, event)
+        encoded = bytearray()
+        write_event(encoded, {"type": "t", "source": "s"}, None)
+        with self.assertRaises(TypeError):
+            Avro.decode(bytes(encoded), lazy=True)
+
+    def test_encode_lazy_pass_through(self):
+        encoded = Avro.encode(self.EVENTS[0])
+        event = Avro.decode(encoded, lazy=True)
+        self.assertIs(encoded, Avro.encode(event))
+        self.assertIsNotNone(event._pending)
+        self.assertEqual(Json.encode(self.EVENTS[0]), Json.encode(event))
+
+    def test_decode_iter_lazy(self):
+        import io
+        encoded = Avro.encode_many(self.EVENTS)
+        events = list(Avro.decode_iter(io.BytesIO(encoded), chunk_size=50, lazy=True))
+        self.assertEqual(self.EVENTS, events)
+        events = list(Avro.decode_iter(encoded, lazy=True))
+        self.assertEqual(encoded, Avro.encode_many(events))
+        self.assertEqual(self.EVENTS, events)
+
+    def test_decode_lazy_truncated(self):
+        encoded = Avro.encode(self.EVENTS[0])
+        with self.assertRaises(ValueError):
+            Avro.decode(encoded[:-3], lazy=True)
+
+
+class AvroProjectionTests(unittest.TestCase):
+
+    def test_decode_fields(self):
+        event = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            data=b'\x01' * 5000,
+            external1="foo/bar",
+            external2=b"\x02",
+            external3=5,
+            external4=None,
+            external5=True,
+        )
+        encoded = Avro.encode(event)
+        target = {"type": "OximeterMeasured", "external1": "foo/bar", "external3": 5}
+        fields = "type", "external1", "external3", "missing"
+        self.assertEqual(target, Avro.decode(encoded, fields=fields))
+        target = {"external2": b"\x02", "external4": None, "external5": 1}
+        self.assertEqual(target, Avro.decode(encoded, fields=target.keys()))
+
+    def test_decode_iter_fields(self):
+        import io
+        events = AvroContainerTests.EVENTS
+        encoded = Avro.encode_many(events)
+        target = [{"id": e.id, "source": e.source} for e in events]
+        self.assertEqual(target, list(Avro.decode_iter(io.BytesIO(encoded), chunk_size=64, fields=["id", "source"])))
+
+
+class AvroAsyncTests(unittest.TestCase):
+
+    EVENTS = AvroContainerTests.EVENTS
+
+    def test_aiter_decode(self):
+        encoded = Avro.encode_many(self.EVENTS)
+        self.assertEqual(self.EVENTS, _run(_decode_stream(encoded, chunk_size=3)))
+
+    def test_aiter_decode_lazy(self):
+        encoded = Avro.encode_many(self.EVENTS)
+        events = _run(_decode_stream(encoded, lazy=True))
+        self.assertIsInstance(events[0], LazyCloudEvent)
+        self.assertEqual(self.EVENTS, events)
+
+    def test_aiter_decode_fields(self):
+        encoded = Avro.encode_many(self.EVENTS)
+        events = _run(_decode_stream(encoded, fields=["id"]))
+        self.assertEqual([{"id": e.id} for e in self.EVENTS], events)
+
+    def test_aiter_decode_truncated(self):
+        encoded = Avro.encode_many(self.EVENTS)
+        with self.assertRaises(ValueError):
+            _run(_decode_stream(encoded[:-1]))
+
+    def test_aencode_to(self):
+        written = []
+
+        class Writer:
+            def write(self, data):
+                written.append(data)
+
+            async def drain(self):
+                written.append(None)
+
+        _run(Avro.aencode_to(self.EVENTS, Writer(), chunk_size=10))
+        self.assertEqual(Avro.encode_many(self.EVENTS), b"".join(w for w in written if w))
+        # drained after each write
+        self.assertEqual([None] * (len(written) // 2), written[1::2])
+
+
+def _run(coro):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _decode_stream(data: bytes, **kwargs):
+    import asyncio
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return [event async for event in Avro.aiter_decode(reader, **kwargs)]
@@ -0,0 +1,170 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from spce import Avro, CloudEvent, CloudEventBatch, Json
+from spce.instrument import CodecStats
+
+
+def make_events():
+    events = []
+    for i in range(10):
+        if i % 3 == 0:
+            data = '{"spo2": %d}' % i
+        elif i % 3 == 1:
+            data = bytes([i, 0, 255])
+        else:
+            data = ""
+        events.append(CloudEvent(
+            type="OximeterMeasured" if i % 2 else "OximeterCalibrated",
+            source="oximeter/%d" % (i % 3),
+            id=str(1000 + i),
+            time="2020-09-28T21:33:%02dZ" % (59 - i),
+            datacontenttype="application/json" if i % 3 == 0 else "",
+            data=data,
+            external1="value%d" % i,
+        ))
+    events.append(CloudEvent(type="OximeterMeasured", source="oximeter/9", id="999", subject="x", external2=5))
+    return events
+
+
+class CloudEventBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.events = make_events()
+        self.batch = CloudEventBatch(self.events)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.events), len(self.batch))
+        self.assertEqual(self.events, self.batch.to_events())
+        self.assertEqual(self.events[3], self.batch[3])
+        self.assertEqual(self.events[-1], self.batch[-1])
+        self.assertEqual(self.events[2:5], list(self.batch[2:5]))
+        for event, target in zip(self.batch, self.events):
+            self.assertEqual(target.attribute("external2"), event.attribute("external2"))
+            self.assertEqual(target._has_binary_data, event._has_binary_data)
+        with self.assertRaises(IndexError):
+            self.batch[len(self.events)]
+
+    def test_json_data(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", data={"spo2": [99, None]})
+        batch = CloudEventBatch([event])
+        self.assertEqual({"spo2": [99, None]}, batch.data(0))
+        self.assertEqual([event], batch.to_events())
+
+    def test_append(self):
+        batch = CloudEventBatch()
+        for event in self.events:
+            batch.append(event)
+        self.assertEqual(self.events, batch.to_events())
+        with self.assertRaises(TypeError):
+            batch.append({"type": "OximeterMeasured"})
+
+    def test_columns(self):
+        self.assertEqual(("type", "source", "id", "specversion", "datacontenttype", "time", "external1",
+                          "subject", "external2"), self.batch.attribute_names)
+        self.assertEqual([e.type for e in self.events], self.batch.column("type"))
+        self.assertEqual([None] * 10 + [5], self.batch.column("external2"))
+        self.assertEqual([None] * 11, self.batch.column("unknown"))
+        # distinct values are stored once
+        self.assertEqual(3, len(self.batch._columns["type"].values))
+
+    def test_filter(self):
+        measured = self.batch.filter("type", "OximeterMeasured")
+        self.assertEqual([e for e in self.events if e.type == "OximeterMeasured"], measured.to_events())
+        calls = []
+
+        def predicate(source):
+            calls.append(source)
+            return source is not None and source.endswith("/1")
+
+        self.assertEqual([e for e in self.events if e.source.endswith("/1")],
+                         self.batch.filter("source", predicate).to_events())
+        # once for each distinct value and the missing value
+        self.assertEqual(5, len(calls))
+        self.assertEqual([self.events[-1]], self.batch.filter("external2", lambda v: v is not None).to_events())
+        self.assertEqual(0, len(self.batch.filter("unknown", "x")))
+        self.assertEqual(11, len(self.batch.filter("unknown", None)))
+
+    def test_select(self):
+        selected = self.batch.select("id", "unknown")
+        self.assertEqual(("id",), selected.attribute_names)
+        self.assertEqual({"id": "1000"}, selected[0]._attributes)
+        self.assertEqual(self.events[0].data, selected[0].data)
+        # the selected batch doesn't share its columns
+        selected.append(self.events[0])
+        self.assertEqual(len(self.events), len(self.batch.column("id")))
+
+    def test_sort(self):
+        self.assertEqual(sorted(self.events, key=lambda e: e.time or ""), self.batch.sort("time").to_events())
+        self.assertEqual(sorted(self.events, key=lambda e: e.source, reverse=True),
+                         self.batch.sort("source", reverse=True).to_events())
+        # stable, and the events without the attribute are first
+        self.assertEqual(self.events, self.batch.sort("subject").to_events())
+        self.assertEqual([self.events[-1]] + self.events[:-1], self.batch.sort("subject", reverse=True).to_events())
+        self.assertEqual(self.events, self.batch.sort("unknown").to_events())
+
+    def test_take_shares_dictionary(self):
+        taken = self.batch.take([10, 0])
+        self.assertEqual([self.events[10], self.events[0]], taken.to_events())
+        taken.append(CloudEvent(type="OximeterReset", source="oximeter/1", id="1"))
+        self.assertEqual("OximeterReset", taken[2].type)
+        self.assertEqual(self.events, self.batch.to_events())
+
+
+class BatchDecoderTests(unittest.TestCase):
+
+    def test_json(self):
+        events = make_events()
+        batch = Json.decode_batch(Json.encode(events))
+        self.assertIsInstance(batch, CloudEventBatch)
+        self.assertEqual(Json.decode(Json.encode(events)), batch.to_events())
+        self.assertEqual([events[0]], Json.decode_batch(Json.encode(events[0])).to_events())
+        with self.assertRaises(TypeError):
+            Json.decode_batch("[1]")
+        with self.assertRaises(TypeError):
+            Json.decode_batch('[{"type": "OximeterMeasured"}]')
+
+    def test_json_chunks(self):
+        # longer than a chunk, the columns are filled chunk by chunk and the events may span chunks
+        events = make_events() * 50
+        encoded = Json.encode(events)
+        with mock.patch("spce.json._BATCH_CHUNK_SIZE", 1000):
+            self.assertEqual(events, Json.decode_batch(encoded).to_events())
+            self.assertEqual(events, Json.decode_batch(encoded.encode()).to_events())
+            self.assertEqual([events[0]], Json.decode_batch("%s%s" % (" " * 1500, Json.encode(events[0]))).to_events())
+            with self.assertRaises(TypeError):
+                Json.decode_batch(encoded[:-1] + ", 1]")
+            with self.assertRaises(ValueError):
+                Json.decode_batch(encoded[:-1])
+
+    def test_avro(self):
+        events = make_events()
+        events.append(CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1", data={"spo2": 99.0}))
+        encoded = Avro.encode_many(events)
+        batch = Avro.decode_batch(encoded)
+        self.assertEqual(list(Avro.decode_iter(encoded)), batch.to_events())
+        with self.assertRaises(ValueError):
+            Avro.decode_batch(encoded[:-1])
+
+    def test_instrumented(self):
+        stats = CodecStats()
+        Json.observer = stats
+        try:
+            Json.decode_batch(Json.encode(make_events()))
+        finally:
+            Json.observer = None
+        self.assertEqual(11, stats.snapshot()["Json.decode_batch"]["events"])
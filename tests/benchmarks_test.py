@@ -0,0 +1,108 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks import runner
+from benchmarks.cases import BATCH_SIZE, Case, all_groups, iter_cases
+
+
+class BenchmarkRunnerTests(unittest.TestCase):
+
+    BASELINE = {
+        "json.decode/16": {"events_per_sec": 1000.0, "bytes_per_sec": 5000.0, "allocs_per_event": 10.0},
+        "import/spce": {"seconds": 0.05},
+    }
+
+    def test_compare_no_regression(self):
+        results = {
+            "json.decode/16": {"events_per_sec": 950.0, "bytes_per_sec": 4750.0, "allocs_per_event": 10.4},
+            "import/spce": {"seconds": 0.052},
+            "json.encode/16": {"events_per_sec": 1.0, "allocs_per_event": 1.0},
+        }
+        self.assertEqual([], runner.compare(results, self.BASELINE, 0.1))
+
+    def test_compare_regressions(self):
+        results = {
+            "json.decode/16": {"events_per_sec": 800.0, "bytes_per_sec": 4000.0, "allocs_per_event": 12.0},
+            "import/spce": {"seconds": 0.08},
+        }
+        target = [
+            ("import/spce", "seconds", 0.05, 0.08),
+            ("json.decode/16", "allocs_per_event", 10.0, 12.0),
+            ("json.decode/16", "bytes_per_sec", 5000.0, 4000.0),
+            ("json.decode/16", "events_per_sec", 1000.0, 800.0),
+        ]
+        self.assertEqual(target, sorted(runner.compare(results, self.BASELINE, 0.1)))
+
+    def test_run_save_load(self):
+        case = Case("noop", lambda: [], 2, 10)
+        results = runner.run([case], (), repeat=1, min_time=0.001)
+        self.assertEqual({"noop"}, set(results))
+        self.assertEqual({"events_per_sec", "bytes_per_sec", "allocs_per_event", "memory_per_event"},
+                         set(results["noop"]))
+        self.assertAlmostEqual(0.5, results["noop"]["allocs_per_event"], delta=0.1)
+        # an empty list per call
+        self.assertAlmostEqual(sys.getsizeof([]) / 2, results["noop"]["memory_per_event"], delta=16)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            runner.save(path, results)
+            self.assertEqual(results, runner.load(path))
+
+    def test_run_setup(self):
+        calls = []
+        case = Case("noop", lambda: calls.append("call"), 1, 0, lambda: calls.append("setup"))
+        runner.run([case], (), repeat=2, min_time=0.001)
+        self.assertEqual("setup", calls[0])
+        # before each timing run, and each allocation and memory measurement
+        self.assertLess(4, calls.count("setup"))
+
+    def test_cases_run(self):
+        for group in all_groups():
+            with group.build() as cases:
+                # the names of the group, or none if it is not available
+                self.assertIn([case.name for case in cases], ([], list(group.names)))
+                for case in cases:
+                    if case.setup:
+                        case.setup()
+                    case.func()
+
+    def test_iter_cases(self):
+        # only the groups of the selected cases are built
+        with mock.patch("benchmarks.cases._log_cases") as log_cases, \
+                mock.patch("benchmarks.cases._index_cases") as index_cases:
+            self.assertEqual(["json.decode_batch/batch100-1k"], [case.name for case in iter_cases("json.decode_batch/")])
+        log_cases.assert_not_called()
+        index_cases.assert_not_called()
+        self.assertEqual(["create/uuid4", "factory.make/counter"], [case.name for case in iter_cases("create/uuid4")] +
+                         [case.name for case in iter_cases("make/counter")])
+
+    def test_log_cases(self):
+        # each run appends to a new log, and the logs are closed and removed after the cases
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = os.path.join(tmp, "logs")
+            os.mkdir(directory)
+            with mock.patch("tempfile.mkdtemp", return_value=directory):
+                cases = iter_cases("log.append_many")
+                case = next(cases)
+                for _ in range(2):
+                    case.setup()
+                    self.assertEqual(range(0, BATCH_SIZE), case.func())
+                    self.assertEqual(range(BATCH_SIZE, 2 * BATCH_SIZE), case.func())
+                self.assertEqual([], list(cases))
+            self.assertFalse(os.path.exists(directory))
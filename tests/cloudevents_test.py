@@ -13,8 +13,10 @@
 # limitations under the License.
 
 import unittest
+from datetime import datetime
+from unittest import mock
 
-from spce import CloudEvent
+from spce import CloudEvent, _rfc3339
 
 
 class CloudEventTestCase(unittest.TestCase):
@@ -143,9 +145,6 @@ class CloudEventTestCase(unittest.TestCase):
                            id="1000",
                            time="2020-09-25T13:32:56+03:00")
 
-
-
-
     def test_set_extension_attribute(self):
         event = CloudEvent(
             type="OximeterMeasured",
@@ -212,3 +211,110 @@ class CloudEventTestCase(unittest.TestCase):
         for name, value in attributes.items():
             self.assertEqual(value, event.attribute(name))
 
+
+class CloudEventFromDictTests(unittest.TestCase):
+
+    def test_same_as_constructor(self):
+        cases = [
+            dict(type="OximeterMeasured", source="oximeter/123", id="1000"),
+            dict(id="1000", source="oximeter/123", type="OximeterMeasured", specversion="0.3", data='{"spo2": 99}',
+                 datacontenttype="application/json", external1="foo/bar", external2=0),
+            dict(type="OximeterMeasured", source="oximeter/123", id="1000", data=b"\x01", subject="", time=None,
+                 dataschema="", datacontenttype=""),
+            dict(type="OximeterMeasured", source="oximeter/123", id="1000", data="",
+                 time=datetime(2020, 9, 25, 13, 32, 56)),
+        ]
+        for d in cases:
+            target = CloudEvent(**d)
+            event = CloudEvent.from_dict(dict(d))
+            self.assertEqual(target, event)
+            self.assertEqual(target._has_binary_data, event._has_binary_data)
+            self.assertEqual(target.time, event.time)
+
+    def test_adopts_dict(self):
+        d = dict(id="1000", source="oximeter/123", type="OximeterMeasured", data="x")
+        event = CloudEvent.from_dict(d)
+        self.assertIs(d, event._attributes)
+        # the data is popped, the order is kept
+        self.assertEqual(["id", "source", "type", "specversion"], list(d))
+        self.assertEqual("x", event.data)
+
+    def test_missing_required(self):
+        with self.assertRaises(TypeError) as cm:
+            CloudEvent.from_dict(dict(type="OximeterMeasured", data="x"))
+        self.assertIn("source, id", str(cm.exception))
+        with self.assertRaises(TypeError):
+            CloudEvent.from_dict(dict(type="OximeterMeasured", source="oximeter/123", id="1", time=5))
+
+
+class CloudEventTimeTests(unittest.TestCase):
+
+    def test_time_datetime(self):
+        from datetime import datetime, timezone, timedelta
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000",
+                           time="2020-09-28T21:33:21.5+03:00")
+        target = datetime(2020, 9, 28, 21, 33, 21, 500000, tzinfo=timezone(timedelta(hours=3)))
+        self.assertEqual(target, event.time_datetime)
+        self.assertEqual(1601318001500000000, event.time_epoch_ns)
+        # cached
+        self.assertIs(event.time_datetime, event.time_datetime)
+
+    def test_time_from_datetime(self):
+        from datetime import datetime, timezone
+        dt = datetime(2020, 9, 25, 13, 32, 56, 123)
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", time=dt)
+        self.assertEqual(dt.replace(tzinfo=timezone.utc), event.time_datetime)
+        self.assertEqual(int(dt.replace(tzinfo=timezone.utc).timestamp()) * 10 ** 9 + 123000, event.time_epoch_ns)
+
+    def test_no_time(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000")
+        self.assertIsNone(event.time_datetime)
+        self.assertIsNone(event.time_epoch_ns)
+
+    def test_invalid_time(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", time="2020-09-28")
+        with self.assertRaises(ValueError):
+            event.time_datetime
+
+    def test_lazy_event(self):
+        from spce import Avro, Json
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", time="2020-09-28T21:33:21Z")
+        for codec in Json, Avro:
+            decoded = codec.decode(codec.encode(event), lazy=True)
+            self.assertEqual(1601328801000000000, decoded.time_epoch_ns)
+
+
+class Rfc3339Tests(unittest.TestCase):
+
+    def test_parse(self):
+        from datetime import datetime, timezone, timedelta
+        from spce._rfc3339 import parse_rfc3339
+        utc = timezone.utc
+        cases = [
+            ("2020-09-28T21:33:21Z", datetime(2020, 9, 28, 21, 33, 21, tzinfo=utc), 1601328801000000000),
+            ("2020-09-28t21:33:21z", datetime(2020, 9, 28, 21, 33, 21, tzinfo=utc), 1601328801000000000),
+            ("2020-09-28 21:33:21.1Z", datetime(2020, 9, 28, 21, 33, 21, 100000, tzinfo=utc), 1601328801100000000),
+            ("2020-09-28T21:33:21.123456789Z", datetime(2020, 9, 28, 21, 33, 21, 123456, tzinfo=utc),
+             1601328801123456789),
+            ("2020-09-28T21:33:21.1234567891Z", datetime(2020, 9, 28, 21, 33, 21, 123456, tzinfo=utc),
+             1601328801123456789),
+            ("2020-09-28T21:33:21-00:00", datetime(2020, 9, 28, 21, 33, 21, tzinfo=utc), 1601328801000000000),
+            ("1969-12-31T23:59:59.999999999-01:30",
+             datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone(-timedelta(hours=1, minutes=30))),
+             5399999999999),
+        ]
+        for fromisoformat in True, False:
+            # both the datetime.fromisoformat path of Python 3.11+ and the fallback
+            with mock.patch("spce._rfc3339._FROMISOFORMAT", fromisoformat and _rfc3339._FROMISOFORMAT):
+                for text, dt, ns in cases:
+                    self.assertEqual((dt, ns), parse_rfc3339(text), text)
+                    self.assertEqual(dt.utcoffset(), parse_rfc3339(text)[0].utcoffset(), text)
+
+    def test_parse_invalid(self):
+        from spce._rfc3339 import parse_rfc3339
+        for text in ["", "2020-09-28", "2020-09-28T21:33:21", "2020-09-28T21:33Z", "2020/09/28T21:33:21Z",
+                     "2020-09-28T21:33:21.Z", "2020-09-28T21:33:21+0300", "2020-13-28T21:33:21Z",
+                     "2020-09-28X21:33:21Z", "+020-09-28T21:33:21Z", "2020-09-28T21:33:21Z\n",
+                     "2020-09-28T21:33:21+03:00\n", b"2020-09-28T21:33:21Z", 1601328801, None]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_rfc3339(text)
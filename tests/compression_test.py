@@ -0,0 +1,152 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bz2
+import gzip
+import io
+import lzma
+import unittest
+import zlib
+
+from spce import Avro, CloudEvent, Json, JsonLines
+from spce.compression import PresetDictionary, compress, compress_to, decompress
+
+METHODS = "gzip", "zlib", "bz2", "lzma"
+
+
+def make_events(count=50):
+    return [CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(1000 + i),
+                       time="2020-09-28T21:33:%02dZ" % (i % 60), datacontenttype="application/json",
+                       data='{"spo2": %d}' % (90 + i % 10) if i % 3 else bytes([i, 0, 255]))
+            for i in range(count)]
+
+
+class StreamingCompressionTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        events = make_events()
+        for method in METHODS:
+            chunks = list(compress(Json.iter_encode(events, chunk_size=256), method))
+            self.assertEqual(events, list(Json.iter_decode(decompress(chunks, method))))
+            chunks = list(compress(JsonLines.iter_encode(events, chunk_size=256), method))
+            self.assertEqual(events, list(JsonLines.iter_decode(decompress(chunks, method))))
+            chunks = list(compress(Avro.iter_encode(events, chunk_size=256), method))
+            self.assertEqual(events, list(Avro.decode_iter(decompress(chunks, method))))
+
+    def test_standard_formats(self):
+        encoded = Json.encode(make_events()).encode()
+        compressed = {method: b"".join(compress([encoded], method)) for method in METHODS}
+        self.assertEqual(encoded, gzip.decompress(compressed["gzip"]))
+        self.assertEqual(encoded, zlib.decompress(compressed["zlib"]))
+        self.assertEqual(encoded, bz2.decompress(compressed["bz2"]))
+        self.assertEqual(encoded, lzma.decompress(compressed["lzma"]))
+        self.assertEqual(encoded, b"".join(decompress(gzip.compress(encoded))))
+        self.assertEqual(encoded, b"".join(decompress(bz2.compress(encoded, 1), "bz2")))
+        self.assertLess(len(b"".join(compress([encoded], "gzip", level=9))),
+                        len(b"".join(compress([encoded], "gzip", level=1))))
+
+    def test_files(self):
+        events = make_events()
+        with io.BytesIO() as f:
+            compress_to(JsonLines.iter_encode(events), f, "lzma")
+            f.seek(0)
+            self.assertEqual(events, list(JsonLines.iter_decode(decompress(f, "lzma", chunk_size=100))))
+        with io.BytesIO() as f:
+            Json.encode_to(events, gzip.GzipFile(fileobj=f, mode="wb"))
+            self.assertEqual(events, list(Json.iter_decode(decompress(f.getvalue()))))
+
+    def test_concatenated_streams(self):
+        first, second = make_events(10), make_events(5)
+        data = b"".join(compress(JsonLines.iter_encode(first))) + b"".join(compress(JsonLines.iter_encode(second)))
+        # split in the middle of the second member
+        chunks = [data[:len(data) - 10], data[len(data) - 10:]]
+        self.assertEqual(first + second, JsonLines.decode(b"".join(decompress(chunks))))
+
+    def test_truncated(self):
+        data = b"".join(compress(Avro.iter_encode(make_events()), "zlib"))
+        with self.assertRaises(ValueError):
+            list(decompress(data[:-5], "zlib"))
+        self.assertEqual([], list(decompress([], "zlib")))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            list(compress([b"x"], "snappy"))
+        with self.assertRaises(ValueError):
+            list(decompress([b"x"], "snappy"))
+
+
+class IterEncodeTests(unittest.TestCase):
+
+    def test_chunks(self):
+        events = make_events()
+        chunks = list(JsonLines.iter_encode(events, chunk_size=256))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(JsonLines.encode(events), "".join(chunks))
+        self.assertEqual([], list(JsonLines.iter_encode([])))
+        chunks = list(Avro.iter_encode(events, chunk_size=256))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(Avro.encode_many(events), b"".join(chunks))
+        # decode_iter takes chunks as well, empty ones don't end the stream
+        self.assertEqual(events, list(Avro.decode_iter([b""] + chunks + [b""])))
+        with self.assertRaises(ValueError):
+            list(Avro.decode_iter(chunks[:1] + [chunks[1][:5]]))
+
+
+class PresetDictionaryTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        events = make_events(200)
+        for codec, encode in ((Json, lambda e: Json.encode(e).encode()), (Avro, Avro.encode)):
+            dictionary = PresetDictionary.train(events[:100], codec)
+            self.assertLessEqual(len(dictionary.dictionary), 8 * 1024)
+            plain = 0
+            preset = 0
+            for event in events[100:]:
+                encoded = encode(event)
+                compressed = dictionary.compress(encoded)
+                self.assertEqual(encoded, dictionary.decompress(compressed))
+                plain += len(zlib.compress(encoded))
+                preset += len(compressed)
+            self.assertLess(preset, plain / 2)
+            # the same dictionary on the other side
+            other = PresetDictionary(dictionary.dictionary)
+            self.assertEqual(encode(events[0]), other.decompress(dictionary.compress(encode(events[0]))))
+
+    def test_str(self):
+        dictionary = PresetDictionary.train(make_events(), JsonLines)
+        text = JsonLines.encode(make_events(1))
+        self.assertEqual(text.encode(), dictionary.decompress(dictionary.compress(text)))
+
+    def test_size(self):
+        events = [CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", data="x" * 1000)]
+        # the data doesn't fit, the attributes do
+        dictionary = PresetDictionary.train(events, Json, size=100)
+        self.assertLessEqual(len(dictionary.dictionary), 100)
+        self.assertIn(b'"type":"OximeterMeasured"', dictionary.dictionary)
+        self.assertNotIn(b"xxx", dictionary.dictionary)
+        # none of the fragments fit
+        self.assertEqual(5, len(PresetDictionary.train(events, Json, size=5).dictionary))
+        dictionary = PresetDictionary.train(make_events(), Json, size=100 * 1024)
+        self.assertLessEqual(len(dictionary.dictionary), 32 * 1024)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            PresetDictionary(b"")
+        with self.assertRaises(ValueError):
+            PresetDictionary.train([])
+        with self.assertRaises(TypeError):
+            PresetDictionary.train(make_events(), codec=str)
+        dictionary = PresetDictionary.train(make_events())
+        with self.assertRaises(ValueError):
+            dictionary.decompress(dictionary.compress(b"x" * 100)[:-2])
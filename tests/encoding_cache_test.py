@@ -0,0 +1,97 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from spce import Avro, CloudEvent, CloudEventBatch, CloudEventTemplate, Json, JsonLines
+
+
+def make_events(count=3):
+    return [CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(1000 + i), data='{"spo2": 99}',
+                       datacontenttype="application/json")
+            for i in range(count)]
+
+
+class EncodingCacheTests(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        event = make_events(1)[0]
+        Json.encode(event)
+        Avro.encode(event)
+        self.assertIsNone(event._encodings)
+        self.assertIsNone(CloudEventTemplate(type="OximeterMeasured", source="oximeter/123").make("1")._encodings)
+        self.assertIsNone(CloudEventBatch([event])[0]._encodings)
+
+    def test_encode(self):
+        event = make_events(1)[0]
+        self.assertIs(event, event.enable_encoding_cache())
+        json_text = Json.encode(event)
+        avro_bytes = Avro.encode(event)
+        self.assertIs(json_text, Json.encode(event))
+        self.assertIs(avro_bytes, Avro.encode(event))
+        self.assertEqual({Json: json_text, Avro: avro_bytes}, event._encodings)
+        # enabling it again keeps the cached encodings
+        event.enable_encoding_cache()
+        self.assertIs(json_text, Json.encode(event))
+
+    def test_cached_encoding_is_used(self):
+        events = make_events()
+        for event in events:
+            event.enable_encoding_cache()
+            event._encodings[Json] = '{"id":"cached"}'
+            event._encodings[Avro] = b"cached"
+        self.assertEqual('[{"id":"cached"},{"id":"cached"},{"id":"cached"}]', Json.encode(events))
+        self.assertEqual('{"id":"cached"}\n' * 3, JsonLines.encode(events))
+        self.assertEqual(b"cached" * 3, Avro.encode_many(events))
+        self.assertEqual([b"cached"] * 3, [bytes(v) for v in Avro.encode_views(events)])
+
+
+class DecoderEncodingCacheTests(unittest.TestCase):
+
+    def test_json(self):
+        first = '{"type": "OximeterMeasured", "source": "oximeter/123", "id": "1000", "specversion": "1.0", ' \
+                '"data": "x"}'
+        second = '{"type": "OximeterMeasured", "source": "oximeter/123", "id": "1001", "specversion": "1.0", ' \
+                 '"data_base64": "AAE="}'
+        text = "[ %s,\n  %s ]" % (first, second)
+        for lazy in (False, True):
+            events = Json.decode(text, lazy=lazy, cache_encoding=True)
+            self.assertEqual(Json.decode(text), events)
+            self.assertEqual("[%s,%s]" % (first, second), Json.encode(events))
+            # the other encodings are cached on first use
+            self.assertIs(Avro.encode(events[0]), Avro.encode(events[0]))
+        event = Json.decode(" %s " % first, cache_encoding=True, validate=True, intern=True)
+        self.assertEqual(first, Json.encode(event))
+
+    def test_json_lines(self):
+        text = '{"type": "OximeterMeasured", "source": "oximeter/123", "id": "1000", "specversion": "1.0"}\n' \
+               '{"type": "OximeterMeasured", "source": "oximeter/123", "id": "1001", "specversion": "1.0"}\n'
+        for source in (text, text.encode()):
+            for lazy in (False, True):
+                events = JsonLines.decode(source, lazy=lazy, cache_encoding=True)
+                self.assertEqual(JsonLines.decode(text), events)
+                self.assertEqual(text, JsonLines.encode(events))
+
+    def test_avro(self):
+        events = make_events()
+        encoded = Avro.encode_many(events)
+        for lazy in (False, True):
+            decoded = list(Avro.decode_iter(encoded, lazy=lazy, cache_encoding=True))
+            self.assertEqual(events, decoded)
+            self.assertEqual(Avro.encode(events[1]), decoded[1]._encodings[Avro])
+            self.assertEqual(encoded, Avro.encode_many(decoded))
+        single = Avro.encode(events[0])
+        self.assertIs(single, Avro.encode(Avro.decode(single, cache_encoding=True)))
+        self.assertEqual(events[0], Avro.decode(single, cache_encoding=True, validate=True))
+        self.assertEqual({"id": "1000"}, Avro.decode(single, fields=["id"], cache_encoding=True))
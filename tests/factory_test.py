@@ -0,0 +1,173 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import time
+import unittest
+from datetime import datetime, timezone
+from threading import Thread
+
+from spce import CloudEventFactory, CloudEventTemplate
+from spce.factory import CoarseClock, CounterIds, UlidIds, _CROCKFORD
+
+_ULID = re.compile(r"[0-7][%s]{25}$" % _CROCKFORD)
+
+
+def decode_ulid_time(ulid: str) -> int:
+    ms = 0
+    for ch in ulid[:10]:
+        ms = ms * 32 + _CROCKFORD.index(ch)
+    return ms
+
+
+class CounterIdsTests(unittest.TestCase):
+
+    def test_ids(self):
+        ids = CounterIds()
+        first = ids()
+        self.assertRegex(first, r"^[0-9A-Z]{16}-1$")
+        prefix = first[:-1]
+        self.assertEqual([prefix + "2", prefix + "3"], ids.many(2))
+        self.assertEqual(prefix + "4", ids())
+        self.assertNotEqual(prefix, CounterIds()()[:-1])
+        self.assertEqual(["node1-1", "node1-2"], CounterIds(prefix="node1-").many(2))
+
+    def test_threads(self):
+        ids = CounterIds()
+        results = []
+
+        def generate():
+            results.extend(ids() for _ in range(1000))
+            results.extend(ids.many(1000))
+
+        threads = [Thread(target=generate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(8000, len(set(results)))
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_fork(self):
+        ids = CounterIds()
+        ids()
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_fd, ids().encode())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        child_id = os.read(read_fd, 100).decode()
+        os.close(read_fd)
+        os.close(write_fd)
+        self.assertNotEqual(ids(), child_id)
+        self.assertTrue(child_id.endswith("-1"))
+
+
+class UlidIdsTests(unittest.TestCase):
+
+    def test_format(self):
+        before = int(time.time() * 1000)
+        ulid = UlidIds()()
+        after = int(time.time() * 1000)
+        self.assertRegex(ulid, _ULID)
+        self.assertTrue(before <= decode_ulid_time(ulid) <= after)
+
+    def test_monotonic(self):
+        ids = UlidIds()
+        generated = [ids() for _ in range(1000)] + ids.many(1000)
+        self.assertEqual(sorted(generated), generated)
+        self.assertEqual(2000, len(set(generated)))
+
+    def test_carry(self):
+        ids = UlidIds()
+        first = ids.many(1)[0]
+        ids._low = (1 << 40) - 1
+        ids._high = (1 << 40) - 1
+        # the random part overflows within the same millisecond
+        second = ids._next(ids._ms)
+        self.assertLess(first, second)
+        self.assertEqual(decode_ulid_time(first) + 1, decode_ulid_time(second))
+        self.assertEqual("0" * 16, second[10:])
+
+
+class CoarseClockTests(unittest.TestCase):
+
+    def test_clock(self):
+        text = CoarseClock(resolution=1)()
+        self.assertRegex(text, r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ$")
+        parsed = datetime.strptime(text, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        self.assertLess(abs(parsed.timestamp() - time.time()), 2)
+        self.assertRegex(CoarseClock()(), r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$")
+        self.assertRegex(CoarseClock(resolution=0.000001)(), r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}Z$")
+        with self.assertRaises(ValueError):
+            CoarseClock(resolution=0)
+
+    def test_cached(self):
+        clock = CoarseClock(resolution=60)
+        self.assertIs(clock(), clock())
+
+    def test_truncated_exactly(self):
+        from unittest import mock
+        # times at millisecond boundaries, which float arithmetic put 1 ms early
+        for ms in range(1601328801000, 1601328801000 + 20000, 7):
+            with mock.patch("spce.factory._time", return_value=ms / 1000):
+                text = CoarseClock()()
+            self.assertEqual("%03d" % (ms % 1000), text[20:23], ms)
+        with mock.patch("spce.factory._time", return_value=1601328801.9999):
+            self.assertEqual("2020-09-28T21:33:21.999Z", CoarseClock()())
+            self.assertEqual("2020-09-28T21:33:20Z", CoarseClock(resolution=5)())
+            self.assertEqual("2020-09-28T21:33:21.999900Z", CoarseClock(resolution=0.000001)())
+
+
+class CloudEventFactoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.template = CloudEventTemplate(type="OximeterMeasured", source="oximeter/123",
+                                           datacontenttype="application/json", external1="foo/bar")
+
+    def test_make(self):
+        factory = CloudEventFactory(self.template, ids=CounterIds(prefix="p-"))
+        event = factory.make('{"spo2": 99}')
+        self.assertIs(self.template, factory.template)
+        self.assertEqual(self.template.make("p-1", data='{"spo2": 99}'), event)
+        self.assertEqual(list(self.template.make("p-1")._attributes), list(event._attributes))
+        self.assertEqual(b"\x01", factory.make(b"\x01").data)
+        self.assertTrue(factory.make(b"\x01")._has_binary_data)
+        self.assertIsNone(factory.make().data)
+
+    def test_clock(self):
+        factory = CloudEventFactory(self.template, ids=lambda: "1000", clock=lambda: "2020-09-28T21:33:21Z")
+        event = factory.make()
+        self.assertEqual(self.template.make("1000", time="2020-09-28T21:33:21Z"), event)
+        self.assertEqual(list(self.template.make("1000", time="x")._attributes), list(event._attributes))
+        factory = CloudEventFactory(self.template, clock=lambda: datetime(2020, 9, 25, 13, 32, 56))
+        self.assertEqual("2020-09-25T13:32:56Z", factory.make().time)
+        self.assertTrue(CloudEventFactory(self.template, clock=CoarseClock()).make().time)
+
+    def test_make_many(self):
+        factory = CloudEventFactory(self.template, ids=CounterIds(prefix="p-"), clock=lambda: "2020-09-28T21:33:21Z")
+        events = factory.make_many(3, iter(["a", b"b", ""]))
+        self.assertEqual([self.template.make("p-%d" % i, time="2020-09-28T21:33:21Z", data=data)
+                          for i, data in ((1, "a"), (2, b"b"), (3, ""))], events)
+        self.assertEqual(["p-4", "p-5"], [e.id for e in factory.make_many(2)])
+        # the data iterable may be longer
+        self.assertEqual(2, len(factory.make_many(2, ["a", "b", "c"])))
+        with self.assertRaises(ValueError):
+            factory.make_many(3, ["a"])
+        # ids without a many method
+        factory = CloudEventFactory(self.template, ids=iter(["x", "y"]).__next__)
+        self.assertEqual(["x", "y"], [e.id for e in factory.make_many(2)])
+        self.assertEqual([], factory.make_many(0))
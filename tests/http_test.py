@@ -0,0 +1,146 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from spce import CloudEvent, Avro, Json
+from spce import http
+
+
+class HttpBinaryModeTests(unittest.TestCase):
+
+    def test_to_binary(self):
+        data = b'\x01\x02\x03\x04'
+        event = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            time="2020-09-28T21:33:21Z",
+            datacontenttype="application/octet-stream",
+            data=data,
+            external1="foo/bar",
+            external2="Ünicode \"quoted\" 100%",
+            external3=5,
+            external4=True,
+            external5=b"\x01",
+        )
+        headers, body = http.to_binary(event)
+        target = {
+            "ce-type": "OximeterMeasured",
+            "ce-source": "oximeter/123",
+            "ce-id": "1000",
+            "ce-specversion": "1.0",
+            "ce-time": "2020-09-28T21:33:21Z",
+            "content-type": "application/octet-stream",
+            "ce-external1": "foo/bar",
+            "ce-external2": "%C3%9Cnicode%20%22quoted%22%20100%25",
+            "ce-external3": "5",
+            "ce-external4": "true",
+            "ce-external5": "AQ==",
+        }
+        self.assertEqual(target, headers)
+        self.assertIs(data, body)
+
+    def test_to_binary_text_data(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", data='{"spo2": 99}')
+        self.assertEqual(b'{"spo2": 99}', http.to_binary(event)[1])
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000")
+        self.assertEqual(b"", http.to_binary(event)[1])
+
+    def test_from_binary(self):
+        headers = [
+            ("Ce-Type", "OximeterMeasured"),
+            ("CE-SOURCE", "oximeter/123"),
+            ("ce-id", "1000"),
+            ("ce-specversion", "1.0"),
+            ("Content-Type", "application/json"),
+            ("Content-Length", "12"),
+            ("ce-external2", "%C3%9Cnicode%20%22quoted%22%20100%25"),
+        ]
+        target = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            datacontenttype="application/json",
+            data=b'{"spo2": 99}',
+            external2="Ünicode \"quoted\" 100%",
+        )
+        body = b'{"spo2": 99}'
+        event = http.from_binary(headers, body)
+        self.assertEqual(target, event)
+        self.assertIs(body, event.data)
+        self.assertEqual(target, http.from_binary(dict(headers), body))
+        asgi_headers = [(k.lower().encode(), v.encode()) for k, v in headers]
+        self.assertEqual(target, http.from_binary(asgi_headers, memoryview(body)))
+        # other bytes-like bodies are copied into bytes
+        for buffer in (bytearray(body), memoryview(bytearray(body))):
+            event = http.from_binary(headers, buffer)
+            self.assertIs(bytes, type(event.data))
+            self.assertTrue(event._has_binary_data)
+            buffer[:1] = b"["
+            self.assertEqual(target, event)
+
+    def test_binary_round_trip(self):
+        event = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            subject="subject1",
+            data=b"\xff\x00",
+            external1="çok güzel",
+        )
+        self.assertEqual(event, http.from_binary(*http.to_binary(event)))
+
+    def test_from_binary_missing_attribute(self):
+        with self.assertRaises(TypeError):
+            http.from_binary({"ce-type": "OximeterMeasured"}, b"")
+
+
+class HttpStructuredModeTests(unittest.TestCase):
+
+    EVENT = CloudEvent(
+        type="OximeterMeasured",
+        source="oximeter/123",
+        id="1000",
+        datacontenttype="application/json",
+        data=json.dumps({"spo2": 99}),
+    )
+
+    def test_json(self):
+        headers, body = http.to_structured(self.EVENT)
+        self.assertEqual({"content-type": "application/cloudevents+json"}, headers)
+        self.assertEqual(self.EVENT, Json.decode(body))
+        self.assertEqual(self.EVENT, http.from_structured(headers, body))
+        self.assertEqual(self.EVENT, http.from_http({"Content-Type": "application/cloudevents+json; charset=utf-8"}, body))
+
+    def test_avro(self):
+        headers, body = http.to_structured(self.EVENT, Avro)
+        self.assertEqual({"content-type": "application/cloudevents+avro"}, headers)
+        self.assertEqual(Avro.encode(self.EVENT), body)
+        self.assertEqual(self.EVENT, http.from_http(headers, body))
+
+    def test_batch(self):
+        events = [self.EVENT, self.EVENT]
+        headers, body = http.to_batch(events)
+        self.assertEqual({"content-type": "application/cloudevents-batch+json"}, headers)
+        self.assertEqual(events, http.from_batch(headers, body))
+        self.assertEqual(events, http.from_http(headers, body))
+        with self.assertRaises(ValueError):
+            http.from_batch(*http.to_structured(self.EVENT))
+        with self.assertRaises(ValueError):
+            http.from_structured(headers, body)
+
+    def test_from_http_binary(self):
+        self.assertEqual(self.EVENT._attributes, http.from_http(*http.to_binary(self.EVENT))._attributes)
@@ -0,0 +1,173 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from spce import Avro, CloudEvent, Json, JsonLines
+from spce.index import EventIndex
+
+TYPES = "OximeterMeasured", "HeartRateMeasured", "ThermometerMeasured"
+
+
+def make_events(count=60):
+    events = []
+    for i in range(count):
+        events.append(CloudEvent(
+            type=TYPES[i % 3],
+            source="device/%d" % (i % 4),
+            id=str(1000 + i // 2),
+            # every fifth event has no time
+            time="2020-09-28T21:%02d:00Z" % (i % 60) if i % 5 else None,
+            subject="ölçüm" if i % 7 == 0 else None,
+            data='{"value": %d}' % i if i % 2 else bytes([i]) * 5,
+        ))
+    return events
+
+
+def encode(events, fmt) -> bytes:
+    if fmt == "avro":
+        return Avro.encode_many(events)
+    if fmt == "jsonl":
+        return JsonLines.encode(events).encode()
+    return Json.encode(events).encode()
+
+
+class EventIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.events = make_events()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write(self, data: bytes, name="events") -> str:
+        path = os.path.join(self._tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def indexes(self):
+        for fmt in ("avro", "jsonl", "json"):
+            path = self.write(encode(self.events, fmt), "events." + fmt)
+            index = EventIndex.build(path, fmt)
+            self.assertEqual(fmt, index.format)
+            yield index
+            # and the saved index
+            index.save(path + ".index")
+            yield EventIndex.load(path + ".index", path)
+
+    def test_find(self):
+        events = self.events
+        for index in self.indexes():
+            self.assertEqual(len(events), len(index))
+            self.assertEqual([events[1]], index.find("device/1", "1000"))
+            self.assertEqual([events[59]], index.find("device/3", "1029"))
+            self.assertEqual([], index.find("device/2", "1000"))
+            self.assertEqual([], index.find("device/1", "9999"))
+
+    def test_find_duplicates_and_collisions(self):
+        events = self.events
+        duplicated = events + events[:3]
+        path = self.write(Avro.encode_many(duplicated))
+        index = EventIndex.build(path, "avro")
+        self.assertEqual([events[1], events[1]], index.find("device/1", "1000"))
+        # all keys share a hash, the decoded events are compared
+        with mock.patch("spce.index._hash_key", return_value=42):
+            index = EventIndex.build(path, "avro")
+            self.assertEqual([events[2], events[2]], index.find("device/2", "1001"))
+            self.assertEqual([], index.find("device/2", "1000"))
+
+    def test_query(self):
+        events = self.events
+        for index in self.indexes():
+            self.assertEqual({type: 20 for type in TYPES}, index.types)
+            self.assertEqual(events, list(index.query()))
+            self.assertEqual(events[1::3], list(index.query("HeartRateMeasured")))
+            self.assertEqual([], list(index.query("Unknown")))
+            in_range = [e for e in events if e.time and "2020-09-28T21:10:00Z" <= e.time < "2020-09-28T21:20:00Z"]
+            self.assertEqual(in_range, list(index.query(start="2020-09-28T21:10:00Z", end="2020-09-28T21:20:00Z")))
+            self.assertEqual(in_range, list(index.query(start=datetime(2020, 9, 28, 21, 10),
+                                                        end=datetime(2020, 9, 28, 21, 20, tzinfo=timezone.utc))))
+            self.assertEqual([e for e in in_range if e.type == "OximeterMeasured"],
+                             list(index.query("OximeterMeasured", "2020-09-28T21:10:00Z", "2020-09-28T21:20:00Z")))
+            # the same instant in another time zone, and nanoseconds since the epoch
+            after = [e for e in events if e.time and e.time >= "2020-09-28T21:55:00Z"]
+            self.assertEqual(after, list(index.query(start="2020-09-29T00:55:00+03:00")))
+            self.assertEqual(after, list(index.query(start=events[56].time_epoch_ns - 60 * 10 ** 9)))
+            self.assertEqual([e for e in events if e.time and e.time < "2020-09-28T21:02:00Z"],
+                             list(index.query(end="2020-09-28T21:02:00Z")))
+            self.assertEqual([0, 3, 6], index.records("OximeterMeasured")[:3])
+
+    def test_json_formats(self):
+        # a single event, whitespace and non-ASCII text before the events
+        event = self.events[7]
+        path = self.write((' \n%s\n' % Json.encode(event)).encode())
+        self.assertEqual([event], EventIndex.build(path, "json").find(event.source, event.id))
+        path = self.write(('[\n  %s ,\n %s\n]\n' % (Json.encode(event), Json.encode(self.events[8]))).encode())
+        self.assertEqual([self.events[8]], list(EventIndex.build(path, "json").query(self.events[8].type)))
+        path = self.write(("\n%s\n\n" % JsonLines.encode(self.events).rstrip()).encode())
+        self.assertEqual([e for e in self.events if e.time],
+                         list(EventIndex.build(path, "jsonl").query(start="2020-09-28T21:00:00Z")))
+        path = self.write(b"[]")
+        self.assertEqual([], list(EventIndex.build(path, "json").query()))
+        path = self.write(b"")
+        self.assertEqual(0, len(EventIndex.build(path, "avro")))
+
+    def test_json_scan(self):
+        # a batch is scanned in chunks, which split events and non-ASCII characters, written unescaped here
+        events = self.events
+        text = json.dumps(json.loads(Json.encode(events)), ensure_ascii=False)
+        self.assertIn("ölçüm", text)
+        with mock.patch("spce.index._CHUNK_SIZE", 7):
+            index = EventIndex.build(self.write(text.encode()), "json")
+        self.assertEqual(events, list(index.query()))
+        self.assertEqual([events[14]], index.find("device/2", "1007"))
+        # long data is skipped, not parsed
+        data = "ölçüm" * 1000
+        events = [CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(i), datacontenttype="text/plain",
+                             data=data) for i in range(3)]
+        for fmt in ("json", "jsonl"):
+            path = self.write(encode(events, fmt), "long." + fmt)
+            with mock.patch("spce.json.json.loads", wraps=json.loads) as loads:
+                index = EventIndex.build(path, fmt)
+            self.assertEqual(3, loads.call_count)
+            self.assertFalse([call for call in loads.call_args_list if data in call[0][0]])
+            self.assertEqual(events[1:2], index.find("oximeter/123", "1"))
+
+    def test_errors(self):
+        path = self.write(Json.encode(self.events).encode())
+        with self.assertRaises(ValueError):
+            EventIndex.build(path, "xml")
+        with self.assertRaises(ValueError):
+            EventIndex.build(self.write(b'[{"id": "1"}', "truncated.json"), "json")
+        with self.assertRaises(TypeError):
+            EventIndex.build(self.write(b"[1]", "numbers.json"), "json")
+        with self.assertRaises(ValueError):
+            EventIndex.build(self.write(Avro.encode_many(self.events)[:-3], "truncated.avro"), "avro")
+        index = EventIndex.build(path, "json")
+        index.save(path + ".index")
+        with self.assertRaises(ValueError):
+            EventIndex.load(path, path)
+        with open(path, "ab") as f:
+            f.write(b"\n")
+        with self.assertRaises(ValueError):
+            EventIndex.load(path + ".index", path)
+        with self.assertRaises(ValueError):
+            list(index.query())
@@ -0,0 +1,204 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import unittest
+
+from spce import CloudEvent, Avro, Json, JsonLines
+from spce.instrument import CodecObserver, CodecStats
+
+
+class CodecStatsTests(unittest.TestCase):
+
+    EVENTS = [
+        CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(i), data=json.dumps({"spo2": i}))
+        for i in range(3)
+    ]
+
+    def setUp(self):
+        self.stats = CodecStats()
+        Json.observer = Avro.observer = JsonLines.observer = self.stats
+
+    def tearDown(self):
+        Json.observer = Avro.observer = JsonLines.observer = None
+
+    def test_json(self):
+        text = Json.encode(self.EVENTS)
+        Json.encode(self.EVENTS[0])
+        Json.decode(text)
+        list(Json.iter_decode(io.StringIO(text)))
+        stats = self.stats.snapshot()
+        self.assertEqual({"Json.encode", "Json.decode", "Json.iter_decode"}, set(stats))
+        self.assertEqual(2, stats["Json.encode"]["calls"])
+        self.assertEqual(4, stats["Json.encode"]["events"])
+        self.assertEqual(len(text) + len(Json.encode(self.EVENTS[0])), stats["Json.encode"]["bytes"])
+        self.assertEqual({"calls": 1, "events": 3, "bytes": len(text), "failures": 0},
+                         _without_seconds(stats["Json.decode"]))
+        self.assertEqual({"calls": 1, "events": 3, "bytes": 0, "failures": 0},
+                         _without_seconds(stats["Json.iter_decode"]))
+        self.assertGreater(stats["Json.decode"]["seconds"], 0)
+
+    def test_json_generator(self):
+        text = Json.encode(e for e in self.EVENTS)
+        self.assertEqual(self.EVENTS, Json.decode(text))
+        self.assertEqual(3, self.stats.snapshot()["Json.encode"]["events"])
+
+    def test_json_lines(self):
+        text = JsonLines.encode(self.EVENTS)
+        self.assertEqual(self.EVENTS, JsonLines.decode(text))
+        self.assertEqual(self.EVENTS[1:], list(JsonLines.iter_decode(text, 1)))
+        stats = self.stats.snapshot()
+        self.assertEqual({"JsonLines.encode", "JsonLines.decode", "JsonLines.iter_decode"}, set(stats))
+        self.assertEqual(3, stats["JsonLines.decode"]["events"])
+        self.assertEqual(2, stats["JsonLines.iter_decode"]["events"])
+
+    def test_avro(self):
+        encoded = Avro.encode_many(self.EVENTS)
+        Avro.encode_views(self.EVENTS)
+        Avro.decode(Avro.encode(self.EVENTS[0]))
+        self.assertEqual(self.EVENTS, list(Avro.decode_iter(encoded)))
+        Avro.decode_from(io.BytesIO(encoded))
+        stats = self.stats.snapshot()
+        self.assertEqual(len(encoded), stats["Avro.encode_many"]["bytes"])
+        self.assertEqual(len(encoded), stats["Avro.encode_views"]["bytes"])
+        self.assertEqual(1, stats["Avro.encode"]["events"])
+        self.assertEqual(1, stats["Avro.decode"]["events"])
+        self.assertEqual({"calls": 1, "events": 3, "bytes": len(encoded), "failures": 0},
+                         _without_seconds(stats["Avro.decode_iter"]))
+        self.assertEqual(1, stats["Avro.decode_from"]["events"])
+
+    def test_generators_are_not_read_ahead(self):
+        pulled = []
+
+        def events():
+            for event in self.EVENTS:
+                pulled.append(event)
+                yield event
+
+        chunks = Json.iter_encode(events(), chunk_size=1)
+        text = next(chunks)
+        self.assertEqual(1, len(pulled))
+        text += "".join(chunks)
+        self.assertEqual(self.EVENTS, Json.decode(text))
+        self.assertEqual(self.EVENTS, Json.decode(Json.encode(events())))
+        stats = self.stats.snapshot()
+        self.assertEqual(3, stats["Json.iter_encode"]["events"])
+        self.assertEqual(len(Json.encode(self.EVENTS)), stats["Json.iter_encode"]["bytes"])
+        self.assertEqual(3, stats["Json.encode"]["events"])
+
+    def test_streams(self):
+        import os
+        import tempfile
+        out = io.StringIO()
+        Json.encode_to(iter(self.EVENTS), out)
+        JsonLines.encode_to(iter(self.EVENTS), io.BytesIO())
+        Avro.encode_to(self.EVENTS[0], io.BytesIO())
+        encoded = b"".join(Avro.iter_encode(e for e in self.EVENTS))
+        _run(Json.aencode_to(iter(self.EVENTS), _Writer()))
+        _run(JsonLines.aencode_to(self.EVENTS, _Writer()))
+        _run(Avro.aencode_to(iter(self.EVENTS), _Writer()))
+        self.assertEqual(self.EVENTS, _run(_decode_stream(Json, out.getvalue().encode())))
+        self.assertEqual(self.EVENTS, _run(_decode_stream(JsonLines, JsonLines.encode(self.EVENTS).encode())))
+        self.assertEqual(self.EVENTS, _run(_decode_stream(Avro, encoded)))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "events.ndjson")
+            with open(path, "w") as f:
+                f.write(JsonLines.encode(self.EVENTS))
+            self.assertEqual(self.EVENTS[1:], list(JsonLines.iter_decode_file(path, 1)))
+            self.assertEqual(self.EVENTS, JsonLines.decode_file(path))
+        stats = self.stats.snapshot()
+        for key in ("Json.encode_to", "JsonLines.encode_to", "Json.aencode_to", "JsonLines.aencode_to",
+                    "Avro.aencode_to", "Json.aiter_decode", "JsonLines.aiter_decode", "Avro.aiter_decode",
+                    "JsonLines.decode_file"):
+            self.assertEqual({"calls": 1, "events": 3, "bytes": 0, "failures": 0}, _without_seconds(stats[key]), key)
+        self.assertEqual({"calls": 1, "events": 1, "bytes": 0, "failures": 0},
+                         _without_seconds(stats["Avro.encode_to"]))
+        self.assertEqual({"calls": 1, "events": 3, "bytes": len(encoded), "failures": 0},
+                         _without_seconds(stats["Avro.iter_encode"]))
+        self.assertEqual(2, stats["JsonLines.iter_decode_file"]["events"])
+        # the streaming methods are recorded once, not also as the methods they use
+        self.assertNotIn("Json.iter_encode", stats)
+        self.assertNotIn("JsonLines.iter_encode", stats)
+        self.assertNotIn("Avro.encode", stats)
+
+    def test_failures(self):
+        with self.assertRaises(json.JSONDecodeError):
+            Json.decode("[")
+        with self.assertRaises(ValueError):
+            Avro.decode(b"\x02")
+        with self.assertRaises(ValueError):
+            list(Avro.decode_iter(Avro.encode_many(self.EVENTS)[:-1]))
+        with self.assertRaises(TypeError):
+            Avro.encode(None)
+        stats = self.stats.snapshot()
+        for key in "Json.decode", "Avro.decode", "Avro.decode_iter", "Avro.encode":
+            self.assertEqual(1, stats[key]["failures"], key)
+            self.assertEqual(1, stats[key]["calls"], key)
+        self.assertEqual(0, stats["Json.decode"]["events"])
+
+    def test_snapshot_reset(self):
+        Json.encode(self.EVENTS[0])
+        snapshot = self.stats.snapshot()
+        snapshot["Json.encode"]["calls"] = 100
+        self.assertEqual(1, self.stats.snapshot()["Json.encode"]["calls"])
+        self.assertEqual(1, self.stats.reset()["Json.encode"]["calls"])
+        self.assertEqual({}, self.stats.snapshot())
+
+    def test_custom_observer(self):
+        calls = []
+
+        class Observer(CodecObserver):
+            def record(self, codec, operation, events, size, seconds):
+                calls.append((codec, operation, events, size))
+
+        Avro.observer = Observer()
+        encoded = Avro.encode(self.EVENTS[0])
+        Json.decode("[]")  # Json.observer is still the stats collector
+        self.assertEqual([("Avro", "encode", 1, len(encoded))], calls)
+
+    def test_no_observer(self):
+        Json.observer = None
+        self.assertEqual(self.EVENTS, Json.decode(Json.encode(self.EVENTS)))
+        self.assertEqual({}, self.stats.snapshot())
+
+
+class _Writer:
+
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+
+def _run(coro):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _decode_stream(codec, data: bytes):
+    import asyncio
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return [event async for event in codec.aiter_decode(reader)]
+
+
+def _without_seconds(stats: dict) -> dict:
+    return {k: v for k, v in stats.items() if k != "seconds"}
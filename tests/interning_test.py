@@ -0,0 +1,113 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from spce import Avro, CloudEvent, Json, JsonLines
+from spce.interning import InternTable, get_intern_table
+
+
+def copy(s: str) -> str:
+    # an equal string which is a different object
+    return s.encode().decode()
+
+
+def make_events(count=3):
+    return [CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(1000 + i), data='{"spo2": 99}',
+                       datacontenttype="application/json", external1="foo/bar")
+            for i in range(count)]
+
+
+class InternTableTests(unittest.TestCase):
+
+    def test_attributes(self):
+        table = InternTable()
+        first = table.attributes({copy("type"): copy("OximeterMeasured"), copy("external1"): 5})
+        second = table.attributes({copy("type"): copy("OximeterMeasured"), copy("external1"): 5})
+        self.assertEqual({"type": "OximeterMeasured", "external1": 5}, second)
+        for (name1, value1), (name2, value2) in zip(first.items(), second.items()):
+            self.assertIs(name1, name2)
+            self.assertIs(value1, value2)
+        self.assertEqual(3, len(table))
+
+    def test_eviction(self):
+        table = InternTable(max_values=10)
+        for i in range(25):
+            table.attributes({"id": str(i), "type": "OximeterMeasured"})
+            self.assertLessEqual(len(table._tables["id"][1]), 10)
+        # the unique ids don't evict the type
+        type_value = table._tables["type"][1]["OximeterMeasured"]
+        self.assertIs(type_value, table.attributes({"type": copy("OximeterMeasured")})["type"])
+
+    def test_max_names(self):
+        table = InternTable(max_names=2)
+        attributes = {"a": "1", "b": "2", "c": "3"}
+        self.assertEqual(attributes, table.attributes(attributes))
+        self.assertEqual({"a", "b"}, set(table._tables))
+        table.clear()
+        self.assertEqual(0, len(table))
+
+    def test_get_intern_table(self):
+        self.assertIsNone(get_intern_table(False))
+        self.assertIsInstance(get_intern_table(True), InternTable)
+        self.assertIsNot(get_intern_table(True), get_intern_table(True))
+        table = InternTable()
+        self.assertIs(table, get_intern_table(table))
+        with self.assertRaises(TypeError):
+            get_intern_table("yes")
+
+
+class DecoderInterningTests(unittest.TestCase):
+
+    def assertShared(self, events):
+        first = events[0]
+        for event in events[1:]:
+            self.assertIs(first.type, event.type)
+            self.assertIs(first.source, event.source)
+            self.assertIs(first.attribute("external1"), event.attribute("external1"))
+            for name1, name2 in zip(first._attributes, event._attributes):
+                self.assertIs(name1, name2)
+
+    def test_json(self):
+        events = make_events()
+        encoded = Json.encode(events)
+        self.assertEqual(events, Json.decode(encoded, intern=True))
+        self.assertShared(Json.decode(encoded, intern=True))
+        self.assertShared(Json.decode(encoded, lazy=True, intern=True))
+        self.assertShared(list(Json.iter_decode(encoded, intern=True)))
+        self.assertShared(Json.decode(encoded, validate=True, intern=True))
+        binary = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", data=b"\x00\x01")
+        self.assertEqual(binary, Json.decode(Json.encode(binary), intern=True))
+        # like without interning
+        for text in ("5", '"text"', "null", "[1]"):
+            with self.assertRaises(TypeError, msg=text):
+                Json.decode(text, intern=True)
+
+    def test_json_lines(self):
+        events = make_events()
+        encoded = JsonLines.encode(events)
+        self.assertEqual(events, JsonLines.decode(encoded, intern=True))
+        self.assertShared(JsonLines.decode(encoded, intern=True))
+        self.assertShared(JsonLines.decode(encoded, lazy=True, intern=True))
+
+    def test_avro(self):
+        events = make_events()
+        encoded = Avro.encode_many(events)
+        self.assertEqual(events, list(Avro.decode_iter(encoded, intern=True)))
+        self.assertShared(list(Avro.decode_iter(encoded, intern=True)))
+        self.assertShared(list(Avro.decode_iter(encoded, lazy=True, intern=True)))
+        # a table shared across calls
+        table = InternTable()
+        self.assertShared([Avro.decode(Avro.encode(event), intern=table) for event in events])
+        self.assertShared([Avro.decode(Avro.encode(event), lazy=True, intern=table) for event in events])
@@ -15,7 +15,7 @@
 import json
 import unittest
 
-from spce import CloudEvent, Json
+from spce import CloudEvent, Json, JsonLines, LazyCloudEvent, Avro
 
 
 class JsonEncoderTests(unittest.TestCase):
@@ -352,3 +352,455 @@ class JsonDecoderTests(unittest.TestCase):
             ),
         ]
         self.assertEqual(target, Json.decode(encoded_batch))
+
+    def test_decode_adopts_attributes(self):
+        from unittest import mock
+        # the parsed dict becomes the attributes of the event without being copied
+        d = {"type": "t", "source": "s", "id": "1", "subject": "x", "external1": "foo", "data": "text"}
+        with mock.patch("spce.json.json.loads", return_value=d):
+            event = Json.decode("{}")
+        self.assertIs(d, event._attributes)
+        self.assertEqual(("foo", "text"), (event.attribute("external1"), event.data))
+        # the events of a batch share the attribute names the json module parsed
+        first, second = Json.decode('[{"type":"t","source":"s","id":"1"},{"type":"t","source":"s","id":"2"}]')
+        for name1, name2 in zip(first._attributes, second._attributes):
+            self.assertIs(name1, name2)
+
+
+class JsonIterDecoderTests(unittest.TestCase):
+
+    ENCODED_BATCH = r'''
+        [
+            {
+             "type":"OximeterMeasured",
+             "source":"oximeter/123",
+             "id":"1000",
+             "specversion":"1.0",
+             "datacontenttype": "application/json",
+             "data": "{\"spo2\": 99}"
+            },
+            {
+             "type":"OximeterMeasured",
+             "source":"oximeter/123",
+             "id":"1001",
+             "specversion":"1.0",
+             "datacontenttype": "application/json",
+             "data_base64": "AWJpbmFyeWRhdGEC"
+            }
+        ]
+    '''
+
+    TARGET = [
+        CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            datacontenttype="application/json",
+            data=json.dumps({"spo2": 99}),
+        ),
+        CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1001",
+            datacontenttype="application/json",
+            data=b'\x01binarydata\x02',
+        ),
+    ]
+
+    def test_iter_decode_text_file(self):
+        import io
+        events = Json.iter_decode(io.StringIO(self.ENCODED_BATCH), chunk_size=7)
+        self.assertEqual(self.TARGET, list(events))
+
+    def test_iter_decode_binary_file(self):
+        import io
+        f = io.BytesIO(self.ENCODED_BATCH.encode())
+        self.assertEqual(self.TARGET, list(Json.iter_decode(f, chunk_size=3)))
+
+    def test_iter_decode_chunks(self):
+        text = self.ENCODED_BATCH.replace("oximeter/123", "oxímetre/123")
+        encoded = text.encode()
+        # split in the middle of multi-byte characters as well
+        chunks = [encoded[i:i + 5] for i in range(0, len(encoded), 5)]
+        self.assertEqual(Json.decode(text), list(Json.iter_decode(chunks)))
+
+    def test_iter_decode_is_lazy(self):
+        chunks = iter([self.ENCODED_BATCH[:280], "this is not read yet"])
+        events = Json.iter_decode(chunks)
+        self.assertEqual(self.TARGET[0], next(events))
+
+    def test_iter_decode_batch_0_items(self):
+        self.assertEqual([], list(Json.iter_decode(" [ ] ")))
+
+    def test_iter_decode_single_event(self):
+        text = Json.encode(self.TARGET[1])
+        self.assertEqual([self.TARGET[1]], list(Json.iter_decode(text)))
+
+    def test_iter_decode_truncated(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(Json.iter_decode(self.ENCODED_BATCH[:-20]))
+
+    def test_iter_decode_extra_data(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(Json.iter_decode("[] []"))
+
+    def test_iter_decode_not_an_event(self):
+        with self.assertRaises(TypeError):
+            list(Json.iter_decode("[1]"))
+
+
+class JsonStreamEncoderTests(unittest.TestCase):
+
+    EVENTS = JsonIterDecoderTests.TARGET
+
+    def test_iter_encode(self):
+        chunks = list(Json.iter_encode(iter(self.EVENTS), chunk_size=1))
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(Json.encode(self.EVENTS), "".join(chunks))
+
+    def test_iter_encode_single_chunk(self):
+        chunks = list(Json.iter_encode(self.EVENTS))
+        self.assertEqual([Json.encode(self.EVENTS)], chunks)
+
+    def test_iter_encode_batch_0_items(self):
+        self.assertEqual("[]", "".join(Json.iter_encode([])))
+
+    def test_iter_encode_generator(self):
+        events = (e for e in self.EVENTS)
+        self.assertEqual(self.EVENTS, Json.decode("".join(Json.iter_encode(events))))
+
+    def test_iter_encode_invalid(self):
+        with self.assertRaises(TypeError):
+            list(Json.iter_encode([None]))
+
+    def test_encode_to_text_file(self):
+        import io
+        f = io.StringIO()
+        Json.encode_to(self.EVENTS, f, chunk_size=10)
+        self.assertEqual(Json.encode(self.EVENTS), f.getvalue())
+
+    def test_encode_to_binary_file(self):
+        import gzip
+        import io
+        bio = io.BytesIO()
+        with gzip.GzipFile(fileobj=bio, mode="wb") as f:
+            Json.encode_to(self.EVENTS, f)
+        self.assertEqual(self.EVENTS, Json.decode(gzip.decompress(bio.getvalue())))
+
+
+class JsonLinesTests(unittest.TestCase):
+
+    EVENTS = [
+        CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id=str(1000 + i),
+            datacontenttype="application/json",
+            data=b'\x01binarydata\x02' if i % 2 else json.dumps({"spo2": 90 + i}),
+        )
+        for i in range(5)
+    ]
+
+    def test_encode(self):
+        encoded = JsonLines.encode(self.EVENTS[:2])
+        lines = encoded.split("\n")
+        self.assertEqual(3, len(lines))
+        self.assertEqual("", lines[2])
+        self.assertEqual(self.EVENTS[:2], [Json.decode(line) for line in lines[:2]])
+
+    def test_encode_to(self):
+        import io
+        text_file = io.StringIO()
+        JsonLines.encode_to(self.EVENTS, text_file)
+        binary_file = io.BytesIO()
+        JsonLines.encode_to(self.EVENTS, binary_file)
+        self.assertEqual(JsonLines.encode(self.EVENTS), text_file.getvalue())
+        self.assertEqual(JsonLines.encode(self.EVENTS).encode(), binary_file.getvalue())
+
+    def test_decode(self):
+        text = JsonLines.encode(self.EVENTS)
+        self.assertEqual(self.EVENTS, JsonLines.decode(text))
+        self.assertEqual(self.EVENTS, JsonLines.decode(text.encode()))
+
+    def test_decode_skips_blank_lines(self):
+        text = "\n%s\n  \r\n%s" % (Json.encode(self.EVENTS[0]), Json.encode(self.EVENTS[1]))
+        self.assertEqual(self.EVENTS[:2], JsonLines.decode(text))
+
+    def test_decode_range(self):
+        text = JsonLines.encode(self.EVENTS)
+        self.assertEqual(self.EVENTS[1:3], JsonLines.decode(text, 1, 3))
+        self.assertEqual(self.EVENTS[3:], JsonLines.decode(text, 3))
+
+    def test_iter_decode_file(self):
+        import io
+        encoded = JsonLines.encode(self.EVENTS)
+        self.assertEqual(self.EVENTS, list(JsonLines.iter_decode(io.StringIO(encoded))))
+        self.assertEqual(self.EVENTS[2:4], list(JsonLines.iter_decode(io.BytesIO(encoded.encode()), 2, 4)))
+
+    def test_iter_decode_chunks(self):
+        encoded = JsonLines.encode(self.EVENTS).encode()
+        chunks = [encoded[i:i + 7] for i in range(0, len(encoded), 7)]
+        self.assertEqual(self.EVENTS, list(JsonLines.iter_decode(chunks)))
+
+    def test_decode_file(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "events.ndjson")
+            with open(path, "w") as f:
+                JsonLines.encode_to(self.EVENTS, f)
+            self.assertEqual(self.EVENTS, JsonLines.decode_file(path))
+            self.assertEqual(self.EVENTS[1:3], JsonLines.decode_file(path, 1, 3))
+            self.assertEqual(self.EVENTS[4:], JsonLines.decode_file(path, 4, 100))
+            self.assertEqual([], JsonLines.decode_file(path, 10))
+
+            # no trailing newline
+            with open(path, "w") as f:
+                f.write(Json.encode(self.EVENTS[0]))
+            self.assertEqual(self.EVENTS[:1], JsonLines.decode_file(path))
+
+            open(path, "w").close()
+            self.assertEqual([], JsonLines.decode_file(path))
+
+
+class JsonLazyDecoderTests(unittest.TestCase):
+
+    ENCODED_BATCH = JsonIterDecoderTests.ENCODED_BATCH
+    TARGET = JsonIterDecoderTests.TARGET
+
+    def test_decode_lazy(self):
+        text = Json.encode(self.TARGET[1])
+        event = Json.decode(text, lazy=True)
+        self.assertIsInstance(event, LazyCloudEvent)
+        self.assertEqual("1001", event.id)
+        self.assertIsNotNone(event._pending)
+        self.assertEqual(b'\x01binarydata\x02', event.data)
+        self.assertIsNone(event._pending)
+        self.assertTrue(event._has_binary_data)
+        self.assertEqual(self.TARGET[1], event)
+
+    def test_decode_lazy_normalized(self):
+        text = '{"type":"t","source":"s","id":"1","subject":"","time":"","data":"x"}'
+        event = Json.decode(text, lazy=True)
+        eager = Json.decode(text)
+        self.assertEqual("1.0", event.specversion)
+        self.assertIsNone(event.subject)
+        self.assertEqual(eager._attributes, event._attributes)
+        self.assertEqual(eager, event)
+        self.assertEqual([eager], JsonLines.decode(text, lazy=True))
+        with self.assertRaises(TypeError):
+            Json.decode('{"type":"t","source":"s"}', lazy=True)
+
+    def test_decode_lazy_batch(self):
+        events = Json.decode(self.ENCODED_BATCH, lazy=True)
+        self.assertEqual(self.TARGET, events)
+        self.assertEqual([], Json.decode("[]", lazy=True))
+
+    def test_encode_lazy_pass_through(self):
+        events = Json.decode(self.ENCODED_BATCH, lazy=True)
+        encoded = Json.encode(events[0])
+        self.assertTrue(encoded.startswith('{\n             "type":"OximeterMeasured"'))
+        self.assertEqual(self.TARGET[0], Json.decode(encoded))
+        self.assertEqual(self.TARGET, Json.decode(Json.encode(events)))
+        # other codecs encode the decoded data
+        self.assertEqual(Avro.encode(self.TARGET[1]), Avro.encode(events[1]))
+        # original encoding spans lines, so it can't be passed through as JSON Lines
+        lines = JsonLines.encode(events).split("\n")
+        self.assertEqual(3, len(lines))
+        self.assertEqual(self.TARGET, [Json.decode(line) for line in lines[:2]])
+
+    def test_decode_lazy_lines(self):
+        encoded = JsonLines.encode(self.TARGET)
+        events = JsonLines.decode(encoded, lazy=True)
+        self.assertEqual(self.TARGET, events)
+        self.assertEqual(encoded, JsonLines.encode(events))
+        self.assertEqual(encoded.split("\n")[0], Json.encode(events[0]))
+
+    def test_decode_lazy_file(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "events.ndjson")
+            with open(path, "w") as f:
+                JsonLines.encode_to(self.TARGET, f)
+            events = JsonLines.decode_file(path, lazy=True)
+            self.assertIsInstance(events[0], LazyCloudEvent)
+            self.assertEqual(self.TARGET, events)
+
+
+class JsonProjectionTests(unittest.TestCase):
+
+    ENCODED_BATCH = JsonIterDecoderTests.ENCODED_BATCH
+    FIELDS = "type", "id", "datacontenttype", "external1"
+    TARGET = [
+        {"type": "OximeterMeasured", "id": "1000", "datacontenttype": "application/json"},
+        {"type": "OximeterMeasured", "id": "1001", "datacontenttype": "application/json"},
+    ]
+
+    def test_decode_fields(self):
+        self.assertEqual(self.TARGET, Json.decode(self.ENCODED_BATCH, fields=self.FIELDS))
+        self.assertEqual(self.TARGET[1], Json.decode(Json.encode(JsonIterDecoderTests.TARGET[1]), fields=self.FIELDS))
+        self.assertEqual({}, Json.decode('{"data_base64": "AQ=="}', fields=()))
+
+    def test_iter_decode_fields(self):
+        self.assertEqual(self.TARGET, list(Json.iter_decode(self.ENCODED_BATCH, fields=self.FIELDS)))
+
+    def test_decode_lines_fields(self):
+        encoded = JsonLines.encode(JsonIterDecoderTests.TARGET)
+        self.assertEqual(self.TARGET, JsonLines.decode(encoded, fields=self.FIELDS))
+        self.assertEqual(self.TARGET[1:], JsonLines.decode(encoded, 1, fields=iter(self.FIELDS)))
+
+    def test_decode_fields_not_an_event(self):
+        with self.assertRaises(TypeError):
+            Json.decode("[1]", fields=self.FIELDS)
+
+    def test_decode_fields_skips_data(self):
+        import io
+        from unittest import mock
+        events = [
+            CloudEvent(type="t", source="s", id="1", data="text" * 1024),
+            CloudEvent(type="t", source="s", id="2", data=b"\x01binary" * 512),
+            CloudEvent(type="t", source="s", id="7", datacontenttype="text/plain", dataschema="urn:data",
+                       subject="data", data="text" * 1024),
+            CloudEvent(type="t", source="s", id="8", datacontenttype="application/octet-stream",
+                       data=b"\x01binary" * 512),
+            # short data, a subject like data, an escaped quote, and data which is not a string
+            CloudEvent(type="t", source="s", id="3", data="text"),
+            CloudEvent(type="t", source="s", id="4", subject='"data":"x"}', data="text" * 1024),
+            CloudEvent(type="t", source="s", id="5", data='a "quoted" text' * 512),
+            CloudEvent(type="t", source="s", id="6", data={"data": [1, {"id": "x"}], "text": "text" * 1024}),
+        ]
+        text = Json.encode(events)
+        target = [{"id": e.id, "subject": e.subject} if e.subject else {"id": e.id} for e in events]
+        # the data of the first four events is skipped, the others are parsed
+        with mock.patch("spce.json.json.loads", wraps=json.loads) as loads:
+            self.assertEqual(target, Json.decode(text, fields=["id", "subject"]))
+        self.assertEqual(['{"type":"t","source":"s","id":"1","specversion":"1.0"}',
+                          '{"type":"t","source":"s","id":"2","specversion":"1.0"}',
+                          '{"type":"t","source":"s","id":"7","specversion":"1.0","subject":"data",'
+                          '"datacontenttype":"text/plain","dataschema":"urn:data"}',
+                          '{"type":"t","source":"s","id":"8","specversion":"1.0",'
+                          '"datacontenttype":"application/octet-stream"}'],
+                         [call[0][0] for call in loads.call_args_list])
+        self.assertEqual(target, list(Json.iter_decode(io.StringIO(text), chunk_size=1000, fields=["id", "subject"])))
+        self.assertEqual(target, JsonLines.decode(JsonLines.encode(events), fields=["id", "subject"]))
+        self.assertEqual(target, JsonLines.decode(JsonLines.encode(events).encode(), fields=["id", "subject"]))
+        # the data is decoded when it is a field
+        self.assertEqual([{"id": e.id, "data": e.data} if not isinstance(e.data, bytes) else {"id": e.id}
+                          for e in events],
+                         Json.decode(text, fields=["id", "data"]))
+        data = "x" * 5000
+        self.assertEqual({"id": "1"}, Json.decode(' { "id" : "1" , "data" : "%s" } ' % data, fields=["id"]))
+        self.assertEqual({"id": "1"}, Json.decode('{"data": "%s", "id": "1"}' % data, fields=["id"]))
+        self.assertEqual({"id": "1"}, Json.decode('{"data": "%s\\\\", "id": "1"}' % data, fields=["id"]))
+        for text in ('{"id": "1", "data": "%s"' % data, '{"id": "1",, "data": "%s"}' % data,
+                     '{"id": "1", "data": "%s"} {}' % data, '[{"id": "1", "data": "%s"} {}]' % data):
+            with self.assertRaises(json.JSONDecodeError, msg=text[:20]):
+                Json.decode(text, fields=["id"])
+            with self.assertRaises(json.JSONDecodeError, msg=text[:20]):
+                JsonLines.decode(text, fields=["id"])
+
+    def test_decode_fields_lazy(self):
+        with self.assertRaises(ValueError):
+            Json.decode(self.ENCODED_BATCH, lazy=True, fields=self.FIELDS)
+        with self.assertRaises(ValueError):
+            JsonLines.decode(JsonLines.encode(JsonIterDecoderTests.TARGET), lazy=True, fields=self.FIELDS)
+        with self.assertRaises(ValueError):
+            Avro.decode(Avro.encode(JsonIterDecoderTests.TARGET[0]), lazy=True, fields=self.FIELDS)
+
+
+class JsonAsyncTests(unittest.TestCase):
+
+    ENCODED_BATCH = JsonIterDecoderTests.ENCODED_BATCH
+    TARGET = JsonIterDecoderTests.TARGET
+    EVENTS = JsonLinesTests.EVENTS
+
+    def test_aiter_decode(self):
+        encoded = self.ENCODED_BATCH.replace("oximeter/123", "oxímetre/123").encode()
+        events = _run(_collect(Json.aiter_decode(_reader(encoded), chunk_size=5)))
+        self.assertEqual(Json.decode(encoded), events)
+
+    def test_aiter_decode_single_event(self):
+        encoded = Json.encode(self.TARGET[1]).encode()
+        self.assertEqual([self.TARGET[1]], _run(_collect(Json.aiter_decode(_reader(encoded)))))
+
+    def test_aiter_decode_fields(self):
+        events = Json.aiter_decode(_reader(self.ENCODED_BATCH.encode()), fields=["id"])
+        self.assertEqual([{"id": "1000"}, {"id": "1001"}], _run(_collect(events)))
+
+    def test_aiter_decode_truncated(self):
+        with self.assertRaises(json.JSONDecodeError):
+            _run(_collect(Json.aiter_decode(_reader(self.ENCODED_BATCH[:-20].encode()))))
+
+    def test_aencode_to(self):
+        writer = _Writer()
+        _run(Json.aencode_to(self.EVENTS, writer, chunk_size=100))
+        self.assertEqual(Json.encode(self.EVENTS).encode(), b"".join(writer.chunks))
+        self.assertGreater(writer.drains, 1)
+        self.assertEqual(len(writer.chunks), writer.drains)
+
+    def test_aiter_decode_lines(self):
+        encoded = JsonLines.encode(self.EVENTS).encode()
+        events = _run(_collect(JsonLines.aiter_decode(_reader(encoded), chunk_size=7)))
+        self.assertEqual(self.EVENTS, events)
+
+    def test_aiter_decode_lines_no_trailing_newline(self):
+        encoded = b"\n  \n%s" % Json.encode(self.EVENTS[0]).encode()
+        self.assertEqual(self.EVENTS[:1], _run(_collect(JsonLines.aiter_decode(_reader(encoded)))))
+
+    def test_aiter_decode_lines_lazy(self):
+        encoded = JsonLines.encode(self.EVENTS).encode()
+        events = _run(_collect(JsonLines.aiter_decode(_reader(encoded), lazy=True)))
+        self.assertIsInstance(events[0], LazyCloudEvent)
+        self.assertEqual(self.EVENTS, events)
+
+    def test_aencode_to_lines(self):
+        writer = _Writer()
+        _run(JsonLines.aencode_to(self.EVENTS, writer, chunk_size=100))
+        self.assertEqual(JsonLines.encode(self.EVENTS).encode(), b"".join(writer.chunks))
+        self.assertGreater(writer.drains, 1)
+
+
+def _run(coro):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def _reader(data: bytes):
+    import asyncio
+
+    class Reader:
+        # mimics asyncio.StreamReader.read, returning short reads
+
+        def __init__(self):
+            self.pos = 0
+
+        async def read(self, n):
+            await asyncio.sleep(0)
+            chunk = data[self.pos:self.pos + min(n, 3)]
+            self.pos += len(chunk)
+            return chunk
+
+    return Reader()
+
+
+class _Writer:
+    # mimics asyncio.StreamWriter
+
+    def __init__(self):
+        self.chunks = []
+        self.drains = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    async def drain(self):
+        self.drains += 1
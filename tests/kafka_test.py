@@ -0,0 +1,117 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from spce import CloudEvent, Avro, Json
+from spce import kafka
+
+
+class KafkaBinaryModeTests(unittest.TestCase):
+
+    def test_to_binary(self):
+        data = b'\x01\x02\x03\x04'
+        event = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            datacontenttype="application/octet-stream",
+            data=data,
+            partitionkey="patient/123",
+            external1="güzel",
+            external2=5,
+        )
+        key, headers, value = kafka.to_binary(event)
+        target = [
+            ("ce_type", b"OximeterMeasured"),
+            ("ce_source", b"oximeter/123"),
+            ("ce_id", b"1000"),
+            ("ce_specversion", b"1.0"),
+            ("content-type", b"application/octet-stream"),
+            ("ce_partitionkey", b"patient/123"),
+            ("ce_external1", "güzel".encode()),
+            ("ce_external2", b"5"),
+        ]
+        self.assertEqual(b"patient/123", key)
+        self.assertEqual(target, headers)
+        self.assertIs(data, value)
+
+    def test_no_key(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", data="text")
+        key, headers, value = kafka.to_binary(event)
+        self.assertIsNone(key)
+        self.assertEqual(b"text", value)
+
+    def test_from_binary(self):
+        headers = [
+            ("ce_type", b"OximeterMeasured"),
+            (b"ce_source", b"oximeter/123"),
+            ("ce_id", b"1000"),
+            ("ce_specversion", b"1.0"),
+            ("Content-Type", b"application/json"),
+            ("traceparent", b"00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"),
+        ]
+        target = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            datacontenttype="application/json",
+            data=b'{"spo2": 99}',
+            partitionkey="patient/123",
+        )
+        self.assertEqual(target, kafka.from_binary(b"patient/123", headers, b'{"spo2": 99}'))
+        self.assertEqual(target, kafka.from_kafka(b"patient/123", headers, b'{"spo2": 99}'))
+
+    def test_binary_round_trip(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000",
+                           data=b"\xff", partitionkey="p1", external1="x")
+        self.assertEqual(event, kafka.from_binary(*kafka.to_binary(event)))
+
+
+class KafkaStructuredModeTests(unittest.TestCase):
+
+    EVENTS = [
+        CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id=str(1000 + i),
+            datacontenttype="application/json",
+            data=json.dumps({"spo2": 90 + i}),
+            partitionkey="patient/%d" % i,
+        )
+        for i in range(3)
+    ]
+
+    def test_json(self):
+        key, headers, value = kafka.to_structured(self.EVENTS[0])
+        self.assertEqual(b"patient/0", key)
+        self.assertEqual([("content-type", b"application/cloudevents+json")], headers)
+        self.assertEqual(self.EVENTS[0], Json.decode(value))
+        self.assertEqual(self.EVENTS[0], kafka.from_kafka(key, headers, value))
+
+    def test_avro(self):
+        key, headers, value = kafka.to_structured(self.EVENTS[0], Avro)
+        self.assertEqual([("content-type", b"application/cloudevents+avro")], headers)
+        self.assertEqual(Avro.encode(self.EVENTS[0]), value)
+        self.assertEqual(self.EVENTS[0], kafka.from_kafka(key, headers, value))
+
+    def test_batch(self):
+        for messages in (kafka.to_binary_batch(self.EVENTS),
+                         kafka.to_structured_batch(self.EVENTS),
+                         kafka.to_structured_batch(self.EVENTS, Avro)):
+            self.assertEqual([b"patient/0", b"patient/1", b"patient/2"], [m[0] for m in messages])
+            decoded = kafka.from_kafka_batch(messages)
+            self.assertEqual([e.id for e in self.EVENTS], [e.id for e in decoded])
+        self.assertEqual(self.EVENTS, kafka.from_kafka_batch(kafka.to_structured_batch(self.EVENTS)))
@@ -0,0 +1,247 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import time
+import unittest
+
+from spce import Avro, CloudEvent, Json
+from spce.log import CorruptLogError, EventLog
+
+
+def make_events(count, start=0):
+    return [CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(1000 + i),
+                       data='{"spo2": %d}' % (i % 100) if i % 2 else bytes([i % 256]) * 10)
+            for i in range(start, start + count)]
+
+
+class EventLogTests(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def files(self, suffix=".log"):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(suffix))
+
+    def test_append_replay(self):
+        events = make_events(100)
+        for codec in (Avro, Json):
+            directory = os.path.join(self.directory, codec.__name__)
+            with EventLog(directory, codec=codec, segment_size=1024, index_interval=100) as log:
+                self.assertEqual(0, log.append(events[0]))
+                self.assertEqual(range(1, 100), log.append_many(events[1:]))
+                self.assertEqual(100, log.end_offset)
+                self.assertEqual(events, list(log.replay()))
+                self.assertEqual(events[37:], list(log.replay(37)))
+                self.assertEqual([], list(log.replay(100)))
+                for offset in (0, 1, 9, 50, 99):
+                    self.assertEqual(events[offset], log.get(offset))
+                with self.assertRaises(IndexError):
+                    log.get(100)
+            self.assertGreater(len(os.listdir(directory)), 2)
+            # reopened
+            with EventLog(directory, codec=codec, segment_size=1024, index_interval=100) as log:
+                self.assertEqual((0, 100), (log.start_offset, log.end_offset))
+                self.assertEqual(events[63:], list(log.replay(63)))
+                self.assertEqual(100, log.append(events[0]))
+                self.assertEqual(events[98:] + events[:1], list(log.replay(98)))
+
+    def test_segments(self):
+        events = make_events(50)
+        with EventLog(self.directory, segment_size=256) as log:
+            log.append_many(events)
+            names = self.files()
+            self.assertGreater(len(names), 1)
+            self.assertEqual("%020d.log" % 0, names[0])
+            self.assertEqual(names, [name[:-len(".index")] + ".log" for name in self.files(".index")])
+            for name in names:
+                self.assertLessEqual(os.path.getsize(os.path.join(self.directory, name)), 256)
+            # the segments are named after their first offsets
+            for name in names:
+                self.assertEqual(events[int(name[:20])], log.get(int(name[:20])))
+            # a record larger than a segment gets a segment of its own
+            big = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="big", data=b"x" * 1000)
+            self.assertEqual(50, log.append(big))
+            self.assertEqual(big, log.get(50))
+            self.assertIn("%020d.log" % 50, self.files())
+
+    def test_unflushed_reads(self):
+        events = make_events(10)
+        with EventLog(self.directory) as log:
+            log.append_many(events[:5])
+            self.assertEqual(events[:5], list(log.replay()))
+            replay = log.replay(3)
+            self.assertEqual(events[3], next(replay))
+            # appended after the replay started
+            log.append_many(events[5:])
+            self.assertEqual(events[4:5], list(replay))
+            self.assertEqual(events, list(log.replay()))
+
+    def test_sync(self):
+        events = make_events(20)
+        log = EventLog(self.directory, segment_size=512, sync=True)
+        log.append_many(events[:10])
+        log.append(events[10])
+        # readable by another instance without a flush
+        self.assertEqual(events[:11], list(EventLog(self.directory, segment_size=512).replay()))
+        log.close()
+        with self.assertRaises(ValueError):
+            log.append(events[0])
+        log.close()
+
+    def test_torn_write(self):
+        events = make_events(30)
+        with EventLog(self.directory, index_interval=50) as log:
+            log.append_many(events)
+        path = os.path.join(self.directory, self.files()[-1])
+        size = os.path.getsize(path)
+        with open(path, "r+b") as f:
+            f.truncate(size - 3)
+        with EventLog(self.directory, index_interval=50) as log:
+            self.assertEqual(29, log.end_offset)
+            self.assertEqual(events[:29], list(log.replay()))
+            self.assertEqual(29, log.append(events[29]))
+        with EventLog(self.directory, index_interval=50) as log:
+            self.assertEqual(events, list(log.replay()))
+
+    def test_corrupt_record(self):
+        events = make_events(30)
+        with EventLog(self.directory) as log:
+            log.append_many(events)
+        path = os.path.join(self.directory, self.files()[0])
+        # corrupt the data of the last record
+        with open(path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        with EventLog(self.directory) as log:
+            # the corrupt last record is treated as torn
+            self.assertEqual(events[:29], list(log.replay()))
+        # corrupt a record in the middle of a closed segment
+        with EventLog(self.directory, segment_size=256) as log:
+            log.append_many(make_events(20, start=29))
+        path = os.path.join(self.directory, self.files()[0])
+        with open(path, "r+b") as f:
+            f.seek(20)
+            f.write(b"\xff\xff")
+        with EventLog(self.directory, segment_size=256) as log:
+            with self.assertRaises(CorruptLogError):
+                list(log.replay())
+
+    def test_missing_index(self):
+        events = make_events(200)
+        with EventLog(self.directory, segment_size=2048, index_interval=64) as log:
+            log.append_many(events)
+        index_names = self.files(".index")
+        sizes = [os.path.getsize(os.path.join(self.directory, name)) for name in index_names]
+        for name in index_names:
+            os.remove(os.path.join(self.directory, name))
+        with EventLog(self.directory, segment_size=2048, index_interval=64) as log:
+            self.assertEqual(events[150:], list(log.replay(150)))
+            self.assertEqual(events[7], log.get(7))
+            self.assertEqual(200, log.end_offset)
+        # the indexes of the segments which were read are rebuilt
+        self.assertEqual(sizes[0], os.path.getsize(os.path.join(self.directory, index_names[0])))
+        self.assertEqual(sizes[-1], os.path.getsize(os.path.join(self.directory, index_names[-1])))
+
+    def test_retention_bytes(self):
+        events = make_events(100)
+        with EventLog(self.directory, segment_size=512, retention_bytes=2048) as log:
+            log.append_many(events)
+            total = sum(os.path.getsize(os.path.join(self.directory, name)) for name in self.files())
+            self.assertLessEqual(total, 2048 + 512)
+            start = log.start_offset
+            self.assertGreater(start, 0)
+            self.assertEqual("%020d.log" % start, self.files()[0])
+            self.assertEqual(events[start:], list(log.replay(start)))
+            with self.assertRaises(IndexError):
+                list(log.replay(0))
+            with self.assertRaises(IndexError):
+                log.get(start - 1)
+        self.assertEqual(len(self.files()), len(self.files(".index")))
+
+    def test_retention_seconds(self):
+        events = make_events(40)
+        with EventLog(self.directory, segment_size=512) as log:
+            log.append_many(events)
+        names = self.files()
+        old = time.time() - 3600
+        for name in names[:-2]:
+            os.utime(os.path.join(self.directory, name), (old, old))
+        with EventLog(self.directory, segment_size=512, retention_seconds=60) as log:
+            self.assertEqual(names[-2:], self.files())
+            self.assertEqual(events[log.start_offset:], list(log.replay(log.start_offset)))
+            # the active segment is kept
+            os.utime(os.path.join(self.directory, names[-2]), (old, old))
+            os.utime(os.path.join(self.directory, names[-1]), (old, old))
+            self.assertEqual(1, log.apply_retention())
+            self.assertEqual(names[-1:], self.files())
+            self.assertEqual(0, log.apply_retention())
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            EventLog(self.directory, codec=str)
+        with self.assertRaises(ValueError):
+            EventLog(self.directory, segment_size=8)
+        with self.assertRaises(ValueError):
+            EventLog(self.directory, index_interval=0)
+        EventLog(self.directory).close()
+        with self.assertRaises(ValueError):
+            EventLog(self.directory, codec=Json)
+        with open(os.path.join(self.directory, "%020d.log" % 0), "wb") as f:
+            f.write(b"not a segment")
+        with self.assertRaises(CorruptLogError):
+            EventLog(self.directory)
+
+    def test_empty_last_segment(self):
+        events = make_events(20)
+        with EventLog(self.directory, segment_size=256) as log:
+            log.append_many(events[:10])
+            end = log.end_offset
+            segments = self.files()
+        self.assertGreater(len(segments), 1)
+        # created but not written before a crash
+        open(os.path.join(self.directory, "%020d.log" % end), "wb").close()
+        with EventLog(self.directory, segment_size=256) as log:
+            self.assertEqual(segments, self.files())
+            self.assertEqual(end, log.end_offset)
+            self.assertEqual(events[:10], list(log.replay()))
+            self.assertEqual(events[9], log.get(end - 1))
+            self.assertEqual(range(10, 20), log.append_many(events[10:]))
+            self.assertEqual(events, list(log.replay()))
+            self.assertEqual(events[12:], list(log.replay(12)))
+            self.assertEqual(events[19], log.get(19))
+
+    def test_empty_only_segment(self):
+        events = make_events(3)
+        open(os.path.join(self.directory, "%020d.log" % 0), "wb").close()
+        with EventLog(self.directory) as log:
+            self.assertEqual((0, 0), (log.start_offset, log.end_offset))
+            self.assertEqual(0, log.append(events[0]))
+            self.assertEqual(events[:1], list(log.replay(0)))
+        # a segment after older ones were removed by retention keeps its base
+        os.remove(os.path.join(self.directory, "%020d.log" % 0))
+        os.remove(os.path.join(self.directory, "%020d.index" % 0))
+        open(os.path.join(self.directory, "%020d.log" % 5), "wb").close()
+        with EventLog(self.directory) as log:
+            self.assertEqual((5, 5), (log.start_offset, log.end_offset))
+            self.assertEqual(range(5, 7), log.append_many(events[1:]))
+            self.assertEqual(events[1:], list(log.replay(5)))
+            self.assertEqual(events[2], log.get(6))
@@ -0,0 +1,122 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from spce import CloudEvent, Avro, Json
+from spce import parallel
+
+
+def _events(count):
+    return [
+        CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id=str(i),
+            data=b"\x01\x02" if i % 2 else json.dumps({"spo2": i}),
+            external1="güzel",
+        )
+        for i in range(count)
+    ]
+
+
+class ParallelTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_decode_json(self):
+        events = _events(25)
+        text = Json.encode(events)
+        decoded = parallel.decode_batch(text, chunk_size=4, min_size=0, executor=self.pool)
+        self.assertEqual(events, decoded)
+        decoded = parallel.decode_batch(text.encode(), chunk_size=4, min_size=0, executor=self.pool)
+        self.assertEqual(events, decoded)
+
+    def test_decode_json_whitespace(self):
+        events = _events(5)
+        text = " [ %s ] " % " , ".join(Json.encode(event) for event in events)
+        self.assertEqual(events, parallel.decode_batch(text, chunk_size=2, min_size=0, executor=self.pool))
+
+    def test_split_json(self):
+        # flat events, events with nested data, and brackets, braces and escaped quotes in strings
+        events = [
+            CloudEvent(type="OximeterMeasured", source="oximeter/123", id=str(i),
+                       subject='a "[{"}]' if i % 3 == 0 else "%d}]" % i,
+                       data={"spo2": [i, {"b": "x"}]} if i % 5 == 0 else "\\" if i % 7 == 0 else b"\x01")
+            for i in range(30)
+        ]
+        text = Json.encode(events)
+        for chunk_size in (1, 2, 4, 30, 100):
+            chunks = parallel._split_json(text, chunk_size)
+            self.assertEqual((len(events) + chunk_size - 1) // chunk_size, len(chunks))
+            self.assertEqual(events, [event for chunk in chunks for event in Json.decode(chunk)])
+        # the extents of flat events are not parsed, the chunks are checked when they are decoded
+        text = '[{"id": "1"}, {"id": 1 2}]'
+        self.assertEqual(['[{"id": "1"}, {"id": 1 2}]'], parallel._split_json(text, 2))
+        with self.assertRaises(json.JSONDecodeError):
+            parallel.decode_batch(text, chunk_size=2, min_size=0, executor=self.pool)
+
+    def test_decode_json_single_event(self):
+        event = _events(1)[0]
+        self.assertEqual([event], parallel.decode_batch(Json.encode(event), min_size=0, executor=self.pool))
+
+    def test_decode_json_empty(self):
+        self.assertEqual([], parallel.decode_batch("[]", min_size=0, executor=self.pool))
+
+    def test_decode_json_invalid(self):
+        text = Json.encode(_events(3))
+        with self.assertRaises(json.JSONDecodeError):
+            parallel.decode_batch(text[:-1], chunk_size=1, min_size=0, executor=self.pool)
+        with self.assertRaises(json.JSONDecodeError):
+            parallel.decode_batch(text + "[]", chunk_size=1, min_size=0, executor=self.pool)
+
+    def test_decode_avro(self):
+        events = _events(25)
+        encoded = Avro.encode_many(events)
+        decoded = parallel.decode_batch(encoded, fmt="avro", chunk_size=4, min_size=0, executor=self.pool)
+        self.assertEqual(events, decoded)
+
+    def test_decode_avro_truncated(self):
+        encoded = Avro.encode_many(_events(3))
+        with self.assertRaises(ValueError):
+            parallel.decode_batch(encoded[:-1], fmt="avro", chunk_size=1, min_size=0, executor=self.pool)
+
+    def test_encode(self):
+        events = _events(25)
+        text = parallel.encode_batch(events, chunk_size=4, min_size=0, executor=self.pool)
+        self.assertEqual(Json.encode(events), text)
+        encoded = parallel.encode_batch(events, fmt="avro", chunk_size=4, min_size=0, executor=self.pool)
+        self.assertEqual(Avro.encode_many(events), encoded)
+
+    def test_small_batch(self):
+        events = _events(3)
+        self.assertEqual(Json.encode(events), parallel.encode_batch(events))
+        self.assertEqual(events, parallel.decode_batch(Avro.encode_many(events), fmt="avro"))
+
+    def test_own_pool(self):
+        events = _events(6)
+        encoded = parallel.encode_batch(events, fmt="avro", workers=2, chunk_size=2, min_size=0)
+        self.assertEqual(events, parallel.decode_batch(encoded, fmt="avro", workers=2, chunk_size=2, min_size=0))
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            parallel.encode_batch([], fmt="xml")
@@ -0,0 +1,82 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from datetime import datetime
+
+from spce import CloudEvent, CloudEventTemplate, Json, Avro
+
+
+class CloudEventTemplateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.template = CloudEventTemplate(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            datacontenttype="application/json",
+            dataschema="https://particlemetrics.com/schema",
+            external1="foo/bar",
+            external2=5,
+        )
+
+    def test_make(self):
+        event = self.template.make("1000", time="2020-09-28T21:33:21Z", data='{"spo2": 99}')
+        target = CloudEvent(
+            type="OximeterMeasured",
+            source="oximeter/123",
+            id="1000",
+            datacontenttype="application/json",
+            dataschema="https://particlemetrics.com/schema",
+            time="2020-09-28T21:33:21Z",
+            data='{"spo2": 99}',
+            external1="foo/bar",
+            external2=5,
+        )
+        self.assertEqual(target, event)
+        self.assertEqual(list(target._attributes), list(event._attributes))
+        self.assertFalse(event._has_binary_data)
+
+    def test_make_datetime(self):
+        event = self.template.make("1000", time=datetime(2020, 9, 25, 13, 32, 56), data=b"\x01")
+        self.assertEqual("2020-09-25T13:32:56Z", event.time)
+        self.assertTrue(event._has_binary_data)
+
+    def test_encode_json(self):
+        cases = [
+            ("1000", "", ""),
+            ("1001", "2020-09-28T21:33:21Z", '{"spo2": 99}'),
+            ("1002", datetime(2020, 9, 25, 13, 32, 56), b"\x01\x02"),
+        ]
+        for id, time, data in cases:
+            encoded = self.template.encode_json(id, time, data)
+            self.assertEqual(Json.encode(self.template.make(id, time, data)), encoded)
+
+    def test_encode_json_empty(self):
+        template = CloudEventTemplate(type="", source="", specversion="")
+        self.assertEqual("{}", template.encode_json(""))
+        self.assertEqual('{"id":"1"}', template.encode_json("1"))
+
+    def test_encode_avro(self):
+        cases = [
+            ("1000", "", ""),
+            ("1001", "2020-09-28T21:33:21Z", '{"spo2": 99}'),
+            ("1002", datetime(2020, 9, 25, 13, 32, 56), b"\x01\x02"),
+        ]
+        for id, time, data in cases:
+            encoded = self.template.encode_avro(id, time, data)
+            self.assertEqual(Avro.encode(self.template.make(id, time, data)), encoded)
+
+    def test_reserved_attributes(self):
+        with self.assertRaises(TypeError):
+            CloudEventTemplate(type="OximeterMeasured", source="oximeter/123", id="1000")
@@ -0,0 +1,153 @@
+# Copyright 2020 Scale Plan Yazılım A.Ş.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import unittest
+
+from spce import CloudEvent, Avro, Json, JsonLines
+from spce.validation import Validator, ValidationError, validate
+
+VALID = CloudEvent(
+    type="OximeterMeasured",
+    source="oximeter/123",
+    id="1000",
+    subject="subject1",
+    dataschema="https://particlemetrics.com/schema#v1",
+    time="2020-09-28T21:33:21Z",
+    datacontenttype="application/json; charset=utf-8",
+    data=json.dumps({"spo2": 99}),
+    external1="foo/bar",
+    external2=5,
+    external3=True,
+)
+
+INVALID = CloudEvent(
+    type="OximeterMeasured",
+    source="oximeter 123",
+    id="1000",
+    time="2020-09-28 21:33",
+)
+
+
+class ValidatorTests(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertIs(VALID, validate(VALID))
+        self.assertEqual([], Validator().errors(VALID))
+        validate(CloudEvent(type="OximeterMeasured", source="urn:oximeter:123", id="1000", external1=b"\x01"))
+
+    def test_required(self):
+        event = CloudEvent(type="", source="", id="", specversion="")
+        expected = ["required attribute %s is missing" % name for name in ("id", "source", "specversion", "type")]
+        self.assertEqual(expected, Validator().errors(event))
+
+    def test_attributes(self):
+        cases = [
+            (dict(id=1000), "attribute id must be a string"),
+            (dict(specversion="0.3"), "unsupported specversion '0.3'"),
+            (dict(source="oximeter/%zz"), "attribute source must be a URI-reference"),
+            (dict(source="oxímetre/123"), "attribute source must be a URI-reference"),
+            (dict(dataschema="schemas/oximeter"), "attribute dataschema must be an absolute URI"),
+            (dict(datacontenttype="json"), "attribute datacontenttype must be a media type"),
+            (dict(time="2020-09-28T21:33:21"), "attribute time must be an RFC 3339 timestamp"),
+            (dict(External1="x"), "attribute name 'External1' must consist of lowercase letters and digits"),
+            (dict(external_1="x"), "attribute name 'external_1' must consist of lowercase letters and digits"),
+            (dict(externalattribute123456="x"), "attribute name 'externalattribute123456' is longer than 20"),
+            (dict(external1=2 ** 31), "attribute external1 is out of the 32 bit integer range"),
+            (dict(external1=1.5), "attribute external1 has unsupported type"),
+        ]
+        validator = Validator()
+        for attributes, error in cases:
+            event = CloudEvent(**dict(dict(type="OximeterMeasured", source="oximeter/123", id="1000"), **attributes))
+            errors = validator.errors(event)
+            self.assertEqual(1, len(errors), attributes)
+            self.assertTrue(errors[0].startswith(error), errors[0])
+            with self.assertRaises(ValidationError):
+                validator.validate(event)
+
+    def test_options(self):
+        event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", specversion="0.3",
+                           externalattribute123456="x")
+        validate = Validator(max_name_length=None, specversions=("0.3", "1.0")).validate
+        self.assertIs(event, validate(event))
+
+    def test_time(self):
+        validator = Validator()
+        for time in ("2020-09-28T21:33:21Z", "2020-09-28t21:33:21.123456789+03:00", "2020-02-29 00:00:00-23:59"):
+            event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", time=time)
+            self.assertEqual([], validator.errors(event), time)
+        for time in ("2021-02-29T00:00:00Z", "2020-09-28T24:00:00Z", "2020-09-28T21:33:21", "2020-09-28"):
+            event = CloudEvent(type="OximeterMeasured", source="oximeter/123", id="1000", time=time)
+            self.assertEqual(1, len(validator.errors(event)), time)
+
+    def test_valid_values_are_cached(self):
+        validator = Validator()
+        validator.validate(VALID)
+        self.assertIn(VALID.source, validator._values["source"])
+        # invalid values are not cached
+        self.assertEqual(1, len(validator.errors(CloudEvent(type="OximeterMeasured", source="not a uri", id="1"))))
+        self.assertEqual(1, len(validator.errors(CloudEvent(type="OximeterMeasured", source="not a uri", id="1"))))
+        self.assertNotIn("not a uri", validator._values["source"])
+
+    def test_validate_batch(self):
+        with self.assertRaises(ValidationError) as cm:
+            Validator().validate_batch([VALID, VALID, INVALID])
+        self.assertTrue(str(cm.exception).startswith("invalid event at index 2: "))
+        self.assertEqual(2, len(cm.exception.errors))
+        Validator().validate_batch(iter([VALID, VALID]))
+
+    def test_not_an_event(self):
+        with self.assertRaises(ValidationError):
+            validate({"type": "OximeterMeasured"})
+
+
+class DecoderValidationTests(unittest.TestCase):
+
+    def test_json(self):
+        self.assertEqual(VALID, Json.decode(Json.encode(VALID), validate=True))
+        self.assertEqual([VALID], Json.decode(Json.encode([VALID]), lazy=True, validate=Validator()))
+        self.assertEqual([VALID], list(Json.iter_decode(Json.encode([VALID]), validate=True)))
+        for lazy in False, True:
+            with self.assertRaises(ValidationError):
+                Json.decode(Json.encode([VALID, INVALID]), lazy=lazy, validate=True)
+        with self.assertRaises(ValidationError):
+            list(Json.iter_decode(Json.encode([VALID, INVALID]), validate=True))
+        # not validated by default
+        self.assertEqual(INVALID, Json.decode(Json.encode(INVALID)))
+
+    def test_json_lines(self):
+        encoded = JsonLines.encode([VALID, INVALID])
+        self.assertEqual([VALID, INVALID], JsonLines.decode(encoded))
+        for lazy in False, True:
+            self.assertEqual([VALID], JsonLines.decode(encoded, 0, 1, lazy=lazy, validate=True))
+            with self.assertRaises(ValidationError):
+                JsonLines.decode(encoded, lazy=lazy, validate=True)
+
+    def test_avro(self):
+        encoded = Avro.encode_many([VALID, INVALID])
+        self.assertEqual(VALID, Avro.decode(Avro.encode(VALID), validate=True))
+        self.assertEqual(VALID, Avro.decode(Avro.encode(VALID), lazy=True, validate=True))
+        self.assertEqual(VALID, Avro.decode_from(io.BytesIO(encoded), validate=True))
+        with self.assertRaises(ValidationError):
+            Avro.decode(Avro.encode(INVALID), validate=True)
+        with self.assertRaises(ValidationError):
+            list(Avro.decode_iter(encoded, validate=True))
+        self.assertEqual([VALID, INVALID], list(Avro.decode_iter(encoded)))
+
+    def test_fields(self):
+        with self.assertRaises(ValueError):
+            Json.decode(Json.encode(VALID), fields=["id"], validate=True)
+        with self.assertRaises(ValueError):
+            Avro.decode(Avro.encode(VALID), fields=["id"], validate=True)